@@ -0,0 +1,109 @@
+"""Analytics chart payloads: the raw cross-validation frame against the chart data layer, as the set grows.
+
+The cross-validation frame is resampled to each of --rows sales (with jittered map positions), and
+the specs of the t-SNE analytics and the price distribution are built from it. For each, the JSON
+size of the spec and the time to build it are compared with the charts fed the raw frame, as before
+the data layer. Checks first that every bar frame counts every sale and that price_density matches
+scipy's Gaussian KDE with the same bandwidth.
+
+    python benchmarks/chart_payload.py --model-version 20220129T101500-3f2a9c1e --rows 1583 20000 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import altair as alt
+import numpy as np
+import pandas as pd
+from scipy.stats import gaussian_kde
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import bundle  # noqa: E402
+import chart_data  # noqa: E402
+import plots  # noqa: E402
+
+CV_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/cross_validation.csv')
+
+
+def resampled(df_cv, n_rows):
+    df = df_cv.sample(n_rows, replace=n_rows > len(df_cv), random_state=0).reset_index(drop=True)
+    jitter = np.random.default_rng(0).normal(scale=0.5, size=(n_rows, 2))
+    df[chart_data.MAP] = df[chart_data.MAP].to_numpy() + jitter
+    return df
+
+
+def raw_price_distribution(df_cv, avg_price, width=700):
+    """plots.price_distribution as it was: a client-side density over every row of the frame."""
+    price_plot = alt.Chart(df_cv).transform_density(
+        'soldPrice', as_=['soldPrice', 'Density'], steps=300
+    ).mark_area().encode(x='soldPrice:Q', y='Density:Q')
+    line = alt.Chart(pd.DataFrame({'X': [avg_price] * 2, 'Y': [0, 0.02]})).mark_line().encode(x='X', y='Y')
+    return (price_plot + line).properties(width=width, height=250)
+
+
+def raw_advanced_analytics(df_cv, width=600, height=250):
+    """plots.advanced_analytics as it was: every chart fed the whole frame, counted in the browser."""
+    brush = alt.selection(type='interval', resolve='global')
+    quantile = chart_data.QUANTILE
+    charts = [alt.Chart(df_cv).mark_point().encode(x='t-SNE-1', y='t-SNE-2', color=quantile).add_selection(brush)]
+    for column in [quantile] + chart_data.BAR_FEATURES:
+        charts.append(alt.Chart(df_cv).mark_bar().encode(y=column, color=quantile, x=f'count({quantile})')
+                      .transform_filter(brush))
+    return alt.vconcat(*[c.properties(width=width, height=height) for c in charts])
+
+
+def measured(build):
+    start = time.perf_counter()
+    spec = build().to_dict()
+    return len(json.dumps(spec, separators=(',', ':'))), time.perf_counter() - start
+
+
+def check(df_cv):
+    for column, frame in chart_data.map_frames(df_cv, max_points=len(df_cv) // 2).items():
+        assert frame['count'].sum() == len(df_cv), column
+        if column in chart_data.BAR_FEATURES:
+            totals = frame.groupby(column, observed=True)['count'].sum()
+            assert totals.to_dict() == df_cv[column].value_counts().to_dict(), column
+
+    prices = df_cv['soldPrice'].to_numpy()
+    density = chart_data.price_density(prices)
+    kde = gaussian_kde(prices, bw_method=chart_data.bandwidth(prices) / prices.std(ddof=1))
+    assert np.allclose(density['Density'], kde(np.linspace(prices.min(), prices.max(), chart_data.DENSITY_STEPS)),
+                       rtol=1e-9, atol=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models-dir', default=bundle.MODELS_DIR)
+    parser.add_argument('--model-version', help='bundle whose cross-validation frame is used, default: data/*.csv')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1583, 20_000, 200_000])
+    args = parser.parse_args(argv)
+
+    if args.model_version:
+        df_cv = bundle.Bundle(os.path.join(args.models_dir, args.model_version)).frame('cross_validation')
+    else:
+        df_cv = pd.read_csv(CV_PATH)
+    check(df_cv)
+    print('bar frames count every sale; price_density matches a Gaussian KDE\n')
+
+    avg_price = float(df_cv['predictedSoldPrice'].mean())
+    warnings.simplefilter('ignore', FutureWarning)
+    alt.data_transformers.disable_max_rows()
+    print(f'{"sales":>8} {"chart":<20} {"raw frame":>22} {"chart data layer":>22}')
+    for n_rows in args.rows:
+        df = resampled(df_cv, n_rows)
+        for name, raw, layered in (
+                ('price_distribution', lambda: raw_price_distribution(df, avg_price),
+                 lambda: plots.price_distribution(df, avg_price, width=700)),
+                ('advanced_analytics', lambda: raw_advanced_analytics(df), lambda: plots.advanced_analytics(df, width=600))):
+            cells = [f'{size / 2**20:8.2f} MiB {seconds:7.2f}s' for size, seconds in (measured(raw), measured(layered))]
+            print(f'{n_rows:>8} {name:<20} {cells[0]:>22} {cells[1]:>22}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Comparable-sales lookups: building the index, querying it and appending sales to it, at scale.
+
+The tavern sales are resampled to --rows sales with random sale times. Part of them is indexed at
+once, the rest appended in batches, as new sales would be. Checks that the nearest comparables a
+query returns are at the same distances as a brute-force search over every sale.
+
+    python benchmarks/comparables.py --model dfk_heroes/data/model.joblib --rows 300000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import comparables  # noqa: E402
+import dataset  # noqa: E402
+import inference  # noqa: E402
+
+
+def resampled_sales(n_rows):
+    sales = dataset.load_sales().sample(n_rows, replace=True, random_state=0).reset_index(drop=True)
+    seconds = np.random.default_rng(0).integers(0, 90 * 24 * 3600, n_rows)
+    sales['timeStamp'] = pd.Timestamp('2022-01-21') + pd.to_timedelta(seconds, unit='s')
+    return sales.sort_values('timeStamp', kind='stable').reset_index(drop=True)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f'{label:<45} {time.perf_counter() - start:8.2f}s')
+    return result
+
+
+def brute_force_distances(index, row, k):
+    points = index._distance_points(index._rows[:len(index)])
+    return np.sort(np.sqrt(((points - index._distance_points(row[None])[0]) ** 2).sum(axis=1)))[:k]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--rows', type=int, default=300_000)
+    parser.add_argument('--batches', type=int, default=20, help='batches of 1000 sales appended after the build')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('-k', type=int, default=comparables.DEFAULT_K)
+    args = parser.parse_args(argv)
+
+    predictor = inference.RowPredictor(inference.load_pipeline(args.model))
+    sales = resampled_sales(args.rows)
+    n_built = args.rows - 1000 * args.batches
+    index = timed(f'build the index of {n_built} sales',
+                  lambda: comparables.ComparablesIndex.from_sales(predictor, sales.iloc[:n_built]))
+    start = time.perf_counter()
+    for batch in range(args.batches):
+        index.add_sales(predictor, sales.iloc[n_built + 1000 * batch:n_built + 1000 * (batch + 1)])
+    print(f'append {args.batches} batches of 1000 sales {(time.perf_counter() - start) / args.batches * 1e3:13.2f} ms/batch')
+    print(f'{len(index)} sales in {len(index._buckets)} buckets, {len(index) - index._tree_size} '
+          f'appended since the KD-tree was last built\n')
+
+    rows = predictor.encode_frame(sales.sample(args.queries, random_state=1))
+    # the same heroes with a generation no sale has, so that every comparable is a nearest one
+    unmatched = rows.copy()
+    unmatched[:, predictor.feature_names.index('generation')] = 99
+    for label, queries in (('same key', rows), ('nearest only', unmatched)):
+        latencies = []
+        for row in queries:
+            start = time.perf_counter()
+            index.query(row, args.k)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        print(f'query, {label:<14} p50 {p50:6.3f} ms, p99 {p99:6.3f} ms')
+
+    for row in unmatched[:50]:
+        assert [c.match for c in index.query(row, args.k)] == ['nearest'] * args.k
+        found = index._distance_points(index._rows[index._nearest(row, args.k)])
+        distances = np.sqrt(((found - index._distance_points(row[None])[0]) ** 2).sum(axis=1))
+        assert np.allclose(distances, brute_force_distances(index, row, args.k), rtol=0, atol=1e-9)
+    print('\nnearest comparables match a brute-force search')
+
+
+if __name__ == "__main__":
+    main()
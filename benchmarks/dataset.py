@@ -0,0 +1,71 @@
+"""Training-data loading: the sales CSV against the columnar store, and out-of-core binning against the Dataset cache.
+
+The tavern sales are resampled to --rows rows (with random sale times) into a CSV in a temporary
+directory, converted to a store, and then:
+
+- the CSV and the store are loaded and their in-memory size compared,
+- the store is binned out of core through dataset.SalesSequence, first built and then reloaded from
+  the cache.
+
+    python benchmarks/dataset.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import make_pipeline
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import dataset  # noqa: E402
+from inference import DateFeaturesExtractor, ClassRankExtractor, ToCategory  # noqa: E402
+
+
+def write_csv(path, n_rows):
+    df = pd.read_csv(dataset.CSV_PATH, decimal=',', dtype=str).sample(n_rows, replace=True, random_state=0)
+    start = pd.Timestamp('2022-01-21').value // 10**9
+    seconds = np.random.default_rng(0).integers(0, 90 * 24 * 3600, n_rows)
+    df['timeStamp'] = pd.to_datetime(start + seconds, unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    df.to_csv(path, index=False)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f'{label:<45} {time.perf_counter() - start:8.2f}s')
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, store_path = os.path.join(tmp, 'sales.csv'), os.path.join(tmp, 'sales.feather')
+        cache_dir = os.path.join(tmp, 'lgb_cache')
+        write_csv(csv_path, args.rows)
+        print(f'{args.rows} sales, {os.path.getsize(csv_path) / 2**20:.0f} MiB of CSV\n')
+
+        timed('convert the CSV to a store', lambda: dataset.convert(csv_path, store_path))
+        from_csv = timed('pd.read_csv', lambda: pd.read_csv(csv_path, decimal=','))
+        from_store = timed('dataset.load (memory-mapped store)', lambda: dataset.load(store_path))
+        assert np.array_equal(from_csv['soldPrice'].to_numpy(), from_store['soldPrice'].to_numpy())
+        print(f'in memory: {from_csv.memory_usage(deep=True).sum() / 2**20:.1f} MiB from the CSV, '
+              f'{from_store.memory_usage(deep=True).sum() / 2**20:.1f} MiB from the store\n')
+
+        transformers = make_pipeline(DateFeaturesExtractor(), ClassRankExtractor(), ToCategory())
+        transformers.fit(from_store.drop(columns=['soldPrice']))
+        timed('out_of_core_dataset, built', lambda: dataset.out_of_core_dataset(transformers, store_path,
+                                                                               cache_dir=cache_dir))
+        timed('out_of_core_dataset, reloaded', lambda: dataset.out_of_core_dataset(transformers, store_path,
+                                                                                  cache_dir=cache_dir))
+
+
+if __name__ == "__main__":
+    main()
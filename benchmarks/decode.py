@@ -0,0 +1,64 @@
+"""Per-hero CPU cost of decoding getHero results: web3's generic ABI path against hero.decode_hero.
+
+    python benchmarks/decode.py --heroes 5000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+from eth_abi import decode_abi, encode_abi  # noqa: E402
+from web3._utils.abi import map_abi_data  # noqa: E402
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS  # noqa: E402
+
+from hero import hero  # noqa: E402
+from hero.fake_rpc import FakeRPCServer, hero_to_tuple  # noqa: E402
+
+
+def web3_decode(data):
+    """What contract.functions.getHero(...).call() followed by get_hero's copy does with the return data."""
+    output_types = hero._get_hero_output_types()
+    decoded = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decode_abi(output_types, data))
+    return hero._parse_hero(decoded[0])
+
+
+def per_hero(label, fn, n):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {elapsed / n * 1e6:10.1f} us/hero')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--heroes', type=int, default=5000)
+    parser.add_argument('--calls', type=int, default=300, help='heroes fetched in the end-to-end comparison')
+    args = parser.parse_args(argv)
+
+    with FakeRPCServer() as server:
+        payloads = []
+        for hero_id in range(args.heroes):
+            h = server.synthetic_hero(hero_id)
+            h['state']['currentQuest'] = server.wallet(hero_id % 7)
+            payloads.append(encode_abi(hero._get_hero_output_types(), [hero_to_tuple(h)]))
+
+        reference = [web3_decode(data) for data in payloads]
+        assert [hero.decode_hero(data) for data in payloads] == reference
+
+        print(f'decoding {args.heroes} getHero results')
+        per_hero('web3 decode_abi + _parse_hero', lambda: [web3_decode(data) for data in payloads], args.heroes)
+        per_hero('hero.decode_hero', lambda: [hero.decode_hero(data) for data in payloads], args.heroes)
+
+        url = server.url
+        hero_ids = range(args.calls)
+        assert [hero.get_hero(i, url) for i in hero_ids] == [hero.get_hero_fast(i, url) for i in hero_ids]
+        print(f'\nfetching {args.calls} heroes from the local stand-in RPC server')
+        per_hero('hero.get_hero', lambda: [hero.get_hero(i, url) for i in hero_ids], args.calls)
+        per_hero('hero.get_hero_fast', lambda: [hero.get_hero_fast(i, url) for i in hero_ids], args.calls)
+
+
+if __name__ == "__main__":
+    main()
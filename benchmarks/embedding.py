@@ -0,0 +1,66 @@
+"""t-SNE map of SHAP values: fitting on every sale against fitting on a sample and projecting the rest.
+
+SHAP values of --rows tavern sales are computed with the model, then embedded by t-SNE on all of them
+and by embedding.fit_embedding on --max-fit of them. Both maps are scored with sklearn's
+trustworthiness (how well each map keeps the nearest neighbours of SHAP space, 1 is best). Checks
+that projecting a fitted row returns its own coordinates, and times the projection of one hero.
+
+    python benchmarks/embedding.py --model dfk_heroes/data/model.joblib --rows 3000 --max-fit 1000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.manifold import trustworthiness
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import embedding  # noqa: E402
+import explainers  # noqa: E402
+import inference  # noqa: E402
+
+DATA_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/tavern_data.csv')
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f'{label:<50} {time.perf_counter() - start:8.2f}s')
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--rows', type=int, default=3000)
+    parser.add_argument('--max-fit', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    pipe = inference.load_pipeline(args.model)
+    sales = pd.read_csv(DATA_PATH, decimal=',').sample(args.rows, random_state=0).drop(columns=['soldPrice'])
+    shap_values, _ = explainers.explain_batch(pipe[-1].booster_, pipe[:-1].transform(sales))
+    print(f'{args.rows} sales, {shap_values.shape[1]} SHAP values each\n')
+
+    full = timed(f't-SNE on all {args.rows} sales', lambda: embedding.fit_embedding(shap_values, max_fit=args.rows)[0])
+    sampled, projection = timed(f't-SNE on {args.max_fit}, {args.rows - args.max_fit} projected',
+                                lambda: embedding.fit_embedding(shap_values, max_fit=args.max_fit))
+    assert np.allclose(projection.transform(projection.reference), projection.coordinates, rtol=0, atol=1e-9)
+
+    for label, embedded in (('all fitted', full), ('sampled and projected', sampled)):
+        print(f'trustworthiness, {label:<33} {trustworthiness(shap_values, embedded, n_neighbors=10):8.3f}')
+
+    one = shap_values[0]
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        projection.transform(one)
+    print(f'\nprojection of one hero                             '
+          f'{(time.perf_counter() - start) / args.repeat * 1e3:8.3f} ms')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""SHAP throughput on the cross-validation set: the shap and native backends, in process and sharded.
+
+Checks first that both backends agree on the SHAP values (same shape, within 1e-9) and on the
+expected value, and that explain_batch returns the same values as an in-process call.
+
+    python benchmarks/explainers.py --model dfk_heroes/data/model.joblib --rows 500 --workers 1 2 4
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import explainers  # noqa: E402
+import inference  # noqa: E402
+
+CV_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/cross_validation.csv')
+
+
+def load_features(pipe, n_rows):
+    # cross_validation.csv holds the transformed test split next to predictions and t-SNE coordinates
+    booster = pipe[-1].booster_
+    df_cv = pd.read_csv(CV_PATH).head(n_rows)
+    return pipe.named_steps['tocategory'].transform(df_cv[booster.feature_name()])
+
+
+def timed(label, fn, n_rows):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {elapsed:8.2f}s {n_rows / elapsed:10.1f} rows/s')
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--rows', type=int, default=500, help='rows of the cross-validation set explained')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--chunk-size', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    pipe = inference.load_pipeline(args.model)
+    booster = pipe[-1].booster_
+    feature = load_features(pipe, args.rows)
+    n_rows = len(feature)
+    print(f'{n_rows} rows, {booster.num_trees()} trees, {os.cpu_count()} CPUs\n')
+
+    values, expected_values = {}, {}
+    for backend in explainers.BACKENDS:
+        explainer = explainers.get_explainer(booster, backend)
+        values[backend] = timed(f'{backend}, in process', lambda: explainer.shap_values(feature), n_rows)
+        expected_values[backend] = explainer.expected_value
+        assert values[backend].shape == feature.shape, values[backend].shape
+    assert np.allclose(values['native'], values['shap'], rtol=0, atol=1e-9)
+    assert np.isclose(expected_values['native'], expected_values['shap'], rtol=0, atol=1e-9)
+
+    for workers in args.workers:
+        batch, expected_value = timed(
+            f'native, {workers} workers x {args.chunk_size} rows',
+            lambda: explainers.explain_batch(booster, feature, workers=workers, chunk_size=args.chunk_size),
+            n_rows)
+        assert np.allclose(batch, values['native'], rtol=0, atol=1e-9)
+        assert expected_value == expected_values['native']
+    print('\nshap and native backends agree on SHAP values and expected value, in process and sharded')
+
+
+if __name__ == "__main__":
+    main()
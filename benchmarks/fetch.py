@@ -0,0 +1,66 @@
+"""Offline benchmark of the hero fetch path against the local stand-in RPC server.
+
+    python benchmarks/fetch.py --heroes 500 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+from hero import hero  # noqa: E402
+from hero.cache import HeroCache  # noqa: E402
+from hero.fake_rpc import FakeRPCServer  # noqa: E402
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {elapsed:8.3f}s  {n / elapsed:10.1f} heroes/s')
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--heroes', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated RPC round trip, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--batch-size', type=int, default=hero.DEFAULT_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=hero.DEFAULT_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    hero_ids = list(range(1, args.heroes + 1))
+    with FakeRPCServer(latency=args.latency, error_rate=args.error_rate) as server:
+        url = server.url
+        print(f'{args.heroes} heroes, {args.latency * 1000:.0f}ms simulated latency, '
+              f'{args.error_rate:.0%} injected errors\n')
+
+        def sequential():
+            heroes = {}
+            for hero_id in hero_ids:
+                try:
+                    heroes[hero_id] = hero.get_hero(hero_id, url)
+                except Exception:
+                    pass
+            return heroes
+
+        reference = timed('get_hero, sequential', args.heroes, sequential)
+        heroes, errors = timed(f'get_heroes, batch_size={args.batch_size}', args.heroes,
+                               lambda: hero.get_heroes(hero_ids, url, batch_size=args.batch_size))
+        assert all(heroes[k] == reference[k] for k in heroes.keys() & reference.keys())
+        heroes, errors = timed(f'async_get_heroes, concurrency={args.concurrency}', args.heroes,
+                               lambda: asyncio.run(hero.async_get_heroes(hero_ids, url, args.concurrency)))
+        assert all(heroes[k] == reference[k] for k in heroes.keys() & reference.keys())
+
+        cache = HeroCache(url, path=None)
+        timed('HeroCache.get_hero, cold', args.heroes, lambda: [cache.get_hero(hero_id) for hero_id in hero_ids])
+        timed('HeroCache.get_hero, warm', args.heroes, lambda: [cache.get_hero(hero_id) for hero_id in hero_ids])
+        print(f'\n{server.calls} RPC calls served')
+
+
+if __name__ == "__main__":
+    main()
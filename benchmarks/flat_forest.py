@@ -0,0 +1,89 @@
+"""Batch scoring: LightGBM's predict against the flattened-array evaluator in flat_forest.
+
+Both paths are checked to agree on every batch before timing. Rows are tavern sales resampled with
+random sale times so that large batches are not just repeats of the same 8000 rows.
+
+Row by row, FlatForest.predict does not beat the booster. What it wins is a grid: the 7 x 24 sale
+slots of a hero (sale_timing.slot_prices), which predict_grid scores with one walk per tree, against
+booster.predict on the 168 rows.
+
+    python benchmarks/flat_forest.py --model dfk_heroes/data/model.joblib --batches 1 100 100000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import inference  # noqa: E402
+import sale_timing  # noqa: E402
+from flat_forest import FlatForest, frame_to_array  # noqa: E402
+
+DATA_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/tavern_data.csv')
+
+
+def load_rows(pipe, n_rows):
+    X = pd.read_csv(DATA_PATH, decimal=',').drop(columns=['soldPrice']).sample(n_rows, replace=True, random_state=0)
+    start = pd.Timestamp('2022-01-21').value // 10**9
+    seconds = np.random.default_rng(0).integers(0, 7 * 24 * 3600, n_rows)
+    X['timeStamp'] = pd.to_datetime(start + seconds, unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    feature = pipe[:-1].transform(X.reset_index(drop=True))
+    return feature, frame_to_array(feature, pipe[-1].booster_.pandas_categorical)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 100, 100_000])
+    parser.add_argument('--calls', type=int, default=50, help='calls timed for batches under 1000 rows')
+    args = parser.parse_args(argv)
+
+    pipe = inference.load_pipeline(args.model)
+    start = time.perf_counter()
+    forest = FlatForest.from_booster(pipe[-1].booster_)
+    print(f'flattened {forest.n_trees} trees, {len(forest.left)} nodes, depth {forest.max_depth} '
+          f'in {time.perf_counter() - start:.2f}s')
+
+    feature, X = load_rows(pipe, max(args.batches))
+    print(f"\n{'batch':>8} {'pipe[-1].predict':>18} {'booster.predict':>18} {'FlatForest.predict':>20}   (us/row)")
+    for n in args.batches:
+        repeat = args.calls if n < 1000 else 1
+        expected, sklearn_time = timed(lambda: pipe[-1].predict(feature.iloc[:n]), repeat)
+        _, booster_time = timed(lambda: pipe[-1].booster_.predict(X[:n]), repeat)
+        actual, flat_time = timed(lambda: forest.predict(X[:n]), repeat)
+        assert np.allclose(actual, expected, rtol=1e-9, atol=1e-9), np.abs(actual - expected).max()
+        print(f'{n:>8} {sklearn_time / n * 1e6:>18.1f} {booster_time / n * 1e6:>18.1f} {flat_time / n * 1e6:>20.1f}')
+
+    weekday, hour = feature.columns.get_loc('buyWeekDay'), feature.columns.get_loc('buyHour')
+    grids = np.repeat(X[:20], sale_timing.N_WEEKDAYS * sale_timing.N_HOURS, axis=0).reshape(
+        20, sale_timing.N_WEEKDAYS * sale_timing.N_HOURS, -1)
+    grids[:, :, weekday] = np.repeat(np.arange(sale_timing.N_WEEKDAYS), sale_timing.N_HOURS)
+    grids[:, :, hour] = np.tile(np.arange(sale_timing.N_HOURS), sale_timing.N_WEEKDAYS)
+    expected = [pipe[-1].booster_.predict(grid) for grid in grids]
+    print(f"\n{'168-slot grid of a hero':<30} {'ms/grid':>10}")
+    for label, score in (
+            ('booster.predict', lambda grid: pipe[-1].booster_.predict(grid)),
+            ('FlatForest.predict', forest.predict),
+            ('FlatForest.predict_grid', lambda grid: forest.predict_grid(
+                grid[0], weekday, sale_timing.N_WEEKDAYS, hour, sale_timing.N_HOURS).ravel())):
+        start = time.perf_counter()
+        actual = [score(grid) for grid in grids]
+        elapsed = time.perf_counter() - start
+        assert np.allclose(actual, expected, rtol=1e-9, atol=1e-9), label
+        print(f'{label:<30} {elapsed / len(grids) * 1e3:>10.2f}')
+
+
+if __name__ == "__main__":
+    main()
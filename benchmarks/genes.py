@@ -0,0 +1,77 @@
+"""Batch gene decoding: scalar parse_stat_genes/parse_visual_genes against the vectorized decoders.
+
+Every column is checked against the scalar decoders: the dominant genes directly, and the recessive
+'_r1'/'_r2'/'_r3' columns of the first --recessive-heroes genes by swapping that slot into the
+dominant one of the kai string and parsing it again.
+
+    python benchmarks/genes.py --heroes 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+from hero.utils import utils as hero_utils  # noqa: E402
+
+
+def check_parity(batch, scalar):
+    for column in scalar[0]:
+        if column == 'raw':
+            continue
+        expected = [row[column] for row in scalar]
+        actual = [None if pd.isna(v) else v for v in batch[column].tolist()]
+        assert actual == expected, column
+
+
+def swap_slot(gene, slot):
+    """The gene with, in every trait, the kai digit of recessive `slot` and the dominant one swapped."""
+    kai = list(hero_utils.__genesToKai(gene).replace(' ', ''))
+    for dominant in range(3, hero_utils.KAI_DIGITS, 4):
+        kai[dominant], kai[dominant - slot] = kai[dominant - slot], kai[dominant]
+    return int(''.join(f'{hero_utils.ALPHABET.index(k):05b}' for k in kai), 2)
+
+
+def check_recessive_parity(batch, genes, scalar_fn):
+    for slot, suffix in enumerate(hero_utils.GENE_SLOTS[1:], start=1):
+        scalar = [scalar_fn(swap_slot(g, slot)) for g in genes]
+        for column in scalar[0]:
+            if column == 'raw':
+                continue
+            expected = [row[column] for row in scalar]
+            actual = [None if pd.isna(v) else v for v in batch[column + suffix][:len(genes)].tolist()]
+            assert actual == expected, column + suffix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--heroes', type=int, default=100_000)
+    parser.add_argument('--recessive-heroes', type=int, default=2_000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    genes = [rng.getrandbits(hero_utils.KAI_BITS * hero_utils.KAI_DIGITS) for _ in range(args.heroes)]
+
+    print(f'decoding {args.heroes} genes')
+    for name, scalar_fn, batch_fn in (('stat', hero_utils.parse_stat_genes, hero_utils.parse_stat_genes_batch),
+                                      ('visual', hero_utils.parse_visual_genes, hero_utils.parse_visual_genes_batch)):
+        start = time.perf_counter()
+        scalar = [scalar_fn(g) for g in genes]
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = batch_fn(genes)
+        batch_time = time.perf_counter() - start
+
+        check_parity(batch, scalar)
+        check_recessive_parity(batch, genes[:args.recessive_heroes], scalar_fn)
+        print(f'{name:<7} scalar {scalar_time:7.3f}s   batch {batch_time:7.3f}s   x{scalar_time / batch_time:.0f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Cold import time of the modules on the serving and training paths, from `python -X importtime`.
+
+    python benchmarks/import_time.py inference utils model
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PACKAGE_DIR = os.path.join(Path(__file__).parent.parent, 'dfk_heroes')
+MODULES = ['inference', 'utils', 'hero.hero', 'hero.cache', 'custom_shap', 'model']
+
+
+def import_times(module):
+    """(total, {top level import: cumulative}) in microseconds for a fresh interpreter importing module."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=PACKAGE_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    lines = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        lines.append(((len(name) - len(name.lstrip())) // 2, name.strip(), int(cumulative)))
+
+    # importtime prints children before their parent: walk back from the module to its direct imports
+    end = max(i for i, (depth, name, _) in enumerate(lines) if depth == 0 and name == module)
+    children = {}
+    for depth, name, cumulative in reversed(lines[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children[name] = cumulative
+    return lines[end][2], children
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--top', type=int, default=5, help='heaviest top level imports listed per module')
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        total, children = import_times(module)
+        print(f'{module:<16} {total / 1e6:6.3f}s')
+        heaviest = sorted(children.items(), key=lambda item: -item[1])
+        for name, cumulative in heaviest[:args.top]:
+            print(f'    {name:<28} {cumulative / 1e6:6.3f}s')
+
+
+if __name__ == "__main__":
+    main()
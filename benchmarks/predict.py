@@ -0,0 +1,93 @@
+"""Single-hero prediction latency: the sklearn pipeline path against inference.RowPredictor.
+
+Checks that both paths agree on prices, SHAP values and explanation text for a sample of tavern sales
+and for synthetic heroes (which bring categories the model never saw) before timing them.
+
+    python benchmarks/predict.py --model dfk_heroes/data/model.joblib
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import inference  # noqa: E402
+import utils  # noqa: E402
+from hero.fake_rpc import FakeRPCServer  # noqa: E402
+
+DATA_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/tavern_data.csv')
+
+
+def load_records(n_sales, n_synthetic):
+    records = (pd.read_csv(DATA_PATH, decimal=',')
+               .sample(n_sales, random_state=0)
+               .drop(columns=['soldPrice'])
+               .to_dict('records'))
+    server = FakeRPCServer()
+    records += [utils.raw_hero_to_record(hero_id, server.synthetic_hero(hero_id)) for hero_id in range(n_synthetic)]
+    return records
+
+
+def pipeline_path(pipe, record):
+    feature, price = inference.predict(pipe, pd.DataFrame.from_records([record]))
+    shap_values = pipe[-1].predict(feature, pred_contrib=True)[:, :-1]
+    text = utils.shap_to_text(shap_values, feature, 0.0, '')
+    return price[0], shap_values[0], text
+
+
+def row_path(predictor, record):
+    features, row, price = predictor.predict(record)
+    shap_values, expected_value = predictor.contributions(row)
+    text = utils.shap_row_to_text(shap_values[0], predictor.feature_names, list(features.values()), 0.0, '')
+    return price, shap_values[0], text
+
+
+def check_parity(pipe, predictor, records):
+    for record in records:
+        price, shap_values, text = pipeline_path(pipe, record)
+        fast_price, fast_shap_values, fast_text = row_path(predictor, record)
+        assert np.isclose(price, fast_price, rtol=0, atol=1e-9), (record, price, fast_price)
+        assert np.allclose(shap_values, fast_shap_values, rtol=0, atol=1e-9), record
+        assert text == fast_text, record
+
+
+def per_call(label, fn, records, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            fn(record)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<45} {elapsed / (repeat * len(records)) * 1e6:10.1f} us/hero')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--sales', type=int, default=300, help='tavern sales in the parity check')
+    parser.add_argument('--synthetic', type=int, default=300, help='synthetic heroes added to the parity check')
+    parser.add_argument('--heroes', type=int, default=200, help='heroes timed per path')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    pipe = inference.load_pipeline(args.model)
+    predictor = inference.RowPredictor(pipe)
+    records = load_records(args.sales, args.synthetic)
+    check_parity(pipe, predictor, records)
+    print(f'{len(records)} heroes: pipeline and RowPredictor agree on prices, SHAP values and explanations')
+
+    timed = records[:args.heroes]
+    print(f'\npredicting {len(timed)} heroes one at a time')
+    per_call('pipeline predict', lambda r: inference.predict(pipe, pd.DataFrame.from_records([r])), timed, args.repeat)
+    per_call('RowPredictor.predict', predictor.predict, timed, args.repeat)
+    print('\nwith SHAP values and explanation text')
+    per_call('pipeline + shap_to_text', lambda r: pipeline_path(pipe, r), timed, args.repeat)
+    per_call('RowPredictor + shap_row_to_text', lambda r: row_path(predictor, r), timed, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Memory and CPU cost of holding many heroes as get_hero dicts against compact Hero records.
+
+    python benchmarks/records.py --heroes 50000
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+from eth_abi import encode_abi  # noqa: E402
+
+from hero import hero  # noqa: E402
+from hero.fake_rpc import FakeRPCServer, hero_to_tuple  # noqa: E402
+
+
+def allocated(label, build, n):
+    tracemalloc.start()
+    start = time.perf_counter()
+    heroes = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<32} {size / n:8.0f} bytes/hero {elapsed / n * 1e6:8.1f} us/hero')
+    return heroes
+
+
+def deepcopy_readable(raw_hero):
+    """human_readable_hero as it used to be, deep copying the whole hero first."""
+    readable_hero = copy.deepcopy(raw_hero)
+    readable_hero['info']['visualGenes'] = hero.hero_utils.parse_visual_genes(readable_hero['info']['visualGenes'])
+    readable_hero['info']['statGenes'] = hero.hero_utils.parse_stat_genes(readable_hero['info']['statGenes'])
+    return readable_hero
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--heroes', type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    with FakeRPCServer() as server:
+        output_types = hero._get_hero_output_types()
+        payloads = [encode_abi(output_types, [hero_to_tuple(server.synthetic_hero(i))]) for i in range(args.heroes)]
+
+    print(f'holding {args.heroes} decoded heroes')
+    dicts = allocated('decode_hero (nested dicts)', lambda: [hero.decode_hero(d) for d in payloads], args.heroes)
+    records = allocated('decode_hero_record (Hero)', lambda: [hero.decode_hero_record(d) for d in payloads],
+                        args.heroes)
+    assert [r.to_dict() for r in records] == dicts
+
+    n = min(args.heroes, 5_000)
+    print(f'\nhuman readable view of {n} heroes')
+    for label, fn, heroes in (('deepcopy + parse (before)', deepcopy_readable, dicts),
+                              ('human_readable_hero(dict)', hero.human_readable_hero, dicts),
+                              ('human_readable_hero(Hero)', hero.human_readable_hero, records)):
+        start = time.perf_counter()
+        for h in heroes[:n]:
+            fn(h)
+        print(f'{label:<32} {(time.perf_counter() - start) / n * 1e6:8.1f} us/hero')
+
+
+if __name__ == "__main__":
+    main()
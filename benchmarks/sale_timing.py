@@ -0,0 +1,84 @@
+"""Sale-timing optimizer latency: all 168 weekday x hour slots in one call against one prediction each.
+
+Checks first that the slot prices, from the booster and from the flattened forest, match
+RowPredictor.predict on the same hero stamped with each slot's time.
+
+    python benchmarks/sale_timing.py --model dfk_heroes/data/model.joblib
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import inference  # noqa: E402
+import sale_timing  # noqa: E402
+from flat_forest import FlatForest  # noqa: E402
+from prediction_cache import PredictionCache  # noqa: E402
+
+DATA_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/tavern_data.csv')
+# a Monday: slot (d, h) is MONDAY + d days + h hours
+MONDAY = datetime.datetime(2022, 1, 24)
+
+
+def one_by_one(predictor, record):
+    return [predictor.predict({**record, 'timeStamp': MONDAY + datetime.timedelta(days=d, hours=h)})[2]
+            for d in range(sale_timing.N_WEEKDAYS) for h in range(sale_timing.N_HOURS)]
+
+
+def per_call(label, fn, records, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            fn(record)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<45} {elapsed / (repeat * len(records)) * 1e3:8.2f} ms/hero')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--heroes', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    pipe = inference.load_pipeline(args.model)
+    predictor = inference.RowPredictor(pipe)
+    forest = FlatForest.from_booster(pipe[-1].booster_)
+    records = (pd.read_csv(DATA_PATH, decimal=',')
+               .sample(args.heroes, random_state=0)
+               .drop(columns=['soldPrice'])
+               .to_dict('records'))
+    for record in records:
+        prices = one_by_one(predictor, record)
+        for slot_forest in (None, forest):
+            slots = sale_timing.slot_prices(predictor, predictor.features(record), slot_forest)
+            assert np.allclose(slots['price'], prices, rtol=0, atol=1e-9), record
+    print(f'{len(records)} heroes: slot prices match one prediction per slot\n')
+
+    per_call('one prediction', predictor.predict, records, args.repeat)
+    per_call('one prediction with SHAP values', lambda r: predictor.contributions(predictor.predict(r)[1]),
+             records, args.repeat)
+    per_call('168 slots, one prediction each', lambda r: one_by_one(predictor, r), records, args.repeat)
+    per_call('168 slots, one batched booster call', lambda r: sale_timing.slot_prices(predictor, predictor.features(r)),
+             records, args.repeat)
+    per_call('168 slots, FlatForest.predict_grid',
+             lambda r: sale_timing.slot_prices(predictor, predictor.features(r), forest), records, args.repeat)
+    for n in (1, 3):
+        per_call(f'listing_windows, n={n}',
+                 lambda r: sale_timing.listing_windows(predictor, predictor.features(r), n, forest), records, args.repeat)
+    cache = PredictionCache()
+    per_call('listing_windows, n=3, from the cache',
+             lambda r: cache.get('v', predictor.predict(r)[1],
+                                 lambda: sale_timing.listing_windows(predictor, predictor.features(r), 3, forest)),
+             records, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
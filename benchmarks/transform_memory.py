@@ -0,0 +1,80 @@
+"""Peak memory of the pipeline transformers on a large frame: the copy-free ones against copying.
+
+'copying' reproduces what the transformers and their callers did before: a defensive deep copy of the
+input, columns added to it in place and a full astype to categories. 'pipeline' is the fitted
+transformers as they are now, called on the input directly. Each variant runs in a fresh process,
+which reports the growth of its peak RSS (VmHWM, reset before transforming) on top of the input frame.
+Linux only.
+
+    python benchmarks/transform_memory.py --rows 1000000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import make_pipeline
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+from inference import DateFeaturesExtractor, ClassRankExtractor, ToCategory  # noqa: E402
+
+DATA_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/tavern_data.csv')
+
+
+def load_rows(n_rows):
+    # resampled tavern sales as read from CSV (object columns), with random sale times
+    X = pd.read_csv(DATA_PATH, decimal=',').drop(columns=['soldPrice']).sample(n_rows, replace=True, random_state=0)
+    start = pd.Timestamp('2022-01-21').value // 10**9
+    seconds = np.random.default_rng(0).integers(0, 90 * 24 * 3600, n_rows)
+    X['timeStamp'] = pd.to_datetime(start + seconds, unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    return X.reset_index(drop=True)
+
+
+def copying_transform(transformers, X):
+    X = X.copy(deep=True)
+    tmp = pd.to_datetime(X['timeStamp'])
+    X['buyWeekDay'] = tmp.dt.weekday
+    X['buyHour'] = tmp.dt.hour
+    X = X.drop(columns=['timeStamp'])
+    X['classRank'] = X['mainClass'].map(transformers.named_steps['classrankextractor'].mapping)
+    return X.astype(transformers.named_steps['tocategory'].types)
+
+
+def peak_rss_kib():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+
+
+def measure(variant, n_rows):
+    X = load_rows(n_rows)
+    transformers = make_pipeline(DateFeaturesExtractor(), ClassRankExtractor(), ToCategory()).fit(X.head(1000))
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')  # resets VmHWM to the current RSS
+    baseline = peak_rss_kib()
+    start = time.perf_counter()
+    feature = copying_transform(transformers, X) if variant == 'copying' else transformers.transform(X)
+    elapsed = time.perf_counter() - start
+    print(f'{variant:<10} {(peak_rss_kib() - baseline) / 1024:8.1f} MiB peak over the input '
+          f'{X.memory_usage(deep=True).sum() / 2**20:.0f} MiB, {elapsed:.2f}s, {feature.shape[1]} columns')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--variant', choices=['copying', 'pipeline'], help='measure one variant in this process')
+    args = parser.parse_args(argv)
+
+    if args.variant:
+        measure(args.variant, args.rows)
+        return
+    for variant in ('copying', 'pipeline'):
+        subprocess.run([sys.executable, __file__, '--rows', str(args.rows), '--variant', variant], check=True)
+
+
+if __name__ == "__main__":
+    main()
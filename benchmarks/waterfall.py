@@ -0,0 +1,79 @@
+"""Waterfall rendering: a PNG per explanation, rendered concurrently, and served from the cache.
+
+Checks first that renders from --threads threads give the same bytes as sequential ones, and that
+rendering leaves pyplot without figures and the global rcParams untouched.
+
+    python benchmarks/waterfall.py --model dfk_heroes/data/model.joblib --heroes 8 --threads 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(Path(__file__).parent.parent, 'dfk_heroes'))
+
+import custom_shap  # noqa: E402
+import inference  # noqa: E402
+import plots  # noqa: E402
+from prediction_cache import PredictionCache  # noqa: E402
+
+DATA_PATH = os.path.join(Path(__file__).parent.parent, 'dfk_heroes/data/tavern_data.csv')
+
+
+def explanations(predictor, n_heroes):
+    records = pd.read_csv(DATA_PATH, decimal=',').sample(n_heroes, random_state=0).drop(columns=['soldPrice'])
+    for record in records.to_dict('records'):
+        features, row, _ = predictor.predict(record)
+        shap_values, expected_value = predictor.contributions(row)
+        yield expected_value, shap_values[0], features, row[0].copy()
+
+
+def per_call(label, fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(*item)
+    print(f'{label:<40} {(time.perf_counter() - start) / len(items) * 1e3:8.2f} ms')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    parser.add_argument('--heroes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    import matplotlib as mpl
+    import matplotlib.pyplot as pl
+
+    predictor = inference.RowPredictor(inference.load_pipeline(args.model))
+    items = list(explanations(predictor, args.heroes))
+    rc_params = dict(mpl.rcParams)
+
+    start = time.perf_counter()
+    sequential = [custom_shap.render_waterfall(*item[:3]) for item in items]
+    print(f'{"PNG render, sequential":<40} {(time.perf_counter() - start) / len(items) * 1e3:8.2f} ms')
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        concurrent = list(executor.map(lambda item: custom_shap.render_waterfall(*item[:3]), items))
+    print(f'{f"PNG render, {args.threads} threads":<40} {(time.perf_counter() - start) / len(items) * 1e3:8.2f} ms')
+    assert concurrent == sequential
+    assert pl.get_fignums() == [] and dict(mpl.rcParams) == rc_params
+
+    per_call('SVG render', lambda e, s, f, r: custom_shap.render_waterfall(e, s, f, format='svg'), items)
+    cache = PredictionCache()
+    for expected_value, shap_values, features, row in items:
+        cache.get('v', np.concatenate([shap_values, row]),
+                  lambda: custom_shap.render_waterfall(expected_value, shap_values, features))
+    per_call('PNG from the cache', lambda e, s, f, r: cache.get('v', np.concatenate([s, r]), None), items)
+    per_call('Vega-Lite spec (plots.waterfall)', lambda e, s, f, r: plots.waterfall(e, s, f).to_dict(), items)
+    print(f'\nconcurrent renders match sequential ones; pyplot and rcParams untouched; '
+          f'cache hit rate {cache.hit_rate:.0%}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,137 @@
 
-from audioop import avg
 import streamlit as st
+import numpy as np
 import pandas as pd
-import joblib
+import io
 import os
 from pathlib import Path
-import matplotlib.pyplot as pl
 import json
-from model import ClassRankExtractor, DateFeaturesExtractor, ToCategory
+import bundle
+import chart_data
 import utils
 from PIL import Image
-from custom_shap import get_shap_values, custom_waterfall
+from hero.cache import HeroCache
+from custom_shap import render_waterfall
+from prediction_cache import PredictionCache, Explanation
 import base64
 import plots
+import sale_timing
+
+
+DATA_DIR = os.path.join(Path(__file__).parent, 'data')
+# about 60 kB each
+WATERFALL_CACHE_SIZE = 1_000
+# about 10 kB each
+WINDOWS_CACHE_SIZE = 1_000
+
+# Resources shared by every session and rerun of this server process. Streamlit reruns main on every
+# widget interaction: it only reads them, leaving the prediction asked for as its one piece of work.
+
+
+@st.cache(allow_output_mutation=True)
+def load_registry():
+    return bundle.Registry(preload=('predictor', 'forest', 'projection', 'comparables'))
+
+
+@st.cache(allow_output_mutation=True)
+def load_hero_cache():
+    return HeroCache(utils.RPC_ADDRESS)
+
+
+@st.cache(allow_output_mutation=True)
+def load_prediction_cache():
+    return PredictionCache()
+
+
+@st.cache(allow_output_mutation=True)
+def load_waterfall_cache():
+    """Rendered waterfall PNGs, keyed by the SHAP values and the model inputs they explain."""
+    return PredictionCache(maxsize=WATERFALL_CACHE_SIZE)
+
+
+@st.cache(allow_output_mutation=True)
+def load_windows_cache():
+    """Listing windows and slot prices of sale_timing.listing_windows, keyed by the model input row."""
+    return PredictionCache(maxsize=WINDOWS_CACHE_SIZE)
+
+
+@st.cache(allow_output_mutation=True)
+def load_assets():
+    """The favicon, as a PIL image and base64-encoded for inline HTML, and the logo."""
+    with open(os.path.join(DATA_DIR, 'favicon.png'), 'rb') as f:
+        favicon = f.read()
+    with open(os.path.join(DATA_DIR, 'logo.png'), 'rb') as f:
+        logo = f.read()
+    return {'favicon': Image.open(io.BytesIO(favicon)), 'jewel': base64.b64encode(favicon).decode(), 'logo': logo}
+
+
+# bundles are identified by their version: a promoted one misses these caches, the others hit them
+BY_VERSION = {bundle.Bundle: lambda model: model.version}
+
+
+@st.cache(hash_funcs=BY_VERSION)
+def warmup(model):
+    """Runs a synthetic hero through everything a prediction uses and returns the average price.
+
+    The hero is local, so the warmup makes no RPC call.
+    """
+    predictor = model.predictor
+    features, row, _ = predictor.predict(utils.SYNTHETIC_RECORD)
+    shap_values, avg_price = predictor.contributions(row)
+    if model.projection is not None:
+        model.projection.transform(shap_values)
+    if model.comparables is not None:
+        model.comparables.query(row)
+    sale_timing.listing_windows(predictor, features, forest=model.forest)
+    return float(avg_price)
+
+
+@st.cache(hash_funcs=BY_VERSION, allow_output_mutation=True)
+def chart_specs(model, avg_price):
+    """The Vega-Lite specs of the charts that do not depend on the hero looked up, built once per model version."""
+    df_cv, df_price_impact = model.frame('cross_validation'), model.frame('jewel_price_impact')
+    return {
+        'price_distribution': chart_data.cached_spec(
+            model.version, 'price_distribution', lambda: plots.price_distribution(df_cv, avg_price, width=700),
+            avg_price=avg_price, width=700),
+        'price_explanation': chart_data.cached_spec(
+            model.version, 'price_explanation', lambda: plots.price_explanation(df_price_impact, width=700), width=700),
+        'advanced_analytics': chart_data.cached_spec(
+            model.version, 'advanced_analytics', lambda: plots.advanced_analytics(df_cv, width=600),
+            width=600, max_points=chart_data.MAX_POINTS),
+    }
 
 
 def main():
+    assets = load_assets()
     st.set_page_config(
         page_title="DFK Heroes Price Prediction",
-        page_icon=Image.open(os.path.join(Path(__file__).parent, 'data/favicon.png')),
+        page_icon=assets['favicon'],
         layout="centered",
         initial_sidebar_state="expanded",
     )
-    def predict(hero_id):
-        hero = utils.hero_to_feature(hero_id)
-        feature = pipe[:-1].transform(hero.copy(deep=True))
-        return feature, pipe[-1].predict(feature)[0]
+    def encode(hero_id):
+        features = predictor.features(utils.hero_to_record(hero_id, cache=hero_cache))
+        return features, predictor.encode(features)
+
+    def explain(features, row):
+        def compute():
+            shap_values = predictor.contributions(row)[0][0]
+            text = utils.shap_row_to_text(shap_values, predictor.feature_names, list(features.values()), avg_price, jewel)
+            map_position = None if model.projection is None else model.projection.transform(shap_values)[0]
+            return Explanation(predictor.booster.predict(row)[0], shap_values, text, map_position)
+        return prediction_cache.get(model.version, row, compute)
     
-    @st.cache(allow_output_mutation=True)
-    def load_data():
-        pipe = joblib.load(os.path.join(Path(__file__).parent, 'data/model.joblib'))
-        df_cv = pd.read_csv(os.path.join(Path(__file__).parent, 'data/cross_validation.csv'))
-        df_price_impact = pd.read_csv(os.path.join(Path(__file__).parent, 'data/jewel_price_impact.csv'))
-        explainer = joblib.load(os.path.join(Path(__file__).parent, 'data/explainer.joblib'))
-        return pipe, df_cv, df_price_impact, explainer
-    pipe, df_cv, df_price_impact,  explainer = load_data()
-
-    #warmup explainer
-    get_shap_values(explainer, predict(0)[0])
-
-    avg_price = explainer.expected_value
-    jewel = base64.b64encode(open(os.path.join(Path(__file__).parent, 'data/favicon.png'), "rb").read()).decode()
-    st.set_option('deprecation.showPyplotGlobalUse', False)
+    # the model version this run is served with, even if a new one gets promoted meanwhile
+    model = load_registry().current()
+    predictor = model.predictor
+    hero_cache = load_hero_cache()
+    prediction_cache = load_prediction_cache()
+    waterfall_cache = load_waterfall_cache()
+    windows_cache = load_windows_cache()
+    avg_price = warmup(model)
+    specs = chart_specs(model, avg_price)
+    jewel = assets['jewel']
    
         
     st.markdown(
@@ -80,7 +170,7 @@ def main():
         """,
             unsafe_allow_html=True,
         )
-    st.image(os.path.join(Path(__file__).parent, 'data/logo.png'))
+    st.image(assets['logo'])
     st.subheader('Created by Dubuisa & Steinerk')
     st.markdown("""
     Welcome to `DFK-Heroes Price Prediction`, our submission for the Data Visualisation Contest.
@@ -101,18 +191,44 @@ Disclamer: As extreme prices and `gen0` were under represented within the datase
     """)
 
     hero_id = st.number_input('hero_id', min_value=0)
+    interactive_waterfall = st.checkbox('Interactive waterfall', help='drawn by your browser instead of as an image')
     
+    explanation = None
     if st.button('Predict price'):
         c = st.container()
         
-        feature, _ = predict(hero_id)
-        c.json(json.dumps(utils.hero_to_display(feature.copy(deep=True))))
-        shap_values = get_shap_values(explainer, feature)
-        c.markdown(utils.shap_to_text(shap_values, feature, avg_price, jewel), unsafe_allow_html=True)
-        custom_waterfall(explainer,shap_values, feature)
-        c.pyplot(bbox_inches='tight')
-        
-        pl.clf()
+        features, row = encode(hero_id)
+        explanation = explain(features, row)
+        c.json(json.dumps(utils.features_to_display(features)))
+        c.markdown(explanation.text, unsafe_allow_html=True)
+        if interactive_waterfall:
+            c.altair_chart(plots.waterfall(avg_price, explanation.shap_values, features, width=600))
+        else:
+            key = np.concatenate([explanation.shap_values, row[0]])
+            c.image(waterfall_cache.get(model.version, key,
+                                        lambda: render_waterfall(avg_price, explanation.shap_values, features)))
+
+        if model.comparables is not None:
+            c.markdown("""
+            Heroes like yours sold for
+            ---------------------------
+            The most recent sales of heroes with the same rarity, classes, profession, generation and summons, completed by the most similar heroes sold.
+            """)
+            c.table(pd.DataFrame(model.comparables.query(row)).rename(columns={'price': 'soldPrice (JEWEL)'}))
+
+        c.markdown("""
+        When to sell
+        ---------------------------
+        The sale time moves the price too: here is this hero's predicted price for every weekday and hour.
+        In brackets, the grid averages: the average price over that weekday's 24 hours and over that hour's 7 days, against the average of the whole grid.
+        """)
+        best, worst, slots = windows_cache.get(
+            model.version, row, lambda: sale_timing.listing_windows(predictor, features, forest=model.forest))
+        c.markdown(utils.listing_windows_to_text(best, worst), unsafe_allow_html=True)
+        c.altair_chart(plots.sale_timing(slots, width=700))
+        stats = prediction_cache.stats()
+        c.caption(f"prediction cache: {stats['size']} heroes, {stats['hit_rate']:.0%} hit rate "
+                  f"({stats['hits']} hits, {stats['misses']} misses)")
     
     st.markdown(f"""
         How does it work?
@@ -121,7 +237,7 @@ Disclamer: As extreme prices and `gen0` were under represented within the datase
         Right now, on average, a hero price is worth {avg_price:.2f} JEWEL. Nonetheless we know that some heroes are cheaper and somes heroes are WAY more expensive than that. Here is a plot showing price distribution (red line is the average):
         
                 """)
-    st.altair_chart(plots.price_distribution(df_cv, avg_price,  width=700))
+    st.vega_lite_chart(spec=specs['price_distribution'])
     
     st.markdown("""
     Price Explanation
@@ -133,7 +249,7 @@ Disclamer: As extreme prices and `gen0` were under represented within the datase
     Heroes price in Defi Kingdoms is mainly driven by the following features:
 
     """)
-    st.altair_chart(plots.price_explanation(df_price_impact, width=700))
+    st.vega_lite_chart(spec=specs['price_explanation'])
     st.markdown("""
                 As you can see, the `rarity`, the `profession` and the `class rank` (basic, advanced, elite or exalted) of the hero are the top 3 price drivers.
                 
@@ -151,9 +267,14 @@ Disclamer: As extreme prices and `gen0` were under represented within the datase
     
     For example: we can see that the mining profession behaves very differently from the other professions and forms clusters of high prices.
 
+    The hero you predicted above, if any, is the yellow diamond: it lands next to the sales that were priced for the same reasons.
+
     Furthermore, it is binned into 5 equal groups, for better interpretability. Each seperate color stands for a specific group, where green signals the top 20% most expensive of (predicted) hero price in DeFi Kingdoms and red signals the bottom 20% of heroes with respect to price.
     """)
-    st.altair_chart(plots.advanced_analytics(df_cv, width=600))
+    if explanation is None or explanation.map_position is None:
+        st.vega_lite_chart(spec=specs['advanced_analytics'])
+    else:
+        st.vega_lite_chart(spec=plots.mark_hero(specs['advanced_analytics'], explanation.map_position))
     
     st.markdown(utils.get_dataset_description())
     st.markdown(utils.get_futures_evolutions())
@@ -0,0 +1,232 @@
+"""Score heroes in bulk: hero ids or feature rows in, predicted prices (and optionally SHAP values) out.
+
+The input is read, fetched and scored in fixed-size chunks and every scored chunk is appended to the
+output before the next ones are read, so memory stays flat however long the list is. Transforming and
+predicting run in a pool of worker processes while the main process reads and fetches ahead.
+
+    python dfk_heroes/batch.py ids.csv -o prices.csv
+    python dfk_heroes/batch.py sales.parquet -o prices.csv --shap --workers 4
+    cat ids.csv | python dfk_heroes/batch.py - -o prices.csv
+
+An input holding the columns of utils.hero_to_feature is scored as is; otherwise the heroes in its
+`id` column are fetched from the RPC node first. After a crash, running the same command with
+--resume picks up after the last chunk written, using the checkpoint kept next to the output.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import inference
+import utils
+from hero import hero
+
+FEATURE_COLUMNS = ['id', 'rarity', 'generation', 'mainClass', 'subClass', 'statBoost1', 'statBoost2',
+                   'profession', 'summons', 'maxSummons', 'timeStamp']
+DEFAULT_CHUNK_SIZE = 1_000
+
+_pipe = None
+
+
+def read_chunks(path, chunk_size):
+    """DataFrames of at most chunk_size input rows from a CSV or Parquet file, or CSV on stdin for '-'."""
+    if path == '-':
+        yield from pd.read_csv(sys.stdin, chunksize=chunk_size)
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def skip_rows(chunks, n_rows):
+    """Drop the first n_rows rows of a stream of chunks."""
+    for chunk in chunks:
+        if n_rows >= len(chunk):
+            n_rows -= len(chunk)
+            continue
+        yield chunk.iloc[n_rows:]
+        n_rows = 0
+
+
+def fetch(chunk, rpc_address, batch_size):
+    """Raw heroes for the ids of an input chunk, in input order, and the reason the others failed."""
+    hero_ids = [int(i) for i in chunk['id']]
+    heroes, errors = hero.get_heroes(dict.fromkeys(hero_ids), rpc_address, batch_size=batch_size)
+    return hero_ids, heroes, errors
+
+
+def _init_worker(model_path):
+    global _pipe
+    _pipe = inference.load_pipeline(model_path)
+
+
+def score_features(feature_rows, with_shap):
+    """Price, and SHAP values when with_shap is set, of rows with the utils.hero_to_feature columns."""
+    names = _pipe[-1].booster_.feature_name()
+    if len(feature_rows):
+        feature, price = inference.predict(_pipe, feature_rows[FEATURE_COLUMNS].reset_index(drop=True))
+        contrib = _pipe[-1].predict(feature, pred_contrib=True) if with_shap else None
+    else:
+        price, contrib = [], np.empty((0, len(names) + 1))
+    out = pd.DataFrame({'id': feature_rows['id'].to_numpy(), 'price': price, 'error': None})
+    if with_shap:
+        for i, name in enumerate(names):
+            out[f'shap_{name}'] = contrib[:, i]
+        out['shap_expected_value'] = contrib[:, -1]
+    return out
+
+
+def score_heroes(hero_ids, heroes, errors, with_shap):
+    """score_features for fetched heroes, with one row per input id; ids that failed only carry an error."""
+    errors = dict(errors)
+    records = []
+    for hero_id, raw_hero in heroes.items():
+        try:
+            records.append(utils.raw_hero_to_record(hero_id, raw_hero))
+        except Exception as e:
+            errors[hero_id] = f'{type(e).__name__}: {e}'
+    scored = score_features(pd.DataFrame.from_records(records, columns=FEATURE_COLUMNS), with_shap)
+    out = scored.set_index('id').reindex(hero_ids)
+    out['error'] = [errors.get(hero_id) for hero_id in hero_ids]
+    return out.rename_axis('id').reset_index()
+
+
+class _InlineExecutor:
+    """Runs jobs in the calling process, for --workers 0."""
+
+    def __init__(self, model_path):
+        _init_worker(model_path)
+
+    def submit(self, fn, *args):
+        return _Done(fn(*args))
+
+    def shutdown(self):
+        pass
+
+
+class _Done:
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class ResultWriter:
+    """Appends scored chunks to a CSV output and records how far it got in a checkpoint file.
+
+    The checkpoint holds the number of input rows written and the output size at that point; on resume
+    the output is truncated back to that size, dropping any chunk written after the last checkpoint.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.checkpoint_path = None if path == '-' else f'{path}.checkpoint'
+        self.rows_done = 0
+        self.header = True
+
+        if self.checkpoint_path is None:
+            self.file = sys.stdout
+            return
+        if resume and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.rows_done = checkpoint['rows_done']
+            self.header = checkpoint['output_bytes'] == 0
+            self.file = open(path, 'r+')
+            self.file.truncate(checkpoint['output_bytes'])
+            self.file.seek(checkpoint['output_bytes'])
+        else:
+            self.file = open(path, 'w')
+            self._save_checkpoint()
+
+    def write(self, scored, n_input_rows):
+        scored.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+        self.rows_done += n_input_rows
+        self.file.flush()
+        if self.checkpoint_path is not None:
+            os.fsync(self.file.fileno())
+            self._save_checkpoint()
+
+    def close(self):
+        if self.checkpoint_path is not None:
+            self.file.close()
+            os.remove(self.checkpoint_path)
+
+    def _save_checkpoint(self):
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'rows_done': self.rows_done, 'output_bytes': self.file.tell()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+def run(input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, with_shap=False, resume=False,
+        rpc_address=utils.RPC_ADDRESS, batch_size=hero.DEFAULT_BATCH_SIZE, model_path=inference.MODEL_PATH):
+    """Score input_path into output_path, see the module docstring. Returns the number of rows written."""
+    workers = os.cpu_count() if workers is None else workers
+    writer = ResultWriter(output_path, resume)
+    if workers:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path,))
+    else:
+        executor = _InlineExecutor(model_path)
+    # at most this many chunks are read ahead of the one being written
+    max_pending = 2 * max(workers, 1)
+    pending = deque()
+    start, first_row = time.perf_counter(), writer.rows_done
+
+    def write_oldest():
+        future, n_rows = pending.popleft()
+        writer.write(future.result(), n_rows)
+        elapsed = time.perf_counter() - start
+        print(f'{writer.rows_done} rows written ({(writer.rows_done - first_row) / elapsed:.0f} rows/s)',
+              file=sys.stderr)
+
+    try:
+        for chunk in skip_rows(read_chunks(input_path, chunk_size), writer.rows_done):
+            if set(FEATURE_COLUMNS).issubset(chunk.columns):
+                future = executor.submit(score_features, chunk[FEATURE_COLUMNS], with_shap)
+            elif 'id' not in chunk.columns:
+                raise ValueError(f'{input_path} needs an id column, or all of {", ".join(FEATURE_COLUMNS)}')
+            else:
+                future = executor.submit(score_heroes, *fetch(chunk, rpc_address, batch_size), with_shap)
+            pending.append((future, len(chunk)))
+            while len(pending) >= max_pending:
+                write_oldest()
+        while pending:
+            write_oldest()
+    finally:
+        executor.shutdown()
+    writer.close()
+    return writer.rows_done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="CSV or Parquet file, or '-' for CSV on stdin")
+    parser.add_argument('-o', '--output', default='-', help="CSV file to write, or '-' for stdout (not resumable)")
+    parser.add_argument('--shap', action='store_true', help='add one shap_<feature> column per model input')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='scoring processes, 0 to score in this process (default: one per CPU)')
+    parser.add_argument('--resume', action='store_true', help='continue from the checkpoint next to the output')
+    parser.add_argument('--rpc', default=utils.RPC_ADDRESS)
+    parser.add_argument('--batch-size', type=int, default=hero.DEFAULT_BATCH_SIZE,
+                        help='getHero calls per JSON-RPC batch request')
+    parser.add_argument('--model', default=inference.MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    run(args.input, args.output, chunk_size=args.chunk_size, workers=args.workers, with_shap=args.shap,
+        resume=args.resume, rpc_address=args.rpc, batch_size=args.batch_size, model_path=args.model)
+
+
+if __name__ == "__main__":
+    main()
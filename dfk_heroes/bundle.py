@@ -0,0 +1,315 @@
+"""Versioned model bundles: everything serving needs from one trained model, in one directory per version.
+
+    data/models/
+        CURRENT                     the version served
+        20220129T101500-3f2a9c1e/
+            manifest.json           version, creation time, LightGBM version, feature names and the
+                                    sha256 of every other file
+            booster.txt             the booster, up to its best iteration, in LightGBM's text format
+            categories.json         the fitted ToCategory types and ClassRankExtractor mapping
+            forest/                 the flattened forest (see flat_forest.py), one .npy file per array
+            embedding/              the projection onto the t-SNE map (see embedding.py), if any
+            comparables/            the comparable-sales index (see comparables.py), if any
+            cross_validation.feather, jewel_price_impact.feather
+                                    the precomputed frames the app plots
+
+A Bundle loads each part on first use only, checking it against the manifest as it does, and
+memory-maps the forest arrays and the frames. The SHAP explainer is not stored but built from the
+booster on demand (see explainers.py).
+
+Versions are written to a temporary directory and renamed into place, and promoting one rewrites
+CURRENT atomically. Registry.current() picks the change up (checking at most every refresh_seconds)
+and swaps in the new bundle; requests still holding the old one finish on it.
+
+    python dfk_heroes/bundle.py publish     # bundle data/model.joblib and the app's data, and promote it
+    python dfk_heroes/bundle.py list
+    python dfk_heroes/bundle.py promote 20220129T101500-3f2a9c1e
+    python dfk_heroes/bundle.py verify
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import warnings
+from functools import cached_property
+from pathlib import Path
+
+import lightgbm as lgb
+import pandas as pd
+
+import comparables
+import dataset
+import embedding
+import explainers
+import inference
+from flat_forest import FlatForest
+
+DATA_DIR = os.path.join(Path(__file__).parent, 'data')
+MODELS_DIR = os.path.join(DATA_DIR, 'models')
+CURRENT = 'CURRENT'
+MANIFEST = 'manifest.json'
+FRAMES = ('cross_validation', 'jewel_price_impact')
+
+
+def read_frames(data_dir=DATA_DIR):
+    """The frames model.py precomputes for the app, as it wrote them to data/."""
+    return {name: pd.read_csv(os.path.join(data_dir, f'{name}.csv')) for name in FRAMES}
+
+
+def read_projection(path=embedding.EMBEDDING_PATH):
+    """The t-SNE map projection model.py saved with the frames, or None if there is none."""
+    return embedding.Projection.load(path) if os.path.isdir(path) else None
+
+
+def read_comparables(path=comparables.COMPARABLES_PATH):
+    """The comparable-sales index model.py saved, or None if there is none."""
+    return comparables.ComparablesIndex.load(path) if os.path.isdir(path) else None
+
+
+def publish(pipe, frames, models_dir=MODELS_DIR, promote_version=True, projection=None, comparables_index=None):
+    """Writes a fitted pipeline, its precomputed frames, map projection and comparable-sales index as a new
+    version and returns its name.
+
+    The version is promoted to CURRENT unless promote_version is False.
+    """
+    import pyarrow.feather as feather
+
+    booster = pipe[-1].booster_
+    model_text = booster.model_to_string()
+    created = datetime.datetime.now(datetime.timezone.utc)
+    version = f'{created:%Y%m%dT%H%M%S}-{hashlib.sha256(model_text.encode()).hexdigest()[:8]}'
+
+    tmp_dir = os.path.join(models_dir, f'.{version}.tmp')
+    os.makedirs(tmp_dir)
+    try:
+        with open(os.path.join(tmp_dir, 'booster.txt'), 'w') as f:
+            f.write(model_text)
+        with open(os.path.join(tmp_dir, 'categories.json'), 'w') as f:
+            json.dump({'category_types': pipe.named_steps['tocategory'].types,
+                       'class_rank': pipe.named_steps['classrankextractor'].mapping}, f, indent=2)
+        FlatForest.from_booster(booster).save(os.path.join(tmp_dir, 'forest'))
+        if projection is not None:
+            projection.save(os.path.join(tmp_dir, 'embedding'))
+        if comparables_index is not None:
+            comparables_index.save(os.path.join(tmp_dir, 'comparables'))
+        for name, frame in frames.items():
+            feather.write_feather(frame, os.path.join(tmp_dir, f'{name}.feather'), compression='uncompressed')
+
+        manifest = {
+            'version': version,
+            'created': created.isoformat(),
+            'lightgbm': lgb.__version__,
+            'feature_names': booster.feature_name(),
+            'num_trees': booster.num_trees(),
+            'frames': list(frames),
+            'files': {name: _sha256(os.path.join(tmp_dir, name)) for name in _files(tmp_dir)},
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp_dir, os.path.join(models_dir, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if promote_version:
+        promote(version, models_dir)
+    return version
+
+
+def promote(version, models_dir=MODELS_DIR):
+    """Makes version the one served, atomically."""
+    if not os.path.isfile(os.path.join(models_dir, version, MANIFEST)):
+        raise ValueError(f'no model version {version} in {models_dir}')
+    tmp_path = os.path.join(models_dir, f'{CURRENT}.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(models_dir, CURRENT))
+
+
+def current_version(models_dir=MODELS_DIR):
+    with open(os.path.join(models_dir, CURRENT)) as f:
+        return f.read().strip()
+
+
+def versions(models_dir=MODELS_DIR):
+    """Published versions, oldest first."""
+    if not os.path.isdir(models_dir):
+        return []
+    return sorted(v for v in os.listdir(models_dir) if os.path.isfile(os.path.join(models_dir, v, MANIFEST)))
+
+
+def _files(directory):
+    return sorted(str(p.relative_to(directory)) for p in Path(directory).rglob('*') if p.is_file())
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Bundle:
+    """One version of the model, loaded part by part on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest['version']
+        self._verified = set()
+        self._frames = {}
+
+    def file(self, name):
+        """Path to one of the bundle's files (or directories), checked against the manifest the first time."""
+        if name not in self._verified:
+            names = [f for f in self.manifest['files'] if f == name or f.startswith(f'{name}/')]
+            if not names:
+                raise ValueError(f'{name} is not part of model version {self.version}')
+            for f in names:
+                if _sha256(os.path.join(self.path, f)) != self.manifest['files'][f]:
+                    raise ValueError(f'{f} of model version {self.version} does not match its checksum')
+            self._verified.add(name)
+        return os.path.join(self.path, name)
+
+    def verify(self):
+        """Checks every file of the bundle."""
+        for name in self.manifest['files']:
+            self.file(name)
+
+    @cached_property
+    def booster(self):
+        return lgb.Booster(model_file=self.file('booster.txt'))
+
+    @cached_property
+    def categories(self):
+        with open(self.file('categories.json')) as f:
+            return json.load(f)
+
+    @cached_property
+    def predictor(self):
+        return inference.RowPredictor.from_booster(self.booster, **self.categories)
+
+    @cached_property
+    def forest(self):
+        return FlatForest.load(self.file('forest'))
+
+    @cached_property
+    def projection(self):
+        """The embedding.Projection onto the t-SNE map of the cross-validation frame, or None."""
+        if not self._has('embedding'):
+            return None
+        return embedding.Projection.load(self.file('embedding'))
+
+    @cached_property
+    def comparables(self):
+        """The comparables.ComparablesIndex of the sales, or None."""
+        if not self._has('comparables'):
+            return None
+        return comparables.ComparablesIndex.load(self.file('comparables'))
+
+    def _has(self, directory):
+        return any(f.startswith(f'{directory}/') for f in self.manifest['files'])
+
+    @cached_property
+    def explainer(self):
+        return explainers.get_explainer(self.booster)
+
+    def frame(self, name):
+        """One of the precomputed frames, read from its memory-mapped file."""
+        if name not in self._frames:
+            self._frames[name] = dataset.load(self.file(f'{name}.feather'))
+        return self._frames[name]
+
+
+class Registry:
+    """Serves the promoted bundle and swaps in a newly promoted one without a restart.
+
+    preload names the Bundle attributes loaded before a new bundle is swapped in, so that requests do
+    not pay for them. They are loaded outside the lock: requests keep being served the current bundle
+    meanwhile, and the lock only guards the swap.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, refresh_seconds=5.0, preload=('predictor',)):
+        self.models_dir = models_dir
+        self.refresh_seconds = refresh_seconds
+        self.preload = preload
+        self._bundle = None
+        self._checked = None
+        # refreshes started, and the last one whose bundle was swapped in
+        self._started = 0
+        self._swapped = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The bundle to serve a request with: take it once per request and use it until the end."""
+        if self._checked is None or time.monotonic() - self._checked >= self.refresh_seconds:
+            self.refresh()
+        return self._bundle
+
+    def refresh(self):
+        """Loads the promoted version if it is not the one served yet and swaps it in."""
+        with self._lock:
+            # other requests skip refreshing while this one loads
+            self._checked = time.monotonic()
+            self._started += 1
+            started, served = self._started, self._bundle
+        try:
+            version = current_version(self.models_dir)
+            if served is not None and served.version == version:
+                return served
+            bundle = Bundle(os.path.join(self.models_dir, version))
+            for name in self.preload:
+                getattr(bundle, name)
+        except (OSError, ValueError) as e:
+            if served is None:
+                raise
+            warnings.warn(f'keeping model version {served.version}: {e}')
+            return served
+
+        with self._lock:
+            # a refresh started after this one read a more recent promotion, or loaded the same version
+            if started < self._swapped or (self._bundle is not None and self._bundle.version == bundle.version):
+                return self._bundle
+            self._swapped = started
+            # a single reference assignment: requests already holding the old bundle keep it
+            self._bundle = bundle
+            return bundle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the versioned model bundles.')
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help="bundle a saved pipeline and the app's precomputed data")
+    publish_parser.add_argument('--model', default=inference.MODEL_PATH)
+    publish_parser.add_argument('--no-promote', action='store_true')
+    commands.add_parser('list', help='published versions, * marks the one served')
+    promote_parser = commands.add_parser('promote', help='serve another version')
+    promote_parser.add_argument('version')
+    verify_parser = commands.add_parser('verify', help='check the checksums of a version')
+    verify_parser.add_argument('version', nargs='?', help='default: the one served')
+    args = parser.parse_args(argv)
+
+    if args.command == 'publish':
+        print(publish(inference.load_pipeline(args.model), read_frames(), args.models_dir, not args.no_promote,
+                      read_projection(), read_comparables()))
+    elif args.command == 'list':
+        served = current_version(args.models_dir) if os.path.exists(os.path.join(args.models_dir, CURRENT)) else None
+        for version in versions(args.models_dir):
+            print(f'{"*" if version == served else " "} {version}')
+    elif args.command == 'promote':
+        promote(args.version, args.models_dir)
+    else:
+        version = args.version or current_version(args.models_dir)
+        Bundle(os.path.join(args.models_dir, version)).verify()
+        print(f'{version}: all files match their checksums')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""What the analytics charts ship to the browser: only the columns each one plots, aggregated server-side.
+
+Altair inlines a chart's data in its spec, so plotting the cross-validation frame as is sends every
+column of every sale, and leaves the browser to estimate densities and count brushed rows. Here:
+
+- price_density evaluates the kernel density estimate of the prices, a few hundred points whatever
+  the number of sales;
+- map_frames gives the t-SNE map and the bar charts brushed from it the columns they plot. Up to
+  max_points sales the map shows every sale; beyond, positions are snapped to a grid of bins x bins
+  cells, the map becomes a density plot and each bar chart gets the counts per cell and value;
+- frames are pruned to their columns, with categorical strings and floats rounded to ROUND_DECIMALS
+  (rather than float32, whose values JSON would spell out in full);
+- cached_spec keeps the finished spec of a chart on disk, per model version and parameters.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CHART_CACHE_DIR = os.path.join(Path(__file__).parent, 'data/chart_cache')
+MAP = ['t-SNE-1', 't-SNE-2']
+QUANTILE = 'Predicted soldPrice (Quantile)'
+BAR_FEATURES = ['profession', 'rarity', 'mainClass', 'generation', 'summons', 'buyHour']
+MAX_POINTS = 5000
+GRID_BINS = 40
+DENSITY_STEPS = 300
+ROUND_DECIMALS = 3
+# rows of the density evaluation chunk: bounds its working memory to steps x chunk floats
+_DENSITY_CHUNK = 1 << 14
+
+
+def prune(df, columns):
+    """df reduced to columns, strings as categories and floats rounded, as a new frame."""
+    pruned = {}
+    for column in columns:
+        values = df[column]
+        if values.dtype == object:
+            values = values.astype('category')
+        elif pd.api.types.is_float_dtype(values):
+            values = values.round(ROUND_DECIMALS)
+        elif pd.api.types.is_integer_dtype(values):
+            values = pd.to_numeric(values, downcast='integer')
+        pruned[column] = values
+    return pd.DataFrame(pruned)
+
+
+def bandwidth(values):
+    """Vega's default KDE bandwidth (Scott's rule, as in vega-statistics' estimateBandwidth)."""
+    q1, q3 = np.percentile(values, [25, 75])
+    spread = min(values.std(ddof=1), (q3 - q1) / 1.34) or abs(q1) or 1
+    return 1.06 * spread * len(values) ** -0.2
+
+
+def price_density(prices, steps=DENSITY_STEPS, column='soldPrice'):
+    """Gaussian KDE of prices at steps evenly spaced prices over their extent, as Vega-Lite's density transform.
+
+    Columns: column and Density.
+    """
+    values = np.asarray(prices, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    h = bandwidth(values)
+    grid = np.linspace(values.min(), values.max(), steps)
+    density = np.zeros(steps)
+    for start in range(0, len(values), _DENSITY_CHUNK):
+        z = (grid[:, None] - values[None, start:start + _DENSITY_CHUNK]) / h
+        density += np.exp(-0.5 * z * z).sum(axis=1)
+    density /= len(values) * h * np.sqrt(2 * np.pi)
+    return pd.DataFrame({column: grid.round(ROUND_DECIMALS), 'Density': density})
+
+
+def map_frames(df_cv, max_points=MAX_POINTS, bins=GRID_BINS):
+    """Frames of the t-SNE map and of the bar charts brushed from it, keyed 'map', QUANTILE and BAR_FEATURES.
+
+    Every frame has the map columns, so that a brush on the map filters them all, and a count column.
+    Up to max_points sales, all of them are the same frame, one row per sale, which the spec inlines
+    once. Beyond, the map frame has a row per grid cell, with the most frequent predicted price
+    quantile of the cell, and bar frames count the sales per cell and value.
+    """
+    if len(df_cv) <= max_points:
+        frame = prune(df_cv, MAP + [QUANTILE] + BAR_FEATURES).assign(count=np.int8(1))
+        return dict.fromkeys(['map', QUANTILE] + BAR_FEATURES, frame)
+
+    positions = df_cv[MAP].apply(lambda c: _bin_centers(c.to_numpy(), bins))
+    frame = pd.concat([positions, df_cv[[QUANTILE] + BAR_FEATURES]], axis=1)
+    counts = frame.groupby(MAP + [QUANTILE], observed=True).size().rename('count').reset_index()
+    cells = counts.groupby(MAP)['count']
+    points = counts.loc[cells.idxmax(), MAP + [QUANTILE]].merge(cells.sum().reset_index(), on=MAP)
+
+    frames = {'map': prune(points, MAP + [QUANTILE, 'count'])}
+    for column in [QUANTILE] + BAR_FEATURES:
+        keys = MAP + ([QUANTILE] if column == QUANTILE else [column, QUANTILE])
+        counts = frame.groupby(keys, observed=True).size().rename('count').reset_index()
+        frames[column] = prune(counts, keys + ['count'])
+    return frames
+
+
+def _bin_centers(values, bins):
+    edges = np.linspace(values.min(), values.max(), bins + 1)
+    index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, bins - 1)
+    return ((edges[:-1] + edges[1:]) / 2)[index]
+
+
+def cached_spec(version, name, build, cache_dir=CHART_CACHE_DIR, **params):
+    """The Vega-Lite spec of chart name for model version, built by build() and kept on disk.
+
+    params are whatever else the spec depends on (widths, thresholds, ...), so that a change of any of
+    them builds a new spec.
+    """
+    key = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, version, f'{name}-{key}.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    spec = build().to_dict()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(spec, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return spec
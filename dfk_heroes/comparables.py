@@ -0,0 +1,172 @@
+"""Comparable sales: what heroes like yours sold for, looked up from the sales the model was trained on.
+
+Sales are bucketed in a dict on an exact key: rarity, main and sub class, profession, generation and
+a band of summons. Buckets keep their sales in the order they were added, oldest first, so the k
+most recent comparables of a hero are the tail of its bucket: a hash lookup and a slice, whatever
+the number of sales. When fewer than k sales share the key, the others are the nearest sales in the
+encoded feature space (standardized, without the id and the sale time), found with a KD-tree.
+
+Every key and distance is computed on rows encoded like RowPredictor.encode, so an index only
+serves the model version it was built with. New sales are appended with add: the KD-tree is rebuilt
+once more than MAX_PENDING sales were added since its last build, the newer ones being searched by
+brute force meanwhile.
+
+    data/comparables/
+        rows.npy            the encoded sales, in the order they were added
+        prices.npy          their prices
+        timestamps.npy      their sale times
+        feature_names.npy   the model inputs of the rows
+"""
+import os
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+COMPARABLES_PATH = os.path.join(Path(__file__).parent, 'data/comparables')
+KEY_FEATURES = ('rarity', 'mainClass', 'subClass', 'profession', 'generation')
+# summons bands: 0, 1-2, 3-5, 6-9 and 10 or more
+SUMMONS_BANDS = (1, 3, 6, 10)
+# left out of the distance: not what makes two heroes alike
+UNMATCHED_FEATURES = ('id', 'buyWeekDay', 'buyHour')
+# sales searched by brute force at most, beyond which the KD-tree is rebuilt
+MAX_PENDING = 4096
+DEFAULT_K = 5
+
+# match: 'same key' or 'nearest'
+Comparable = namedtuple('Comparable', ['id', 'price', 'timeStamp', 'match'])
+
+
+class ComparablesIndex:
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self._key_columns = [self.feature_names.index(name) for name in KEY_FEATURES]
+        self._summons = self.feature_names.index('summons')
+        self._id = self.feature_names.index('id')
+        self._matched = [i for i, name in enumerate(self.feature_names) if name not in UNMATCHED_FEATURES]
+        self._rows = np.empty((0, len(self.feature_names)))
+        self._prices = np.empty(0)
+        self._timestamps = np.empty(0, dtype='datetime64[ns]')
+        # the standardized features distances are computed on
+        self._points = np.empty((0, len(self._matched)))
+        self._size = 0
+        self._buckets = {}
+        self._scale = None
+        self._tree = None
+        self._tree_size = 0
+
+    @classmethod
+    def from_sales(cls, predictor, sales):
+        """An index of a frame of sales (with soldPrice and timeStamp), encoded by a RowPredictor."""
+        index = cls(predictor.feature_names)
+        index.add_sales(predictor, sales)
+        return index
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def latest(self):
+        """Time of the most recent sale indexed, None when empty."""
+        return self._timestamps[:self._size].max() if self._size else None
+
+    def add_sales(self, predictor, sales):
+        """Appends a frame of sales, which are sorted by sale time first."""
+        sales = sales.sort_values('timeStamp', kind='stable')
+        self.add(predictor.encode_frame(sales), sales['soldPrice'].to_numpy(),
+                 pd.to_datetime(sales['timeStamp']).to_numpy())
+
+    def add(self, rows, prices, timestamps):
+        """Appends encoded sales (rows like RowPredictor.encode), which should be more recent than those indexed."""
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        n_new = len(rows)
+        if not n_new:
+            return
+        start, end = self._size, self._size + n_new
+        if end > len(self._rows):
+            capacity = max(end, 2 * len(self._rows))
+            self._rows = _grow(self._rows, capacity)
+            self._prices = _grow(self._prices, capacity)
+            self._timestamps = _grow(self._timestamps, capacity)
+            self._points = _grow(self._points, capacity)
+        if self._scale is None:
+            scale = np.nan_to_num(rows[:, self._matched], nan=-1).std(axis=0)
+            self._scale = np.where(scale > 0, scale, 1)
+        self._rows[start:end] = rows
+        self._prices[start:end] = prices
+        self._timestamps[start:end] = timestamps
+        self._points[start:end] = self._distance_points(rows)
+        self._size = end
+
+        # group the new sales by key in one pass; a stable sort keeps each group in the order added
+        keys = self._keys(rows)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        groups = np.split(start + order, np.cumsum(np.bincount(inverse.ravel()))[:-1])
+        for key, positions in zip(map(tuple, unique.tolist()), groups):
+            self._buckets.setdefault(key, []).extend(positions.tolist())
+
+        if self._tree is None or self._size - self._tree_size > MAX_PENDING:
+            self._tree = cKDTree(self._points[:self._size])
+            self._tree_size = self._size
+
+    def query(self, row, k=DEFAULT_K):
+        """The k sales most comparable to an encoded hero row: same-key sales, most recent first, then nearest ones.
+
+        Fewer are returned only when fewer sales are indexed.
+        """
+        row = np.asarray(row, dtype=np.float64).reshape(-1)
+        bucket = self._buckets.get(tuple(self._keys(row[None])[0].tolist()), [])
+        positions = bucket[max(len(bucket) - k, 0):][::-1] if k > 0 else []
+        match = ['same key'] * len(positions)
+        if len(positions) < k and self._size:
+            same_key = set(positions)
+            nearest = [p for p in self._nearest(row, min(k + len(positions), self._size)) if p not in same_key]
+            nearest = nearest[:k - len(positions)]
+            positions, match = positions + nearest, match + ['nearest'] * len(nearest)
+        return [Comparable(int(self._rows[p, self._id]), float(self._prices[p]), pd.Timestamp(self._timestamps[p]), m)
+                for p, m in zip(positions, match)]
+
+    def _keys(self, rows):
+        keys = np.nan_to_num(rows[:, self._key_columns], nan=-1)
+        bands = np.digitize(np.nan_to_num(rows[:, self._summons], nan=-1), SUMMONS_BANDS)
+        return np.column_stack([keys, bands])
+
+    def _distance_points(self, rows):
+        return np.nan_to_num(rows[:, self._matched], nan=-1) / self._scale
+
+    def _nearest(self, row, k):
+        """Positions of the k nearest sales to row, nearest first."""
+        point = self._distance_points(row[None])[0]
+        distance, position = self._tree.query(point, k=min(k, self._tree_size)) if self._tree_size else ((), ())
+        distance, position = np.atleast_1d(distance), np.atleast_1d(position)
+        if self._size > self._tree_size:
+            # sales added since the tree was built
+            pending = self._points[self._tree_size:self._size]
+            distance = np.concatenate([distance, np.sqrt(((pending - point) ** 2).sum(axis=1))])
+            position = np.concatenate([position, np.arange(self._tree_size, self._size)])
+        order = np.argsort(distance, kind='stable')[:k]
+        return position[order].tolist()
+
+    @classmethod
+    def load(cls, path=COMPARABLES_PATH):
+        feature_names = np.load(os.path.join(path, 'feature_names.npy')).tolist()
+        index = cls(feature_names)
+        index.add(*(np.load(os.path.join(path, f'{k}.npy')) for k in ('rows', 'prices', 'timestamps')))
+        return index
+
+    def save(self, path=COMPARABLES_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'rows.npy'), self._rows[:self._size])
+        np.save(os.path.join(path, 'prices.npy'), self._prices[:self._size])
+        np.save(os.path.join(path, 'timestamps.npy'), self._timestamps[:self._size])
+        np.save(os.path.join(path, 'feature_names.npy'), np.array(self.feature_names))
+
+
+def _grow(array, capacity):
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
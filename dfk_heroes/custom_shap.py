@@ -1,33 +1,36 @@
 
+import io
 import numpy as np
-import warnings
-import shap
-try:
-    import matplotlib.pyplot as pl
-    import matplotlib
-except ImportError:
-    warnings.warn("matplotlib could not be loaded!")
-    pass
-from shap.plots._labels import labels
-from shap.utils import safe_isinstance, format_value
-from shap.plots import colors
-from matplotlib.offsetbox import AnnotationBbox, OffsetImage
-import matplotlib.image as image 
-import matplotlib as mpl
 import os
+from functools import lru_cache
 from pathlib import Path
 
+# shap and matplotlib are only imported when the first waterfall is drawn, so that computing SHAP
+# values or importing this module does not pay for the plotting stack.
+#
+# Every waterfall is drawn on a Figure of its own, attached to its own Agg canvas, with its colors set
+# on its artists: neither pyplot's current figure nor the global rcParams are touched, so sessions can
+# render concurrently.
+
 COLOR = 'white'
 BACKGROUND_COLOR = '#100f21'
 GREEN_COLOR = '#19c558'
+LOGO_PATH = os.path.join(Path(__file__).parent, 'data/favicon.png')
+
+
+@lru_cache(maxsize=None)
+def _logo():
+    import matplotlib.image as image
+    return image.imread(LOGO_PATH)
+
 
-mpl.rcParams['text.color'] = COLOR
-mpl.rcParams['axes.labelcolor'] = COLOR
-mpl.rcParams['xtick.color'] = COLOR
-mpl.rcParams['ytick.color'] = COLOR
-mpl.rcParams['axes.edgecolor'] = COLOR
+def _style_axes(ax):
+    ax.tick_params(colors=COLOR)
+    for spine in ax.spines.values():
+        spine.set_edgecolor(COLOR)
 
-def _custom_waterfall(shap_values, max_display=10, show=True):
+
+def _custom_waterfall(shap_values, max_display=10):
     """ Plots an explantion of a single prediction as a waterfall plot.
     The SHAP value of a feature represents the impact of the evidence provided by that feature on the model's
     output. The waterfall plot is designed to visually display how the SHAP values (evidence) of each feature
@@ -42,10 +45,16 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
         A one-dimensional Explanation object that contains the feature values and SHAP values to plot.
     max_display : str
         The maximum number of features to plot.
-    show : bool
-        Whether matplotlib.pyplot.show() is called before returning. Setting this to False allows the plot
-        to be customized further after it has been created.
+
+    Returns the matplotlib Figure, which is not registered with pyplot.
     """
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from shap.plots._labels import labels
+    from shap.utils import safe_isinstance, format_value
+    from shap.plots import colors
+    from matplotlib.offsetbox import AnnotationBbox, OffsetImage
     
 
     base_values = shap_values.base_values
@@ -57,8 +66,6 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     values = shap_values.values
 
     
-    fig, ax = pl.subplots(figsize=(10,5), facecolor=BACKGROUND_COLOR )
-    ax.set_facecolor(BACKGROUND_COLOR)
     # make sure we only have a single output to explain
     if (type(base_values) == np.ndarray and len(base_values) > 0) or type(base_values) == list:
         raise Exception("waterfall_plot requires a scalar base_values of the model output as the first " \
@@ -100,7 +107,11 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     yticklabels = ["" for i in range(num_features + 1)]
     
     # size the plot based on how many features we are plotting
-    pl.gcf().set_size_inches(8, num_features * row_height + 1.5)
+    fig = Figure(figsize=(8, num_features * row_height + 1.5), facecolor=BACKGROUND_COLOR)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_facecolor(BACKGROUND_COLOR)
+    _style_axes(ax)
 
     # see how many individual (vs. grouped at the end) features we are plotting
     if num_features == len(values):
@@ -127,7 +138,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
                 neg_high.append(upper_bounds[order[i]])
             neg_lefts.append(loc)
         if num_individual != num_features or i + 4 < num_individual:
-            pl.plot([loc, loc], [rng[i] -1 - 0.4, rng[i] + 0.4], color="#bbbbbb", linestyle="--", linewidth=0.5, zorder=-1)
+            ax.plot([loc, loc], [rng[i] -1 - 0.4, rng[i] + 0.4], color="#bbbbbb", linestyle="--", linewidth=0.5, zorder=-1)
         if features is None:
             yticklabels[rng[i]] = feature_names[order[i]]
         else:
@@ -153,16 +164,14 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     
     # draw invisible bars just for sizing the axes
     label_padding = np.array([0.1*dataw if w < 1 else 0 for w in pos_widths])
-    pl.barh(pos_inds, np.array(pos_widths) + label_padding + 0.02*dataw, left=np.array(pos_lefts) - 0.01*dataw, color=GREEN_COLOR, alpha=0)
+    ax.barh(pos_inds, np.array(pos_widths) + label_padding + 0.02*dataw, left=np.array(pos_lefts) - 0.01*dataw, color=GREEN_COLOR, alpha=0)
     label_padding = np.array([-0.1*dataw  if -w < 1 else 0 for w in neg_widths])
-    pl.barh(neg_inds, np.array(neg_widths) + label_padding - 0.02*dataw, left=np.array(neg_lefts) + 0.01*dataw, color=colors.blue_rgb, alpha=0)
+    ax.barh(neg_inds, np.array(neg_widths) + label_padding - 0.02*dataw, left=np.array(neg_lefts) + 0.01*dataw, color=colors.blue_rgb, alpha=0)
     
     # define variable we need for plotting the arrows
     head_length = 0.08
     bar_width = 0.8
-    xlen = pl.xlim()[1] - pl.xlim()[0]
-    fig = pl.gcf()
-    ax = pl.gca()
+    xlen = ax.get_xlim()[1] - ax.get_xlim()[0]
     xticks = ax.get_xticks()
     bbox = ax.get_window_extent().transformed(fig.dpi_scale_trans.inverted())
     width, height = bbox.width, bbox.height
@@ -173,7 +182,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     # draw the positive arrows
     for i in range(len(pos_inds)):
         dist = pos_widths[i]
-        arrow_obj = pl.arrow(
+        arrow_obj = ax.arrow(
             pos_lefts[i], pos_inds[i], max(dist-hl_scaled, 0.000001), 0,
             head_length=min(dist, hl_scaled),
             color=GREEN_COLOR, width=bar_width,
@@ -181,13 +190,13 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
         )
         
         if pos_low is not None and i < len(pos_low):
-            pl.errorbar(
+            ax.errorbar(
                 pos_lefts[i] + pos_widths[i], pos_inds[i], 
                 xerr=np.array([[pos_widths[i] - pos_low[i]], [pos_high[i] - pos_widths[i]]]),
                 ecolor=colors.light_red_rgb
             )
 
-        txt_obj = pl.text(
+        txt_obj = ax.text(
             pos_lefts[i] + 0.5*dist, pos_inds[i], format_value(pos_widths[i], '%+0.02f'),
             horizontalalignment='center', verticalalignment='center', color="white",
             fontsize=12
@@ -199,7 +208,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
         if text_bbox.width > arrow_bbox.width: 
             txt_obj.remove()
             
-            txt_obj = pl.text(
+            txt_obj = ax.text(
                 pos_lefts[i] + (5/72)*bbox_to_xscale + dist, pos_inds[i], format_value(pos_widths[i], '%+0.02f'),
                 horizontalalignment='left', verticalalignment='center', color=GREEN_COLOR,
                 fontsize=12
@@ -209,7 +218,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     for i in range(len(neg_inds)):
         dist = neg_widths[i]
         
-        arrow_obj = pl.arrow(
+        arrow_obj = ax.arrow(
             neg_lefts[i], neg_inds[i], -max(-dist-hl_scaled, 0.000001), 0,
             head_length=min(-dist, hl_scaled),
             color=colors.red_rgb, width=bar_width,
@@ -217,13 +226,13 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
         )
 
         if neg_low is not None and i < len(neg_low):
-            pl.errorbar(
+            ax.errorbar(
                 neg_lefts[i] + neg_widths[i], neg_inds[i], 
                 xerr=np.array([[neg_widths[i] - neg_low[i]], [neg_high[i] - neg_widths[i]]]),
                 ecolor=colors.light_red_rgb
             )
         
-        txt_obj = pl.text(
+        txt_obj = ax.text(
             neg_lefts[i] + 0.5*dist, neg_inds[i], format_value(neg_widths[i], '%+0.02f'),
             horizontalalignment='center', verticalalignment='center', color="white",
             fontsize=12
@@ -235,7 +244,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
         if text_bbox.width > arrow_bbox.width: 
             txt_obj.remove()
             
-            txt_obj = pl.text(
+            txt_obj = ax.text(
                 neg_lefts[i] - (5/72)*bbox_to_xscale + dist, neg_inds[i], format_value(neg_widths[i], '%+0.02f'),
                 horizontalalignment='right', verticalalignment='center', color=colors.red_rgb,
                 fontsize=12
@@ -243,28 +252,30 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
 
     # draw the y-ticks twice, once in gray and then again with just the feature names in black
     ytick_pos = list(range(num_features)) + list(np.arange(num_features)+1e-8) # The 1e-8 is so matplotlib 3.3 doesn't try and collapse the ticks
-    pl.yticks(ytick_pos, yticklabels[:-1] + [l.split('=')[-1] for l in yticklabels[:-1]], fontsize=13)
+    ax.set_yticks(ytick_pos)
+    ax.set_yticklabels(yticklabels[:-1] + [l.split('=')[-1] for l in yticklabels[:-1]], fontsize=13)
     # put horizontal lines for each feature row
     for i in range(num_features):
-        pl.axhline(i, color="#cccccc", lw=0.5, dashes=(1, 5), zorder=-1)
+        ax.axhline(i, color="#cccccc", lw=0.5, dashes=(1, 5), zorder=-1)
     
     # mark the prior expected value and the model prediction
-    pl.axvline(base_values, 0, 1/num_features, color="#bbbbbb", linestyle="--", linewidth=0.5, zorder=-1)
+    ax.axvline(base_values, 0, 1/num_features, color="#bbbbbb", linestyle="--", linewidth=0.5, zorder=-1)
     fx = base_values + values.sum()
-    pl.axvline(fx, 0, 1, color="#bbbbbb", linestyle="--", linewidth=0.5, zorder=-1)
+    ax.axvline(fx, 0, 1, color="#bbbbbb", linestyle="--", linewidth=0.5, zorder=-1)
     
     # clean up the main axis
-    pl.gca().xaxis.set_ticks_position('bottom')
-    pl.gca().yaxis.set_ticks_position('none')
-    pl.gca().spines['right'].set_visible(False)
-    pl.gca().spines['top'].set_visible(False)
-    pl.gca().spines['left'].set_visible(False)
+    ax.xaxis.set_ticks_position('bottom')
+    ax.yaxis.set_ticks_position('none')
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+    ax.spines['left'].set_visible(False)
     ax.tick_params(labelsize=13)
     #pl.xlabel("\nModel output", fontsize=12)
 
     # draw the E[f(X)] tick mark
     xmin,xmax = ax.get_xlim()
     ax2=ax.twiny()
+    _style_axes(ax2)
     ax2.set_xlim(xmin,xmax)
     ax2.set_xticks([base_values, base_values+1e-8]) # The 1e-8 is so matplotlib 3.3 doesn't try and collapse the ticks
     ax2.set_xticklabels(["\naverage price$ = "+format_value(base_values, "%0.03f")+"$ JEWEL", ""], fontsize=12, ha="left")
@@ -274,6 +285,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
 
     # draw the f(x) tick mark
     ax3=ax2.twiny()
+    _style_axes(ax3)
     ax3.set_xlim(xmin,xmax)
     ax3.set_xticks([base_values + values.sum(), base_values + values.sum() + 1e-8]) # The 1e-8 is so matplotlib 3.3 doesn't try and collapse the ticks
     ax3.set_xticklabels([f"\nprice = {fx:.3f} JEWEL", ""], fontsize=12, ha="left")
@@ -293,7 +305,7 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     tick_labels[1].set_color("#999999")
 
 
-    logo = OffsetImage(image.imread(os.path.join(Path(__file__).parent, 'data/favicon.png')), zoom=0.3)
+    logo = OffsetImage(_logo(), zoom=0.3)
     ab = AnnotationBbox(logo, (fx, 1), frameon=False)
     ax.add_artist(ab)
 
@@ -302,18 +314,24 @@ def _custom_waterfall(shap_values, max_display=10, show=True):
     tick_labels = ax.yaxis.get_majorticklabels()
     for i in range(num_features):
         tick_labels[i].set_color("#999999")
-    
-    if show:
-        pl.show()
-        
-def get_shap_values(explainer, feature):
-    return explainer.shap_values(feature)
 
+    return fig
 
-def custom_waterfall(explainer, shap_values, feature):
-    ex = shap.Explanation(values=shap_values[0], 
-                                         base_values=explainer.expected_value, 
-                                         data=feature.iloc[0],  # added this line
-                                         feature_names=feature.columns.tolist())
-    
-    _custom_waterfall(ex, show=False)
\ No newline at end of file
+
+def custom_waterfall_row(expected_value, shap_row, features):
+    """The waterfall of a SHAP row and the model inputs dict it explains, as a Figure."""
+    import shap
+    import pandas as pd
+    ex = shap.Explanation(values=shap_row,
+                          base_values=expected_value,
+                          data=pd.Series(features),
+                          feature_names=list(features))
+
+    return _custom_waterfall(ex)
+
+
+def render_waterfall(expected_value, shap_row, features, format='png'):
+    """custom_waterfall_row rendered to image bytes ('png' or 'svg'), ready for st.image or a cache."""
+    buffer = io.BytesIO()
+    custom_waterfall_row(expected_value, shap_row, features).savefig(buffer, format=format, bbox_inches='tight')
+    return buffer.getvalue()
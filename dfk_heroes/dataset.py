@@ -0,0 +1,221 @@
+"""Typed, columnar storage for the tavern sales and cached LightGBM datasets built from it.
+
+tavern_data.csv is converted once into an Arrow IPC (Feather v2) file: comma-decimal prices parsed to
+floats, timestamps to datetime64 and every text column to a dictionary-encoded categorical whose
+categories are fixed for the whole file. The file is uncompressed, so it is memory-mapped and read
+without copying, and it is written in record batches so both the conversion and reads can stream.
+
+SalesSequence feeds a store to LightGBM batch by batch so that sales that do not fit in memory can
+still be binned and trained on: tuning.py bins its splits this way. The binned training Dataset is
+saved in LightGBM's binary format and reloaded instead of re-binning.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from flat_forest import frame_to_array
+
+CSV_PATH = os.path.join(Path(__file__).parent, 'data/tavern_data.csv')
+STORE_PATH = os.path.join(Path(__file__).parent, 'data/tavern_data.feather')
+CACHE_DIR = os.path.join(Path(__file__).parent, 'data/lgb_cache')
+
+CATEGORICAL_COLUMNS = ['rarity', 'mainClass', 'subClass', 'statBoost1', 'statBoost2', 'profession']
+INTEGER_COLUMNS = {'id': 'int64', 'generation': 'int16', 'summons': 'int16', 'maxSummons': 'int16'}
+DEFAULT_CHUNK_SIZE = 100_000
+
+# parameters the binned Dataset depends on; feature_pre_filter is off so that one binary serves any
+# min_data_in_leaf
+DATASET_PARAMS = {'max_bin': 255, 'feature_pre_filter': False, 'verbose': -1}
+
+
+def convert(csv_path=CSV_PATH, store_path=STORE_PATH, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Converts the sales CSV into a store, reading it twice in chunks so memory stays bounded.
+
+    The first pass collects the categories of every text column, so that all record batches share
+    the same dictionaries (and codes); the second parses and writes the batches.
+    """
+    import pyarrow as pa
+
+    categories = {c: set() for c in CATEGORICAL_COLUMNS}
+    for chunk in pd.read_csv(csv_path, usecols=CATEGORICAL_COLUMNS, dtype=str, chunksize=chunk_size):
+        for c in CATEGORICAL_COLUMNS:
+            categories[c].update(chunk[c].dropna())
+    categories = {c: sorted(v) for c, v in categories.items()}
+
+    tmp_path = f'{store_path}.tmp'
+    writer = None
+    for chunk in pd.read_csv(csv_path, decimal=',', dtype={c: str for c in CATEGORICAL_COLUMNS},
+                             parse_dates=['timeStamp'], chunksize=chunk_size):
+        chunk = chunk.astype(INTEGER_COLUMNS).assign(
+            soldPrice=chunk['soldPrice'].astype('float64'),
+            **{c: pd.Categorical(chunk[c], categories=categories[c]) for c in CATEGORICAL_COLUMNS})
+        batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pa.ipc.new_file(tmp_path, batch.schema)
+        writer.write_batch(batch)
+    writer.close()
+    os.replace(tmp_path, store_path)
+    return store_path
+
+
+def open_store(store_path=STORE_PATH):
+    """A memory-mapped reader over the record batches of a store."""
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(store_path, 'r'))
+
+
+def load(store_path=STORE_PATH, columns=None):
+    """The whole store, or some columns of it, as a DataFrame."""
+    table = open_store(store_path).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+def head(store_path=STORE_PATH, n=5):
+    """The first n sales of the store, read from its first record batch only."""
+    return open_store(store_path).get_batch(0).slice(0, n).to_pandas()
+
+
+def iter_batches(store_path=STORE_PATH, columns=None):
+    """The store as a stream of DataFrames, one per record batch."""
+    reader = open_store(store_path)
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if columns is not None:
+            batch = batch.select(columns)
+        yield batch.to_pandas()
+
+
+def update_store(csv_path=CSV_PATH, store_path=STORE_PATH):
+    """The path of the store, (re)built first when missing or older than the CSV."""
+    if not os.path.exists(store_path) or os.path.getmtime(store_path) < os.path.getmtime(csv_path):
+        convert(csv_path, store_path)
+    return store_path
+
+
+def load_sales(csv_path=CSV_PATH, store_path=STORE_PATH):
+    """The sales, from the store, which is (re)built first when missing or older than the CSV."""
+    return load(update_store(csv_path, store_path))
+
+
+def _cached(key, cache_dir, params, build):
+    # a freshly built Dataset is saved and then reloaded like a cached one, so that both behave the
+    # same in lgb.train (e.g. when it sets categorical_feature); the categories LightGBM froze
+    # (pandas_categorical), which its binary format does not keep, are stored next to it
+    bin_path = os.path.join(cache_dir, f'{key}.bin')
+    meta_path = os.path.join(cache_dir, f'{key}.json')
+    if not (os.path.exists(bin_path) and os.path.exists(meta_path)):
+        os.makedirs(cache_dir, exist_ok=True)
+        dataset = build().construct()
+        tmp_path = f'{bin_path}.{os.getpid()}.tmp'
+        dataset.save_binary(tmp_path)
+        os.replace(tmp_path, bin_path)
+        with open(meta_path, 'w') as f:
+            json.dump({'pandas_categorical': dataset.pandas_categorical}, f)
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    dataset = lgb.Dataset(bin_path, params=params)
+    dataset.pandas_categorical = meta['pandas_categorical']
+    return dataset.construct()
+
+
+class SalesSequence(lgb.Sequence):
+    """Rows of a store, transformed and encoded for LightGBM on demand from the memory-mapped file.
+
+    transformers are the fitted pipe[:-1] steps; rows optionally selects (sorted) row positions of
+    the store, e.g. after outlier removal or a train/validation split.
+    """
+
+    def __init__(self, transformers, pandas_categorical, store_path=STORE_PATH, rows=None, batch_size=4096):
+        self.transformers = transformers
+        self.pandas_categorical = pandas_categorical
+        self.reader = open_store(store_path)
+        self.batches = [self.reader.get_batch(i) for i in range(self.reader.num_record_batches)]
+        self.offsets = np.cumsum([0] + [b.num_rows for b in self.batches])
+        self.rows = np.arange(self.offsets[-1]) if rows is None else np.asarray(rows)
+        self.batch_size = batch_size
+        self._block = (None, None)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            # LightGBM samples single rows in increasing order to find the bins: encode a whole block
+            # around them at once rather than one row at a time
+            start = idx - idx % self.batch_size
+            if self._block[0] != start:
+                self._block = (start, self._encode(self.rows[start:start + self.batch_size]))
+            return self._block[1][idx - start]
+        return self._encode(self.rows[idx])
+
+    def _encode(self, positions):
+        import pyarrow as pa
+
+        order = np.argsort(positions, kind='stable')
+        positions = positions[order]
+        which = np.searchsorted(self.offsets, positions, side='right') - 1
+        tables = []
+        for b in np.unique(which):
+            local = positions[which == b] - self.offsets[b]
+            tables.append(pa.Table.from_batches([self.batches[b].take(pa.array(local))]))
+        frame = pa.concat_tables(tables).drop(['soldPrice']).to_pandas()
+        X = frame_to_array(self.transformers.transform(frame), self.pandas_categorical)
+        out = np.empty_like(X)
+        out[order] = X
+        return out
+
+
+def out_of_core_dataset(transformers, store_path=STORE_PATH, rows=None, params=DATASET_PARAMS, reference=None,
+                        cache_dir=CACHE_DIR):
+    """An lgb.Dataset of a store binned straight from the memory-mapped file through SalesSequence.
+
+    The label is the only column loaded whole. Without a reference (i.e. for the training set) the
+    result is saved in LightGBM's binary format and reloaded on later calls, keyed by the store's size and modification time (convert
+    replaces the file whole, so new contents mean a new time), the rows and the parameters.
+    """
+    label = load(store_path, ['soldPrice'])['soldPrice'].to_numpy()
+    rows = np.arange(len(label)) if rows is None else np.asarray(rows)
+    pandas_categorical = store_categories(transformers, store_path)
+    feature = _feature_layout(transformers, store_path)
+
+    def build():
+        sequence = SalesSequence(transformers, pandas_categorical, store_path, rows)
+        categorical_feature = list(feature.columns[feature.dtypes=="category"])
+        if reference is not None:
+            # the bins come from the reference; a differing setting would make lgb.train rebuild them
+            categorical_feature = reference.categorical_feature
+        dataset = lgb.Dataset([sequence], label[rows], params=params, reference=reference,
+                              feature_name=list(feature.columns), categorical_feature=categorical_feature)
+        dataset.pandas_categorical = pandas_categorical
+        return dataset
+
+    if reference is not None:
+        return build().construct()
+
+    stat = os.stat(store_path)
+    key = hashlib.sha256()
+    key.update(rows.astype(np.int64).tobytes())
+    key.update(json.dumps([os.path.abspath(store_path), stat.st_size, stat.st_mtime_ns, params, pandas_categorical,
+                           lgb.__version__], default=str).encode())
+    return _cached(key.hexdigest(), cache_dir, params, build)
+
+
+def _feature_layout(transformers, store_path):
+    # a single transformed row: the column order and dtypes of what the transformers produce
+    return transformers.transform(head(store_path, 1).drop(columns=['soldPrice']))
+
+
+def store_categories(transformers, store_path=STORE_PATH):
+    """pandas_categorical of the transformed store: its fixed dictionaries, and the class ranks."""
+    feature = _feature_layout(transformers, store_path)
+    class_rank = transformers.named_steps['classrankextractor'].mapping
+    return [feature[c].cat.categories.tolist() if c in CATEGORICAL_COLUMNS else sorted(set(class_rank.values()))
+            for c in feature.columns[feature.dtypes=="category"]]
@@ -0,0 +1,95 @@
+"""The t-SNE map of SHAP values, and the placement of heroes the map was not fit on.
+
+t-SNE has no transform: it only places the rows it is fit on. A Projection keeps those rows (in SHAP
+space) with their map coordinates in a KD-tree, and places any other SHAP vector at the
+inverse-distance weighted mean of the coordinates of its k nearest fitted rows. That takes well under
+a millisecond, so a hero looked up in the app lands on the map next to the sales that were priced
+for the same reasons.
+
+fit_embedding fits t-SNE on at most max_fit rows, sampled uniformly, and projects the rest, so its
+cost stops growing with the dataset.
+
+    data/embedding/
+        reference.npy       the SHAP values of the rows t-SNE was fit on
+        coordinates.npy     their map coordinates
+        k.npy               neighbours averaged per projected row
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EMBEDDING_PATH = os.path.join(Path(__file__).parent, 'data/embedding')
+DEFAULT_K = 10
+DEFAULT_MAX_FIT = 5000
+
+
+class Projection:
+    """Places SHAP vectors on a fitted map by kNN regression of the map coordinates."""
+
+    def __init__(self, reference, coordinates, k=DEFAULT_K):
+        self.reference = reference
+        self.coordinates = coordinates
+        self.k = min(int(k), len(reference))
+        self.tree = cKDTree(reference)
+
+    def transform(self, shap_values):
+        """Map coordinates, (n_rows, 2), of SHAP values given as one row or an (n_rows, n_features) array.
+
+        A row equal to a fitted one gets that row's coordinates (those of the first neighbour found if
+        the reference holds it more than once, which fit_embedding never does).
+        """
+        X = np.atleast_2d(np.asarray(shap_values, dtype=np.float64))
+        distance, index = self.tree.query(X, k=self.k)
+        if self.k == 1:
+            distance, index = distance[:, None], index[:, None]
+        exact = distance == 0
+        exact &= np.cumsum(exact, axis=1) == 1
+        weight = np.where(exact.any(axis=1, keepdims=True), exact, 1 / np.maximum(distance, 1e-300))
+        return np.einsum('nk,nkc->nc', weight, self.coordinates[index]) / weight.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def load(cls, path=EMBEDDING_PATH):
+        """Load a directory written by save, its arrays memory-mapped."""
+        arrays = {k: np.asarray(np.load(os.path.join(path, f'{k}.npy'), mmap_mode='r'))
+                  for k in ('reference', 'coordinates')}
+        return cls(**arrays, k=np.load(os.path.join(path, 'k.npy')))
+
+    def save(self, path=EMBEDDING_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'reference.npy'), np.asarray(self.reference, dtype=np.float64))
+        np.save(os.path.join(path, 'coordinates.npy'), np.asarray(self.coordinates, dtype=np.float64))
+        np.save(os.path.join(path, 'k.npy'), np.array(self.k))
+
+
+def fit_embedding(shap_values, max_fit=DEFAULT_MAX_FIT, k=DEFAULT_K, perplexity=25, random_state=34):
+    """Map coordinates, (n_rows, 2), of every row of shap_values and the Projection placing new ones.
+
+    t-SNE is fit on all rows when there are at most max_fit of them, and on a uniform sample of
+    max_fit rows otherwise, the others being projected. Sales with the same SHAP values (they happen,
+    the model not telling every input apart) are fit once and share their coordinates, so that the
+    reference of the Projection holds every vector once.
+    """
+    from sklearn.manifold import TSNE
+
+    shap_values = np.asarray(shap_values, dtype=np.float64)
+    n_rows = len(shap_values)
+    fit = np.arange(n_rows)
+    if n_rows > max_fit:
+        fit = np.sort(np.random.default_rng(random_state).choice(n_rows, max_fit, replace=False))
+    # the distinct rows of the sample, in the order they first appear
+    _, first, inverse = np.unique(shap_values[fit], axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    reference = shap_values[fit[first[order]]]
+    coordinates = TSNE(n_components=2, perplexity=perplexity, random_state=random_state).fit_transform(reference)
+    projection = Projection(reference, coordinates, k)
+
+    embedded = np.empty((n_rows, 2))
+    embedded[fit] = coordinates[rank[inverse.ravel()]]
+    rest = np.setdiff1d(np.arange(n_rows), fit, assume_unique=True)
+    if len(rest):
+        embedded[rest] = projection.transform(shap_values[rest])
+    return embedded, projection
@@ -0,0 +1,98 @@
+"""Explanation backends for the price model: SHAP values from the shap package or straight from LightGBM.
+
+Both backends wrap a booster and expose what the app and model.py use of shap.TreeExplainer:
+
+    explainer = explainers.get_explainer(booster, 'native')
+    explainer.shap_values(feature)   # (n_rows, n_features) array, feature as pipe[:-1].transform returns it
+    explainer.expected_value         # the model's average prediction, where the SHAP values start from
+
+'native' asks LightGBM for its TreeSHAP contributions (booster.predict(pred_contrib=True)), which is
+what shap.TreeExplainer computes for LightGBM models too, without importing shap. explain_batch
+splits large frames into chunks explained by a pool of worker processes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+
+import lightgbm as lgb
+import numpy as np
+
+DEFAULT_BACKEND = 'native'
+DEFAULT_CHUNK_SIZE = 10_000
+
+_explainer = None
+
+
+class NativeExplainer:
+    """SHAP values from LightGBM's own TreeSHAP. num_threads is passed to booster.predict (0: OpenMP's default)."""
+
+    def __init__(self, booster, num_threads=0):
+        self.booster = booster
+        self.num_threads = num_threads
+
+    @cached_property
+    def expected_value(self):
+        # the last contribution column is the expected value, whatever the row: explain an all-missing one
+        row = np.full((1, self.booster.num_feature()), np.nan)
+        return float(self.booster.predict(row, pred_contrib=True, num_threads=self.num_threads)[0, -1])
+
+    def shap_values(self, feature):
+        contrib = self.booster.predict(feature, pred_contrib=True, num_threads=self.num_threads)
+        return contrib[:, :-1]
+
+
+class ShapExplainer:
+    """SHAP values from shap.TreeExplainer. shap calls LightGBM itself, with its default thread count."""
+
+    def __init__(self, booster, num_threads=0):
+        import shap
+        self.booster = booster
+        self.explainer = shap.TreeExplainer(booster)
+
+    @property
+    def expected_value(self):
+        # shap only sets it for LightGBM models once it explained some rows
+        if self.explainer.expected_value is None:
+            self.explainer.shap_values(np.full((1, self.booster.num_feature()), np.nan))
+        return float(self.explainer.expected_value)
+
+    def shap_values(self, feature):
+        return np.asarray(self.explainer.shap_values(feature))
+
+
+BACKENDS = {'native': NativeExplainer, 'shap': ShapExplainer}
+
+
+def get_explainer(booster, backend=DEFAULT_BACKEND, num_threads=0):
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown explanation backend {backend}, expected one of {", ".join(BACKENDS)}')
+    return BACKENDS[backend](booster, num_threads)
+
+
+def _init_worker(model_text, backend):
+    global _explainer
+    # one LightGBM thread per worker, the pool provides the parallelism
+    _explainer = get_explainer(lgb.Booster(model_str=model_text), backend, num_threads=1)
+
+
+def _explain_chunk(feature):
+    return _explainer.shap_values(feature)
+
+
+def explain_batch(booster, feature, backend=DEFAULT_BACKEND, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """SHAP values of a frame of any size and the expected value.
+
+    The frame is explained in chunks of chunk_size rows by `workers` processes (default: one per CPU);
+    with workers=0, or a frame of a single chunk, it is explained in this process.
+    """
+    explainer = get_explainer(booster, backend)
+    workers = os.cpu_count() if workers is None else workers
+    if not workers or len(feature) <= chunk_size:
+        return explainer.shap_values(feature), explainer.expected_value
+
+    chunks = [feature.iloc[start:start + chunk_size] for start in range(0, len(feature), chunk_size)]
+    # the booster travels as its text model; model_to_string keeps the best iteration, as predict does
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(booster.model_to_string(), backend)) as executor:
+        values = np.concatenate(list(executor.map(_explain_chunk, chunks)))
+    return values, explainer.expected_value
@@ -0,0 +1,294 @@
+"""A trained LightGBM booster flattened into contiguous NumPy arrays, with a vectorized evaluator.
+
+Every node of every tree lives in the same set of arrays. A batch is scored by advancing all
+(row, tree) cursors one level at a time, retiring those that reached a leaf, with no per-tree Python
+loop and no call into LightGBM. Row for row that is no faster than booster.predict; what pays is
+predict_grid, which scores a hero over a grid of two features (e.g. its 168 sale slots) with one
+walk per tree (see benchmarks/flat_forest.py).
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FOREST_PATH = os.path.join(Path(__file__).parent, 'data/forest.npz')
+
+# LightGBM's missing_type values and zero tolerance (kZeroThreshold in meta.h)
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+_ZERO_THRESHOLD = 1e-35
+
+# (row, tree) cursors advanced at once; bounds the evaluator's working memory
+DEFAULT_CHUNK_CELLS = 1 << 20
+
+_ARRAYS = ('roots', 'split_feature', 'threshold', 'left', 'right', 'leaf_value', 'is_categorical',
+           'default_left', 'missing_type', 'cat_offset', 'cat_words', 'cat_bitset')
+
+
+class FlatForest:
+    """Scores rows encoded the way LightGBM sees them (see frame_to_array) like booster.predict.
+
+    Only the raw score is computed, which is the prediction for the regression objectives this
+    project trains.
+    """
+
+    def __init__(self, roots, split_feature, threshold, left, right, leaf_value, is_categorical,
+                 default_left, missing_type, cat_offset, cat_words, cat_bitset, max_depth, feature_names):
+        self.roots = roots
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.is_categorical = is_categorical
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.cat_offset = cat_offset
+        self.cat_words = cat_words
+        self.cat_bitset = cat_bitset
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names)
+
+        self.is_leaf = left == np.arange(len(left))
+        self.has_categorical = bool(is_categorical.any())
+        self.has_zero_missing = bool((missing_type == MISSING_ZERO).any())
+        # branch taken by a NaN value at numerical splits: the default one when the split handles
+        # missing values, else the one 0.0 goes to
+        self.nan_left = np.where(missing_type == MISSING_NONE, threshold >= 0.0, default_left)
+        # right and left child interleaved, so that the next node is children[2 * node + go_left]
+        self.children = np.stack([right, left], axis=1).ravel()
+        # the category bitsets unpacked to one flag per category: bit i of word w is at 32 * w + i
+        self._cat_table = np.unpackbits(cat_bitset.astype('<u4').view(np.uint8), bitorder='little').astype(bool)
+
+    @classmethod
+    def from_booster(cls, booster, num_iteration=None):
+        """Flatten the trees booster.predict would use: up to best_iteration unless num_iteration is given."""
+        if num_iteration is None and booster.best_iteration > 0:
+            num_iteration = booster.best_iteration
+        model = booster.dump_model(num_iteration=num_iteration)
+        if model['num_tree_per_iteration'] != 1 or not model['objective'].startswith('regression'):
+            raise ValueError(f"only single-output regression boosters can be flattened, got {model['objective']}")
+
+        nodes = _NodeArrays()
+        roots = [nodes.add(tree['tree_structure']) for tree in model['tree_info']]
+        return cls(np.array(roots, dtype=np.int32), *nodes.to_arrays(), max_depth=nodes.max_depth,
+                   feature_names=model['feature_names'])
+
+    @classmethod
+    def load(cls, path=FOREST_PATH):
+        """Load an .npz file, or a directory of .npy files, whose arrays are then memory-mapped."""
+        if os.path.isdir(path):
+            # plain ndarray views of the maps, which index without np.memmap's Python-level overhead
+            arrays = {k: np.asarray(np.load(os.path.join(path, f'{k}.npy'), mmap_mode='r')) for k in _ARRAYS}
+            return cls(**arrays, max_depth=np.load(os.path.join(path, 'max_depth.npy')),
+                       feature_names=np.load(os.path.join(path, 'feature_names.npy')).tolist())
+        with np.load(path) as data:
+            arrays = {k: data[k] for k in _ARRAYS}
+            return cls(**arrays, max_depth=data['max_depth'], feature_names=data['feature_names'].tolist())
+
+    def save(self, path=FOREST_PATH):
+        """Save to an .npz file, or to a directory of .npy files when path does not end in .npz."""
+        arrays = {**{k: getattr(self, k) for k in _ARRAYS},
+                  'max_depth': np.array(self.max_depth), 'feature_names': np.array(self.feature_names)}
+        if path.endswith('.npz'):
+            np.savez(path, **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for k, array in arrays.items():
+            np.save(os.path.join(path, f'{k}.npy'), array)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def predict(self, X, chunk_cells=DEFAULT_CHUNK_CELLS):
+        """Sum of leaf values over all trees for each row of the (n_rows, n_features) float array X."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        out = np.empty(len(X))
+        step = max(1, chunk_cells // self.n_trees)
+        for start in range(0, len(X), step):
+            out[start:start + step] = self._predict_chunk(X[start:start + step])
+        return out
+
+    def _predict_chunk(self, X):
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        has_missing = np.isnan(flat).any()
+        # one cursor per (row, tree); cursors that reached a leaf are summed and dropped after every level
+        rows = np.repeat(np.arange(n_rows, dtype=np.int32), self.n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        out = np.zeros(n_rows)
+        for _ in range(self.max_depth + 1):
+            done = self.is_leaf[nodes]
+            if done.any():
+                out += np.bincount(rows[done], weights=self.leaf_value[nodes[done]], minlength=n_rows)
+                active = ~done
+                rows, nodes = rows[active], nodes[active]
+            if not len(nodes):
+                break
+            values = flat[rows * n_features + self.split_feature[nodes]]
+            with np.errstate(invalid='ignore'):
+                go_left = values <= self.threshold[nodes]
+            if has_missing:
+                self._missing_decision(nodes, values, go_left)
+            if self.has_categorical:
+                categorical = self.is_categorical[nodes]
+                if categorical.any():
+                    go_left[categorical] = self._categorical_decision(nodes[categorical], values[categorical])
+            nodes = self.children[2 * nodes + go_left]
+        return out
+
+    def predict_grid(self, row, first, n_first, second, n_second):
+        """Predictions for the row with features first and second (column indices) set to every pair of
+        integers in [0, n_first) x [0, n_second), as an (n_first, n_second) array.
+
+        Instead of scoring every pair, each tree is walked once with a rectangle of pairs, which is cut in
+        two at splits on either feature: the cost is that of a few rows rather than n_first * n_second.
+        """
+        row = np.asarray(row, dtype=np.float64).ravel()
+        on_grid = ~self.is_leaf & ((self.split_feature == first) | (self.split_feature == second))
+        if self.has_zero_missing or (on_grid & self.is_categorical).any():
+            # zero-as-missing and categorical splits on the grid features are not handled: score every pair
+            rows = np.repeat(row.reshape(1, -1), n_first * n_second, axis=0)
+            rows[:, first] = np.repeat(np.arange(n_first), n_second)
+            rows[:, second] = np.tile(np.arange(n_second), n_first)
+            return self.predict(rows).reshape(n_first, n_second)
+
+        # one cursor per (tree, rectangle [lo1, hi1) x [lo2, hi2) of the grid it reached node with)
+        nodes = self.roots.astype(np.int64)
+        lo1, hi1 = np.zeros_like(nodes), np.full_like(nodes, n_first)
+        lo2, hi2 = np.zeros_like(nodes), np.full_like(nodes, n_second)
+        # leaf values are added to their whole rectangle through a 2-d difference array
+        diff = np.zeros((n_first + 1) * (n_second + 1))
+        for _ in range(self.max_depth + 1):
+            done = self.is_leaf[nodes]
+            if done.any():
+                value = self.leaf_value[nodes[done]]
+                for i, j, sign in ((lo1, lo2, 1), (lo1, hi2, -1), (hi1, lo2, -1), (hi1, hi2, 1)):
+                    diff += np.bincount(i[done] * (n_second + 1) + j[done], weights=sign * value, minlength=len(diff))
+                active = ~done
+                nodes, lo1, hi1, lo2, hi2 = (a[active] for a in (nodes, lo1, hi1, lo2, hi2))
+            if not len(nodes):
+                break
+
+            # splits on other features: the row decides, as in _predict_chunk
+            values = row[self.split_feature[nodes]]
+            with np.errstate(invalid='ignore'):
+                go_left = values <= self.threshold[nodes]
+            self._missing_decision(nodes, values, go_left)
+            if self.has_categorical:
+                categorical = self.is_categorical[nodes]
+                if categorical.any():
+                    go_left[categorical] = self._categorical_decision(nodes[categorical], values[categorical])
+            cursors = [(self.children[2 * nodes + go_left], lo1, hi1, lo2, hi2)]
+
+            # splits on the grid features: integers below cut go left
+            split = on_grid[nodes]
+            if split.any():
+                cursors = [tuple(a[~split] for a in cursors[0])]
+                n, l1, h1, l2, h2 = (a[split] for a in (nodes, lo1, hi1, lo2, hi2))
+                cut = np.clip(np.floor(self.threshold[n]), -1, max(n_first, n_second)).astype(np.int64) + 1
+                is_first = self.split_feature[n] == first
+                cursors.append((self.left[n], l1, np.where(is_first, np.minimum(h1, cut), h1),
+                                l2, np.where(is_first, h2, np.minimum(h2, cut))))
+                cursors.append((self.right[n], np.where(is_first, np.maximum(l1, cut), l1), h1,
+                                np.where(is_first, l2, np.maximum(l2, cut)), h2))
+            nodes, lo1, hi1, lo2, hi2 = (np.concatenate(a) for a in zip(*cursors))
+            non_empty = (lo1 < hi1) & (lo2 < hi2)
+            nodes, lo1, hi1, lo2, hi2 = (a[non_empty] for a in (nodes, lo1, hi1, lo2, hi2))
+        return diff.reshape(n_first + 1, n_second + 1).cumsum(axis=0).cumsum(axis=1)[:n_first, :n_second]
+
+    def _missing_decision(self, nodes, values, go_left):
+        # mirrors Tree::NumericalDecision: NaN is treated as zero unless the split learnt a NaN branch,
+        # which nan_left folds into one lookup per node
+        missing = np.isnan(values)
+        go_left[missing] = self.nan_left[nodes[missing]]
+        if self.has_zero_missing:
+            zero = (self.missing_type[nodes] == MISSING_ZERO) & (np.abs(values) <= _ZERO_THRESHOLD)
+            go_left[zero] = self.default_left[nodes[zero]]
+
+    def _categorical_decision(self, nodes, values):
+        # mirrors Tree::CategoricalDecision: missing, negative and out of bitset categories go right
+        with np.errstate(invalid='ignore'):
+            valid = (values >= 0) & (values < 32 * self.cat_words[nodes])
+        index = self.cat_offset[nodes] * 32 + np.where(valid, values, 0).astype(np.int64)
+        return valid & self._cat_table[index]
+
+
+class _NodeArrays:
+    """Accumulates the nodes of dump_model() trees, leaves included, into flat lists."""
+
+    def __init__(self):
+        self.columns = {k: [] for k in _ARRAYS if k not in ('roots', 'cat_bitset')}
+        self.cat_bitset = []
+        self.max_depth = 0
+
+    def add(self, node, depth=0):
+        index = len(self.columns['left'])
+        for values in self.columns.values():
+            values.append(0)
+        c = self.columns
+        if 'leaf_value' in node:
+            self.max_depth = max(self.max_depth, depth)
+            c['left'][index] = c['right'][index] = index
+            c['leaf_value'][index] = node['leaf_value']
+            return index
+
+        c['split_feature'][index] = node['split_feature']
+        c['default_left'][index] = node['default_left']
+        c['missing_type'][index] = _MISSING_TYPES[node['missing_type']]
+        if node['decision_type'] == '==':
+            c['is_categorical'][index] = True
+            c['cat_offset'][index] = len(self.cat_bitset)
+            bitset = _to_bitset(int(v) for v in str(node['threshold']).split('||'))
+            c['cat_words'][index] = len(bitset)
+            self.cat_bitset.extend(bitset)
+        else:
+            c['threshold'][index] = node['threshold']
+        c['left'][index] = self.add(node['left_child'], depth + 1)
+        c['right'][index] = self.add(node['right_child'], depth + 1)
+        return index
+
+    def to_arrays(self):
+        c = self.columns
+        return (
+            np.array(c['split_feature'], dtype=np.int32),
+            np.array(c['threshold'], dtype=np.float64),
+            np.array(c['left'], dtype=np.int32),
+            np.array(c['right'], dtype=np.int32),
+            np.array(c['leaf_value'], dtype=np.float64),
+            np.array(c['is_categorical'], dtype=bool),
+            np.array(c['default_left'], dtype=bool),
+            np.array(c['missing_type'], dtype=np.uint8),
+            np.array(c['cat_offset'], dtype=np.int64),
+            np.array(c['cat_words'], dtype=np.int64),
+            np.array(self.cat_bitset or [0], dtype=np.uint32),
+        )
+
+
+def _to_bitset(categories):
+    categories = list(categories)
+    bitset = [0] * (max(categories) // 32 + 1)
+    for category in categories:
+        bitset[category // 32] |= 1 << (category % 32)
+    return bitset
+
+
+def frame_to_array(feature, pandas_categorical):
+    """Encode transformed features (pipe[:-1].transform output) as LightGBM does before predicting.
+
+    Categorical columns become their codes in the categories seen at fit time (booster.pandas_categorical),
+    with unseen values as NaN.
+    """
+    categorical = [c for c in feature.columns if pd.api.types.is_categorical_dtype(feature[c])]
+    X = np.empty(feature.shape, dtype=np.float64)
+    for i, column in enumerate(feature.columns):
+        if column in categorical:
+            codes = pd.Categorical(feature[column], categories=pandas_categorical[categorical.index(column)]).codes
+            X[:, i] = np.where(codes < 0, np.nan, codes)
+        else:
+            X[:, i] = feature[column].to_numpy(dtype=np.float64, na_value=np.nan)
+    return X
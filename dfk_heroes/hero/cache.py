@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from . import hero as hero_contract
+
+SECTIONS = ('id', 'summoningInfo', 'info', 'state', 'stats', 'primaryStatGrowth', 'secondaryStatGrowth', 'professions')
+
+DEFAULT_PATH = os.path.join(Path(__file__).parent.parent, 'data/hero_cache.sqlite')
+DEFAULT_MAX_SIZE = 10_000
+DEFAULT_TTL = 300
+
+
+class HeroCache:
+    """Two-tier cache in front of hero.get_hero.
+
+    The first tier is a bounded in-process LRU and the second a SQLite file that survives restarts.
+    Entries only expire with `ttl`: a hero is refetched whole once it is older than `ttl` seconds,
+    as the contract's getHero is the only way to read any of it, so there is no cheaper refresh of
+    the sections that change (summons, state, stats). Pass path=None to only keep the in-memory tier.
+    """
+
+    def __init__(self, rpc_address, path=DEFAULT_PATH, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.rpc_address = rpc_address
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS hero_cache_entries (
+                    hero_id INTEGER PRIMARY KEY,
+                    hero TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    def get_hero(self, hero_id):
+        """Same dict as hero.get_hero(hero_id, rpc_address), served from the cache when fresh."""
+        with self._lock:
+            entry = self._memory.get(hero_id)
+            if entry is not None:
+                self._memory.move_to_end(hero_id)
+                tier = 'memory'
+            else:
+                entry = self._load(hero_id)
+                tier = 'disk'
+
+            if entry is not None and not self._is_stale(entry):
+                if tier == 'memory':
+                    self.memory_hits += 1
+                else:
+                    self.disk_hits += 1
+                    self._remember(hero_id, entry)
+                return _copy(entry)
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.refreshes += 1
+
+        # the RPC call is made outside of the lock so that other heroes can still be served meanwhile
+        raw_hero = hero_contract.get_client(self.rpc_address).get_hero(hero_id)
+        entry = {'hero': {k: raw_hero[k] for k in SECTIONS}, 'fetched_at': time.time()}
+        with self._lock:
+            self._remember(hero_id, entry)
+            self._store(hero_id, entry)
+        return _copy(entry)
+
+    def invalidate(self, hero_id=None):
+        """Drop one hero, or every hero when hero_id is None, from both tiers."""
+        with self._lock:
+            if hero_id is None:
+                self._memory.clear()
+                if self._db is not None:
+                    self._db.execute('DELETE FROM hero_cache_entries')
+                    self._db.commit()
+            else:
+                self._memory.pop(hero_id, None)
+                if self._db is not None:
+                    self._db.execute('DELETE FROM hero_cache_entries WHERE hero_id = ?', (hero_id,))
+                    self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses + self.refreshes
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_size': len(self._memory),
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _is_stale(self, entry):
+        return time.time() - entry['fetched_at'] > self.ttl
+
+    def _remember(self, hero_id, entry):
+        self._memory[hero_id] = entry
+        self._memory.move_to_end(hero_id)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, hero_id):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT hero, fetched_at FROM hero_cache_entries WHERE hero_id = ?',
+                               (hero_id,)).fetchone()
+        if row is None:
+            return None
+        return {'hero': json.loads(row[0]), 'fetched_at': row[1]}
+
+    def _store(self, hero_id, entry):
+        if self._db is None:
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO hero_cache_entries (hero_id, hero, fetched_at) VALUES (?, ?, ?)',
+            (hero_id, json.dumps(entry['hero']), entry['fetched_at']))
+        self._db.commit()
+
+
+def _copy(entry):
+    # sections are copied so that callers mutating the returned hero never corrupt the cache
+    return {k: dict(v) if isinstance(v, dict) else v for k, v in entry['hero'].items()}
@@ -0,0 +1,381 @@
+"""Local stand-in JSON-RPC server for the hero contract.
+
+Serves getHero, getUserHeroes and ownerOf (plus the handful of eth_* methods web3 needs for transfer)
+so that the fetch path can be exercised, benchmarked and load-tested offline. Answers come from, in
+order: recorded fixtures, an upstream node being recorded, and a deterministic synthetic hero generator.
+
+    python -m dfk_heroes.hero.fake_rpc --port 8545 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from eth_abi import decode_abi, encode_abi
+from eth_utils import function_abi_to_4byte_selector
+from web3 import Web3
+
+from . import hero as hero_contract
+from .utils import utils as hero_utils
+
+CHAIN_ID = 1666600000  # Harmony mainnet shard 0
+START_BLOCK = 22_000_000
+BLOCK_TIME = 2
+ZERO_ADDRESS = '0x' + '00' * 20
+
+RARITY_WEIGHTS = (0.6, 0.25, 0.1, 0.04, 0.01)
+
+
+def _selector(name):
+    return '0x' + function_abi_to_4byte_selector(hero_contract._function_abi(name)).hex()
+
+
+def hero_to_tuple(hero):
+    """Inverse of get_hero: pack a hero dict back into the getHero return tuple."""
+    sections = hero_contract._function_abi('getHero')['outputs'][0]['components']
+    return tuple(
+        tuple(hero[section['name']][field['name']] for field in section['components'])
+        if 'components' in section else hero[section['name']]
+        for section in sections
+    )
+
+
+def _genes(kai_digits):
+    genes = 0
+    for digit in kai_digits:
+        genes = genes * len(hero_utils.ALPHABET) + digit
+    return genes
+
+
+class FakeRPCServer:
+    """Threaded JSON-RPC server standing in for a Harmony node.
+
+    latency seconds (plus up to `jitter` more) are spent on every HTTP request and each call inside it
+    fails with a JSON-RPC error with probability `error_rate`. Heroes with id below `n_heroes` are
+    synthesized from `seed`, owned by one of `n_wallets` wallets; `owners` overrides ownership per id.
+    When `upstream` is set, calls missing from the fixtures are proxied there and recorded, and
+    `save()` writes every recorded answer to `fixtures` for later replay.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=0,
+                 n_heroes=100_000, n_wallets=1_000, owners=None, fixtures=None, upstream=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.n_heroes = n_heroes
+        self.n_wallets = n_wallets
+        self.owners = {} if owners is None else dict(owners)
+        self.fixtures_path = fixtures
+        self.upstream = upstream
+
+        self.recorded = {}
+        if fixtures is not None and upstream is None:
+            with open(fixtures) as f:
+                self.recorded = json.load(f)
+
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._receipts = {}
+        self._contract_address = hero_contract._contract_address().lower()
+        self._methods = {
+            _selector('getHero'): self._get_hero,
+            _selector('getUserHeroes'): self._get_user_heroes,
+            _selector('ownerOf'): self._owner_of,
+        }
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                server._sleep()
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    response = _error(None, -32700, 'Parse error')
+                else:
+                    if isinstance(request, list):
+                        response = [server.handle(r) for r in request]
+                    else:
+                        response = server.handle(request)
+                payload = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """Serve from a background thread and return the server url."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self.upstream is not None and self.fixtures_path is not None:
+            self.save()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def save(self, path=None):
+        with open(path or self.fixtures_path, 'w') as f:
+            json.dump(self.recorded, f, indent=1, sort_keys=True)
+
+    def _sleep(self):
+        delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def block_number(self):
+        return START_BLOCK + int((time.time() - self._started_at) / BLOCK_TIME)
+
+    def handle(self, request):
+        request_id = request.get('id')
+        method = request.get('method')
+        params = request.get('params', [])
+
+        with self._lock:
+            self.calls += 1
+            failed = self.error_rate and self._rng.random() < self.error_rate
+        if failed:
+            return _error(request_id, -32000, 'Injected error')
+
+        key = json.dumps([method, params], sort_keys=True)
+        if key in self.recorded:
+            return _result(request_id, self.recorded[key])
+        if self.upstream is not None:
+            response = requests.post(self.upstream, json=request, timeout=30).json()
+            if 'result' in response:
+                with self._lock:
+                    self.recorded[key] = response['result']
+            return response
+
+        try:
+            return _result(request_id, self._synthesize(method, params))
+        except NotImplementedError:
+            return _error(request_id, -32601, 'Method not found: {}'.format(method))
+        except Exception as e:
+            return _error(request_id, -32000, 'execution reverted: {}'.format(e))
+
+    def _synthesize(self, method, params):
+        if method == 'eth_chainId':
+            return hex(CHAIN_ID)
+        if method == 'net_version':
+            return str(CHAIN_ID)
+        if method == 'eth_blockNumber':
+            return hex(self.block_number())
+        if method == 'eth_gasPrice':
+            return hex(Web3.toWei(30, 'gwei'))
+        if method == 'eth_estimateGas':
+            return hex(100_000)
+        if method == 'eth_getTransactionCount':
+            return hex(0)
+        if method == 'eth_call':
+            call = params[0]
+            if call.get('to', '').lower() != self._contract_address:
+                return '0x'
+            data = call['data']
+            handler = self._methods.get(data[:10])
+            if handler is None:
+                raise NotImplementedError(method)
+            return handler(Web3.toBytes(hexstr=data[10:]))
+        if method == 'eth_sendRawTransaction':
+            tx_hash = Web3.keccak(hexstr=params[0]).hex()
+            with self._lock:
+                self._receipts[tx_hash] = self.block_number()
+            return tx_hash
+        if method == 'eth_getTransactionReceipt':
+            return self._receipt(params[0])
+        raise NotImplementedError(method)
+
+    def _get_hero(self, args):
+        hero_id, = decode_abi(['uint256'], args)
+        data = encode_abi(hero_contract._get_hero_output_types(), [hero_to_tuple(self.synthetic_hero(hero_id))])
+        return Web3.toHex(data)
+
+    def _owner_of(self, args):
+        hero_id, = decode_abi(['uint256'], args)
+        if hero_id >= self.n_heroes and hero_id not in self.owners:
+            raise ValueError('ERC721: owner query for nonexistent token')
+        return Web3.toHex(encode_abi(['address'], [self.owner(hero_id)]))
+
+    def _get_user_heroes(self, args):
+        address, = decode_abi(['address'], args)
+        address = Web3.toChecksumAddress(address)
+        hero_ids = [hero_id for hero_id, owner in self.owners.items() if owner == address]
+        for wallet in range(self.n_wallets):
+            if self.wallet(wallet) == address:
+                hero_ids += [hero_id for hero_id in range(wallet, self.n_heroes, self.n_wallets)
+                             if hero_id not in self.owners]
+                break
+        return Web3.toHex(encode_abi(['uint256[]'], [sorted(hero_ids)]))
+
+    def _receipt(self, tx_hash):
+        block = self._receipts.get(tx_hash)
+        if block is None:
+            return None
+        return {
+            'transactionHash': tx_hash,
+            'transactionIndex': '0x0',
+            'blockHash': Web3.keccak(text=str(block)).hex(),
+            'blockNumber': hex(block),
+            'from': ZERO_ADDRESS,
+            'to': Web3.toChecksumAddress(self._contract_address),
+            'cumulativeGasUsed': hex(50_000),
+            'gasUsed': hex(50_000),
+            'contractAddress': None,
+            'logs': [],
+            'logsBloom': '0x' + '00' * 256,
+            'status': '0x1',
+        }
+
+    def wallet(self, index):
+        return Web3.toChecksumAddress(Web3.keccak(text='wallet-{}-{}'.format(self.seed, index))[-20:])
+
+    def owner(self, hero_id):
+        if hero_id in self.owners:
+            return self.owners[hero_id]
+        return self.wallet(hero_id % self.n_wallets)
+
+    def synthetic_hero(self, hero_id):
+        """Deterministic hero for a given id and seed, or an empty hero past the synthetic supply like on chain."""
+        if hero_id >= self.n_heroes:
+            return _empty_hero()
+
+        rng = random.Random(self.seed * 1_000_003 + hero_id)
+        pick = rng.choice
+        # each trait holds 4 kai digits, least significant (dominant gene) last
+        stat_digits = []
+        for choices in (hero_utils._class, hero_utils._class, hero_utils.professions, range(32), range(32),
+                        range(32), range(32), hero_utils.stats, hero_utils.stats, hero_utils.stats,
+                        hero_utils.elements, hero_utils.stats):
+            stat_digits += [pick(list(choices)) for _ in range(4)]
+        visual_digits = [pick((1, 2)) for _ in range(4)] + [rng.randrange(32) for _ in range(44)]
+
+        max_summons = pick((10, 9, 8, 7, 6, 5, 4, 3))
+        generation = rng.randint(1, 10)
+        now = int(self._started_at)
+        return {
+            'id': hero_id,
+            'summoningInfo': {
+                'summonedTime': now - rng.randrange(90 * 24 * 3600),
+                'nextSummonTime': now + rng.randrange(7 * 24 * 3600),
+                'summonerId': rng.randrange(max(hero_id, 1)),
+                'assistantId': rng.randrange(max(hero_id, 1)),
+                'summons': rng.randint(0, max_summons),
+                'maxSummons': max_summons,
+            },
+            'info': {
+                'statGenes': _genes(stat_digits),
+                'visualGenes': _genes(visual_digits),
+                'rarity': rng.choices(range(5), RARITY_WEIGHTS)[0],
+                'shiny': rng.random() < 0.02,
+                'generation': generation,
+                'firstName': rng.randrange(1000),
+                'lastName': rng.randrange(1000),
+                'shinyStyle': rng.randrange(10),
+                'class': stat_digits[3],
+                'subClass': stat_digits[7],
+            },
+            'state': {
+                'staminaFullAt': now + rng.randrange(3600),
+                'hpFullAt': 0,
+                'mpFullAt': 0,
+                'level': rng.randint(1, 10),
+                'xp': rng.randrange(2000),
+                'currentQuest': ZERO_ADDRESS,
+                'sp': 0,
+                'status': 0,
+            },
+            'stats': {k: rng.randint(5, 20) for k in ('strength', 'intelligence', 'wisdom', 'luck', 'agility',
+                                                      'vitality', 'endurance', 'dexterity')}
+            | {'hp': rng.randint(100, 200), 'mp': rng.randint(20, 60), 'stamina': 25},
+            'primaryStatGrowth': _stat_growth(rng),
+            'secondaryStatGrowth': _stat_growth(rng),
+            'professions': {k: rng.randrange(100) for k in ('mining', 'gardening', 'foraging', 'fishing')},
+        }
+
+
+def _stat_growth(rng):
+    return {k: rng.randrange(0, 8000, 250) for k in ('strength', 'intelligence', 'wisdom', 'luck', 'agility',
+                                                      'vitality', 'endurance', 'dexterity', 'hpSm', 'hpRg',
+                                                      'hpLg', 'mpSm', 'mpRg', 'mpLg')}
+
+
+def _empty_hero():
+    sections = hero_contract._function_abi('getHero')['outputs'][0]['components']
+    hero = {}
+    for section in sections:
+        if 'components' not in section:
+            hero[section['name']] = 0
+            continue
+        hero[section['name']] = {
+            field['name']: ZERO_ADDRESS if field['type'] == 'address' else False if field['type'] == 'bool' else 0
+            for field in section['components']
+        }
+    return hero
+
+
+def _result(request_id, result):
+    return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+
+def _error(request_id, code, message):
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8545)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds spent on every HTTP request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of failing each call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--heroes', type=int, default=100_000, help='synthetic hero supply')
+    parser.add_argument('--fixtures', help='fixture file to replay, or to record into with --record')
+    parser.add_argument('--record', metavar='UPSTREAM', help='proxy and record calls to this RPC url')
+    args = parser.parse_args(argv)
+
+    server = FakeRPCServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, seed=args.seed, n_heroes=args.heroes,
+                           fixtures=args.fixtures, upstream=args.record)
+    print('Serving hero contract on ' + server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
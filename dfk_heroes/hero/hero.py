@@ -1,7 +1,15 @@
-import copy
-from web3 import Web3
+import asyncio
+import functools
+import itertools
+import json
+import struct
+import threading
+
 from .utils import utils as hero_utils
 
+# web3, requests and aiohttp are imported on first use: they make up most of the import time of this
+# module and are not needed to decode or handle heroes that were already fetched
+
 CONTRACT_ADDRESS = '0x5f753dcdf9b1ad9aabc1346614d1f4746fd6ce5c'
 
 ABI = """
@@ -63,60 +71,471 @@ def block_explorer_link(txid):
     return 'https://explorer.harmony.one/tx/' + str(txid)
 
 
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 30
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_CONCURRENCY = 64
+EMPTY_HERO_ERROR = 'No such hero: getHero returned an empty hero'
+
+
+@functools.lru_cache(maxsize=None)
+def _contract_abi():
+    return json.loads(ABI)
+
+
+def _function_abi(name):
+    return next(entry for entry in _contract_abi() if entry.get('name') == name and entry['type'] == 'function')
+
+
+@functools.lru_cache(maxsize=None)
+def _contract_address():
+    from web3 import Web3
+    return Web3.toChecksumAddress(CONTRACT_ADDRESS)
+
+
+class HeroClient:
+    """Long-lived client for the hero contract on a single RPC endpoint.
+
+    The client keeps one keep-alive HTTP connection pool and one contract object built from the
+    ABI parsed once, so a single instance can be shared by every thread talking to the endpoint.
+    """
+
+    def __init__(self, rpc_address, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from web3 import Web3
+
+        self.rpc_address = rpc_address
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.w3 = Web3(Web3.HTTPProvider(rpc_address, request_kwargs={'timeout': timeout}, session=self.session))
+        self.contract = self.w3.eth.contract(_contract_address(), abi=_contract_abi())
+
+    def close(self):
+        self.session.close()
+
+    def transfer(self, hero_id, owner_private_key, owner_nonce, receiver_address, gas_price_gwei, logger):
+        """Transfer a hero from the owner to the receiver. USE AT YOUR OWN RISK !"""
+        w3 = self.w3
+        account = w3.eth.account.privateKeyToAccount(owner_private_key)
+
+        owner = self.contract.functions.ownerOf(hero_id).call()
+        logger.info("Hero's owner " + str(owner))
+
+        if owner != account.address:
+            raise Exception("Owner mismatch")
+
+        # 'from' is passed explicitly rather than through w3.eth.default_account so that the shared
+        # Web3 instance is never mutated by one caller while others are using it
+        tx = self.contract.functions.transferFrom(owner, receiver_address, hero_id).buildTransaction(
+            {'from': account.address, 'gasPrice': w3.toWei(gas_price_gwei, 'gwei'), 'nonce': owner_nonce})
+        logger.debug("Signing transaction")
+        signed_tx = w3.eth.account.sign_transaction(tx, private_key=owner_private_key)
+        logger.debug("Sending transaction " + str(tx))
+        ret = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        logger.debug("Transaction successfully sent !")
+        logger.info("Waiting for transaction " + block_explorer_link(signed_tx.hash.hex()) + " to be mined")
+        tx_receipt = w3.eth.wait_for_transaction_receipt(transaction_hash=signed_tx.hash, timeout=24 * 3600,
+                                                         poll_latency=3)
+        logger.info("Transaction mined !")
+        logger.info(str(tx_receipt))
+
+    def get_owner(self, hero_id):
+        return str(self.contract.functions.ownerOf(hero_id).call())
+
+    def get_users_heroes(self, user_address):
+        from web3 import Web3
+        return self.contract.functions.getUserHeroes(Web3.toChecksumAddress(user_address)).call()
+
+    def get_hero(self, hero_id):
+        return _parse_hero(self.contract.functions.getHero(hero_id).call())
+
+    def get_hero_fast(self, hero_id):
+        """Same result as get_hero, sent as a raw eth_call and decoded with decode_hero instead of web3's contract machinery."""
+        response = self.session.post(self.rpc_address, json=_rpc_request(0, 'eth_call', [_get_hero_call(hero_id), 'latest']),
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        if 'result' not in result:
+            raise ValueError(_rpc_error_message(result))
+        return _decode_get_hero(result['result'])
+
+    def get_heroes(self, hero_ids, batch_size=DEFAULT_BATCH_SIZE, as_records=False):
+        """Fetch many heroes, packing up to batch_size getHero calls into each JSON-RPC batch request.
+
+        Returns a (heroes, errors) pair of dicts keyed by hero id: heroes holds the same dicts as
+        get_hero (or compact Hero records when as_records is set) and errors the reason an id could
+        not be fetched, ids of heroes that do not exist (see is_empty_hero) included. A failing id or
+        batch never fails the rest of the ids.
+        """
+        import requests
+
+        heroes = {}
+        errors = {}
+        hero_ids = list(hero_ids)
+        for start in range(0, len(hero_ids), batch_size):
+            chunk = hero_ids[start:start + batch_size]
+            payload = [_rpc_request(i, 'eth_call', [_get_hero_call(hero_id), 'latest'])
+                       for i, hero_id in enumerate(chunk)]
+            try:
+                response = self.session.post(self.rpc_address, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                results = response.json()
+            except (requests.RequestException, ValueError) as e:
+                for hero_id in chunk:
+                    errors[hero_id] = str(e)
+                continue
+
+            # a node refusing the whole batch answers with a single error object instead of a list
+            if not isinstance(results, list):
+                for hero_id in chunk:
+                    errors[hero_id] = _rpc_error_message(results)
+                continue
+
+            results = {result.get('id'): result for result in results}
+            for i, hero_id in enumerate(chunk):
+                result = results.get(i)
+                if result is None:
+                    errors[hero_id] = 'Missing from batch response'
+                elif 'result' not in result:
+                    errors[hero_id] = _rpc_error_message(result)
+                else:
+                    try:
+                        raw_hero = _decode_get_hero(result['result'], as_records)
+                    except Exception as e:
+                        errors[hero_id] = 'Could not decode getHero result: ' + str(e)
+                        continue
+                    if is_empty_hero(raw_hero):
+                        errors[hero_id] = EMPTY_HERO_ERROR
+                    else:
+                        heroes[hero_id] = raw_hero
+        return heroes, errors
+
+
+class AsyncHeroClient:
+    """asyncio counterpart of HeroClient for scanning many heroes from a single process.
+
+    At most `concurrency` RPC calls are in flight at once and each call is bounded by `timeout`
+    seconds. Use it as an async context manager so the underlying aiohttp session gets closed.
+    """
+
+    def __init__(self, rpc_address, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        self.rpc_address = rpc_address
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._request_ids = itertools.count()
+        self._session = None
+
+    async def __aenter__(self):
+        import aiohttp
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _call(self, method, params):
+        import aiohttp
+        request = _rpc_request(next(self._request_ids), method, params)
+        async with self._semaphore:
+            async with self._session.post(self.rpc_address, json=request,
+                                          timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+        if 'result' not in result:
+            raise ValueError(_rpc_error_message(result))
+        return result['result']
+
+    async def get_hero(self, hero_id, as_record=False):
+        result = await self._call('eth_call', [_get_hero_call(hero_id), 'latest'])
+        return _decode_get_hero(result, as_record)
+
+    async def get_heroes(self, hero_ids, as_records=False):
+        """Fetch many heroes concurrently. Returns a (heroes, errors) pair like HeroClient.get_heroes."""
+        hero_ids = list(hero_ids)
+        results = await asyncio.gather(*[self.get_hero(hero_id, as_records) for hero_id in hero_ids],
+                                       return_exceptions=True)
+
+        heroes = {}
+        errors = {}
+        for hero_id, result in zip(hero_ids, results):
+            if isinstance(result, asyncio.TimeoutError):
+                errors[hero_id] = 'Timed out after {}s'.format(self.timeout)
+            elif isinstance(result, Exception):
+                errors[hero_id] = str(result)
+            elif is_empty_hero(result):
+                errors[hero_id] = EMPTY_HERO_ERROR
+            else:
+                heroes[hero_id] = result
+        return heroes, errors
+
+
+def is_empty_hero(raw_hero):
+    """Whether a getHero result (dict or Hero record) is the all-zero hero the contract returns for an id
+    that was never summoned, instead of an error."""
+    return raw_hero['id'] == 0
+
+
+@functools.lru_cache(maxsize=None)
+def _get_hero_selector():
+    from eth_utils import function_abi_to_4byte_selector
+    from web3 import Web3
+    return Web3.toHex(function_abi_to_4byte_selector(_function_abi('getHero')))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_hero_output_types():
+    from web3._utils.abi import get_abi_output_types
+    return get_abi_output_types(_function_abi('getHero'))
+
+
+def _get_hero_call(hero_id):
+    return {'to': _contract_address(), 'data': _get_hero_selector() + format(hero_id, '064x')}
+
+
+def _decode_get_hero(result, as_record=False):
+    data = bytes.fromhex(result[2:] if result.startswith('0x') else result)
+    return decode_hero_record(data) if as_record else decode_hero(data)
+
+
+# struct format of each ABI word of the getHero return data: every type in the Hero struct is static,
+# so the encoded tuple is a fixed sequence of 32 bytes words that can be unpacked in one call
+_WORD_FORMATS = {'uint256': '32s', 'address': '12x20s', 'bool': '31x?'}
+
+
+@functools.lru_cache(maxsize=None)
+def _hero_layout():
+    """Precompiled (struct, sections, uint256 indexes, address indexes) layout of the getHero return data."""
+    fmt = '>'
+    sections = []
+    big_ints = []
+    addresses = []
+    index = 0
+    for section in _function_abi('getHero')['outputs'][0]['components']:
+        fields = section.get('components', [section])
+        for field in fields:
+            fmt += _WORD_FORMATS.get(field['type'], '24xQ')
+            if field['type'] == 'uint256':
+                big_ints.append(index)
+            elif field['type'] == 'address':
+                addresses.append(index)
+            index += 1
+        names = tuple(field['name'] for field in fields) if 'components' in section else None
+        sections.append((section['name'], names, index - len(fields), index))
+    return struct.Struct(fmt), tuple(sections), tuple(big_ints), tuple(addresses)
+
+
+@functools.lru_cache(maxsize=1024)
+def _checksum_address(raw_address):
+    from web3 import Web3
+    return Web3.toChecksumAddress(raw_address)
+
+
+def _decode_values(data):
+    layout, _, big_ints, addresses = _hero_layout()
+    if len(data) < layout.size:
+        raise ValueError('Expected {} bytes of getHero data, got {}'.format(layout.size, len(data)))
+
+    values = list(layout.unpack_from(data))
+    for i in big_ints:
+        values[i] = int.from_bytes(values[i], 'big')
+    for i in addresses:
+        values[i] = _checksum_address(values[i])
+    return values
+
+
+def _values_to_dict(values):
+    hero = {}
+    for name, fields, start, end in _hero_layout()[1]:
+        hero[name] = values[start] if fields is None else dict(zip(fields, values[start:end]))
+    return hero
+
+
+def decode_hero(data):
+    """Decode raw getHero return data straight into the get_hero dict layout."""
+    return _values_to_dict(_decode_values(data))
+
+
+def decode_hero_record(data):
+    """Decode raw getHero return data into a compact Hero record, without building any dict."""
+    return Hero(_decode_values(data))
+
+
+@functools.lru_cache(maxsize=None)
+def _field_index(section, name):
+    for section_name, fields, start, end in _hero_layout()[1]:
+        if section_name == section:
+            return start if fields is None else start + fields.index(name)
+    raise KeyError(section)
+
+
+def _field(section, name=None):
+    index = _field_index(section, name)
+    return property(lambda self: self.values[index], doc="{}['{}']".format(section, name) if name else section)
+
+
+class Hero:
+    """Compact hero record keeping the flat getHero values in a single tuple.
+
+    Holding tens of thousands of these costs a fraction of the nested get_hero dicts. Raw fields are
+    plain attributes, the human readable views (rarity, classes, genes) are decoded on first access and
+    cached, and `hero[section]` or to_dict() export the get_hero layout for backward compatibility.
+    """
+    __slots__ = ('values', '_stat_genes', '_visual_genes')
+
+    id = _field('id')
+    summons = _field('summoningInfo', 'summons')
+    max_summons = _field('summoningInfo', 'maxSummons')
+    stat_genes_raw = _field('info', 'statGenes')
+    visual_genes_raw = _field('info', 'visualGenes')
+    rarity = _field('info', 'rarity')
+    shiny = _field('info', 'shiny')
+    generation = _field('info', 'generation')
+    main_class = _field('info', 'class')
+    sub_class = _field('info', 'subClass')
+    level = _field('state', 'level')
+    xp = _field('state', 'xp')
+
+    def __init__(self, values):
+        self.values = tuple(values)
+        self._stat_genes = None
+        self._visual_genes = None
+
+    @classmethod
+    def from_dict(cls, raw_hero):
+        values = []
+        for name, fields, _, _ in _hero_layout()[1]:
+            if fields is None:
+                values.append(raw_hero[name])
+            else:
+                values.extend(raw_hero[name][field] for field in fields)
+        return cls(values)
+
+    def to_dict(self):
+        return _values_to_dict(self.values)
+
+    def __getitem__(self, section):
+        for name, fields, start, end in _hero_layout()[1]:
+            if name == section:
+                return self.values[start] if fields is None else dict(zip(fields, self.values[start:end]))
+        raise KeyError(section)
+
+    def __eq__(self, other):
+        return isinstance(other, Hero) and self.values == other.values
+
+    def __hash__(self):
+        return hash(self.values)
+
+    def __repr__(self):
+        return 'Hero(id={}, rarity={}, class={}, generation={})'.format(
+            self.id, self.rarity_name, self.class_name, self.generation)
+
+    @property
+    def rarity_name(self):
+        return hero_utils.parse_rarity(self.rarity)
+
+    @property
+    def class_name(self):
+        return hero_utils.parse_class(self.main_class)
+
+    @property
+    def sub_class_name(self):
+        return hero_utils.parse_class(self.sub_class)
+
+    @property
+    def stat_genes(self):
+        if self._stat_genes is None:
+            self._stat_genes = hero_utils.parse_stat_genes(self.stat_genes_raw)
+        return self._stat_genes
+
+    @property
+    def visual_genes(self):
+        if self._visual_genes is None:
+            self._visual_genes = hero_utils.parse_visual_genes(self.visual_genes_raw)
+        return self._visual_genes
+
+
+def _rpc_request(request_id, method, params):
+    return {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+
+
+def _rpc_error_message(response):
+    error = response.get('error') or {}
+    return str(error.get('message', error or 'Invalid JSON-RPC response'))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(rpc_address):
+    """Return the HeroClient shared by every caller of rpc_address, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(rpc_address)
+        if client is None:
+            client = _clients[rpc_address] = HeroClient(rpc_address)
+        return client
+
+
 def transfer(hero_id, owner_private_key, owner_nonce, receiver_address, gas_price_gwei, rpc_address, logger):
     """Transfer a hero from the owner to the receiver. USE AT YOUR OWN RISK !"""
-    w3 = Web3(Web3.HTTPProvider(rpc_address))
-    account = w3.eth.account.privateKeyToAccount(owner_private_key)
-    w3.eth.default_account = account.address
+    get_client(rpc_address).transfer(hero_id, owner_private_key, owner_nonce, receiver_address, gas_price_gwei,
+                                     logger)
+
 
-    contract_address = Web3.toChecksumAddress(CONTRACT_ADDRESS)
-    contract = w3.eth.contract(contract_address, abi=ABI)
+def get_owner(hero_id, rpc_address):
+    return get_client(rpc_address).get_owner(hero_id)
 
-    owner = contract.functions.ownerOf(hero_id).call()
-    logger.info("Hero's owner " + str(owner))
 
-    if owner != account.address:
-        raise Exception("Owner mismatch")
+def get_users_heroes(user_address, rpc_address):
+    return get_client(rpc_address).get_users_heroes(user_address)
 
-    tx = contract.functions.transferFrom(owner, receiver_address, hero_id).buildTransaction(
-        {'gasPrice': w3.toWei(gas_price_gwei, 'gwei'), 'nonce': owner_nonce})
-    logger.debug("Signing transaction")
-    signed_tx = w3.eth.account.sign_transaction(tx, private_key=owner_private_key)
-    logger.debug("Sending transaction " + str(tx))
-    ret = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-    logger.debug("Transaction successfully sent !")
-    logger.info("Waiting for transaction " + block_explorer_link(signed_tx.hash.hex()) + " to be mined")
-    tx_receipt = w3.eth.wait_for_transaction_receipt(transaction_hash=signed_tx.hash, timeout=24 * 3600,
-                                                     poll_latency=3)
-    logger.info("Transaction mined !")
-    logger.info(str(tx_receipt))
 
+def get_hero(hero_id, rpc_address):
+    return get_client(rpc_address).get_hero(hero_id)
 
-def get_owner(hero_id, rpc_address):
-    w3 = Web3(Web3.HTTPProvider(rpc_address))
 
-    contract_address = Web3.toChecksumAddress(CONTRACT_ADDRESS)
-    contract = w3.eth.contract(contract_address, abi=ABI)
+def get_hero_fast(hero_id, rpc_address):
+    return get_client(rpc_address).get_hero_fast(hero_id)
 
-    return str(contract.functions.ownerOf(hero_id).call())
 
+def get_heroes(hero_ids, rpc_address, batch_size=DEFAULT_BATCH_SIZE, as_records=False):
+    """Batched get_hero, see HeroClient.get_heroes. Returns a (heroes, errors) pair of dicts keyed by hero id."""
+    return get_client(rpc_address).get_heroes(hero_ids, batch_size=batch_size, as_records=as_records)
 
-def get_users_heroes(user_address, rpc_address):
-    w3 = Web3(Web3.HTTPProvider(rpc_address))
 
-    contract_address = Web3.toChecksumAddress(CONTRACT_ADDRESS)
-    contract = w3.eth.contract(contract_address, abi=ABI)
+async def async_get_hero(hero_id, rpc_address, timeout=DEFAULT_TIMEOUT, client=None):
+    """Async get_hero, on an open AsyncHeroClient when client is given.
 
-    return contract.functions.getUserHeroes(Web3.toChecksumAddress(user_address)).call()
+    Without a client, every call opens and closes an aiohttp session of its own: for more than a
+    one-off lookup, pass a client to share its session, or fetch the ids together with async_get_heroes.
+    """
+    if client is not None:
+        return await client.get_hero(hero_id)
+    async with AsyncHeroClient(rpc_address, concurrency=1, timeout=timeout) as client:
+        return await client.get_hero(hero_id)
 
 
-def get_hero(hero_id, rpc_address):
-    w3 = Web3(Web3.HTTPProvider(rpc_address))
+async def async_get_heroes(hero_ids, rpc_address, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                           as_records=False):
+    """Concurrent get_hero, see AsyncHeroClient.get_heroes. Returns a (heroes, errors) pair of dicts keyed by hero id."""
+    async with AsyncHeroClient(rpc_address, concurrency=concurrency, timeout=timeout) as client:
+        return await client.get_heroes(hero_ids, as_records=as_records)
 
-    contract_address = Web3.toChecksumAddress(CONTRACT_ADDRESS)
-    contract = w3.eth.contract(contract_address, abi=ABI)
-    contract_entry = contract.functions.getHero(hero_id).call()
 
+def _parse_hero(contract_entry):
+    """Convert the raw getHero tuple into the nested hero dict."""
     hero = {}
     tuple_index = 0
 
@@ -235,17 +654,25 @@ def get_hero(hero_id, rpc_address):
 
 
 def human_readable_hero(raw_hero, hero_male_first_names=None, hero_female_first_names=None, hero_last_names=None):
-    readable_hero = copy.deepcopy(raw_hero)
+    if isinstance(raw_hero, Hero):
+        readable_hero = raw_hero.to_dict()
+        visual_genes = dict(raw_hero.visual_genes)
+        stat_genes = dict(raw_hero.stat_genes)
+    else:
+        # every leaf value is an immutable int, bool or str, so copying each section is enough to leave raw_hero untouched
+        readable_hero = {k: dict(v) if isinstance(v, dict) else v for k, v in raw_hero.items()}
+        visual_genes = hero_utils.parse_visual_genes(readable_hero['info']['visualGenes'])
+        stat_genes = hero_utils.parse_stat_genes(readable_hero['info']['statGenes'])
 
     readable_hero['info']['rarity'] = hero_utils.parse_rarity(readable_hero['info']['rarity'])
     readable_hero['info']['class'] = hero_utils.parse_class(readable_hero['info']['class'])
     readable_hero['info']['subClass'] = hero_utils.parse_class(readable_hero['info']['subClass'])
 
     # visualGenes
-    readable_hero['info']['visualGenes'] = hero_utils.parse_visual_genes(readable_hero['info']['visualGenes'])
+    readable_hero['info']['visualGenes'] = visual_genes
 
     # statsGenes
-    readable_hero['info']['statGenes'] = hero_utils.parse_stat_genes(readable_hero['info']['statGenes'])
+    readable_hero['info']['statGenes'] = stat_genes
 
     # names
     if readable_hero['info']['visualGenes']['gender'] == 'male':
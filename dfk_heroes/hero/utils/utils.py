@@ -1,6 +1,9 @@
 
 import json
 
+# numpy and pandas are imported by the batch helpers on first use: decoding one hero needs neither,
+# and they would make up most of the import time of hero.hero
+
 FAIL_ON_NOT_FOUND = False
 
 ALPHABET = '123456789abcdefghijkmnopqrstuvwx'
@@ -191,6 +194,76 @@ def __kai2dec(kai):
     return ALPHABET.index(kai)
 
 
+# kai digits are 5 bits each and a trait spans 4 digits, least significant (the dominant gene) last
+KAI_BITS = 5
+KAI_DIGITS = 48
+GENE_SLOTS = ('', '_r1', '_r2', '_r3')
+
+_stat_trait_values = {
+    'class': _class,
+    'subClass': _class,
+    'profession': professions,
+    'statBoost1': stats,
+    'statBoost2': stats,
+    'statsUnknown1': stats,
+    'element': elements,
+    'statsUnknown2': stats,
+}
+
+_visual_trait_values = {
+    'gender': {value: 'male' if value == 1 else 'female' for value in range(len(ALPHABET))},
+}
+
+
+def genes_to_kai_digits(genes):
+    """Vectorized __genesToKai: (n, 48) uint8 array of the kai digits of each gene, most significant first."""
+    import numpy as np
+
+    genes = list(genes)
+    n_bytes = KAI_BITS * KAI_DIGITS // 8
+    buf = b''.join(int(g).to_bytes(n_bytes, 'big') for g in genes)
+    bits = np.unpackbits(np.frombuffer(buf, dtype=np.uint8).reshape(len(genes), n_bytes), axis=1)
+    weights = (1 << np.arange(KAI_BITS - 1, -1, -1)).astype(np.uint8)
+    return bits.reshape(len(genes), KAI_DIGITS, KAI_BITS) @ weights
+
+
+def _parse_genes_batch(genes, traits, trait_values):
+    import numpy as np
+    import pandas as pd
+
+    digits = genes_to_kai_digits(genes)
+    columns = {}
+    for t, trait in traits.items():
+        values = trait_values.get(trait)
+        for slot, suffix in enumerate(GENE_SLOTS):
+            column = digits[:, 4 * t + 3 - slot]
+            if values is not None:
+                categories = list(dict.fromkeys(values[k] for k in sorted(values)))
+                codes = np.full(len(ALPHABET), -1, dtype=np.int8)
+                for k, v in values.items():
+                    if k < len(ALPHABET):
+                        codes[k] = categories.index(v)
+                column = pd.Categorical.from_codes(codes[column], categories)
+            columns[trait + suffix] = column
+    return pd.DataFrame(columns)
+
+
+def parse_stat_genes_batch(genes):
+    """Vectorized parse_stat_genes over many gene integers.
+
+    Returns a DataFrame with a row per gene and, for every stat trait, a column holding the dominant
+    gene (named like the parse_stat_genes keys) plus '_r1', '_r2' and '_r3' columns for the recessives.
+    Traits parse_stat_genes names (class, profession, stat boosts, element) are categoricals, NaN where
+    it returns None; the others are the raw kai values.
+    """
+    return _parse_genes_batch(genes, stat_traits, _stat_trait_values)
+
+
+def parse_visual_genes_batch(genes):
+    """Vectorized parse_visual_genes, laid out like parse_stat_genes_batch."""
+    return _parse_genes_batch(genes, visual_traits, _visual_trait_values)
+
+
 def parse_names(names_raw_string):
     names_raw_string = names_raw_string\
         .replace("\\xf3", "ó") \
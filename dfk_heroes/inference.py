@@ -0,0 +1,166 @@
+"""Inference side of the price model: the pipeline transformers and a predict entry point.
+
+Only what serving a prediction needs is imported here; the training stack (t-SNE, scipy) stays
+in model.py, which reuses these transformers.
+"""
+import datetime
+import os
+import threading
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import TransformerMixin, BaseEstimator
+
+MODEL_PATH = os.path.join(Path(__file__).parent, 'data/model.joblib')
+
+
+def with_columns(X, new, drop=()):
+    """X with the columns in new set (in place, or appended) and those in drop removed, as a new frame.
+
+    The frame is assembled from X's own column arrays rather than copies of them, and X itself is left
+    untouched, so transformers built on it need no defensive copy of their input. The result shares
+    data with X: modify it in place only after copying it.
+    """
+    columns = {c: new.get(c, X[c]) for c in X.columns if c not in drop}
+    columns.update(new)
+    return pd.DataFrame(columns, index=X.index, copy=False)
+
+
+class DateFeaturesExtractor(TransformerMixin, BaseEstimator): 
+    def __init__(self):
+        pass
+
+    def fit(self, X, y=None):
+        return self
+    
+    def transform(self, X, y=None):
+        tmp = pd.to_datetime(X['timeStamp'])
+        return with_columns(X, {'buyWeekDay': tmp.dt.weekday, 'buyHour': tmp.dt.hour}, drop=['timeStamp'])
+
+    
+class ClassRankExtractor(TransformerMixin, BaseEstimator): 
+    def __init__(self):
+        pass
+
+    def fit(self, X, y=None):
+        basic = {k: 'Basic' for k in ['Priest', 'Warrior', 'Knight', 'Archer', 'Thief', 'Pirate', 'Monk', 'Wizard']}
+        advanced = {k: 'Advanced' for k in ['Paladin', 'DarkKnight', 'Ninja', 'Summoner']}
+        elite = {k: 'Elite' for k in ['Dragoon', 'Sage']}
+        exalted = {'DreadKnight' : 'Exalted'}
+        
+        self.mapping = basic | advanced | elite | exalted
+        
+        return self
+    
+    def transform(self, X, y=None):
+        return with_columns(X, {'classRank': X['mainClass'].map(self.mapping)})
+    
+    
+class ToCategory(TransformerMixin, BaseEstimator):
+    def __init__(self):
+        pass
+
+    def fit(self, X, y=None):
+        self.types = {k: 'category' for k in X.select_dtypes(include=['object', 'category']).columns}
+        return self
+    
+    def transform(self, X, y=None):  
+        # only the columns that are not categorical yet are converted; the others are passed through
+        return with_columns(X, {k: X[k].astype(t) for k, t in self.types.items()
+                                if not isinstance(X[k].dtype, pd.CategoricalDtype)})
+
+
+def load_pipeline(path=MODEL_PATH):
+    return joblib.load(path)
+
+
+def predict(pipe, hero):
+    """Transform feature rows built by utils.hero_to_feature and predict their price.
+
+    Returns the transformed features, as fed to the model and its explainer, and the predictions.
+    """
+    feature = pipe[:-1].transform(hero)
+    return feature, pipe[-1].predict(feature)
+
+
+class RowPredictor:
+    """Pandas-free predictor for one hero at a time.
+
+    Mirrors pipe[:-1].transform on a plain feature record (the dict utils.hero_to_record returns) and
+    writes it into a preallocated float row with the category codes LightGBM froze at fit time, so the
+    booster is fed directly. Categories unseen at fit time are encoded as missing, as LightGBM does.
+    """
+
+    def __init__(self, pipe):
+        self._init(pipe[-1].booster_, pipe.named_steps['tocategory'].types,
+                   pipe.named_steps['classrankextractor'].mapping)
+
+    @classmethod
+    def from_booster(cls, booster, category_types, class_rank):
+        """A predictor from a booster and the fitted ToCategory types and ClassRankExtractor mapping."""
+        predictor = cls.__new__(cls)
+        predictor._init(booster, category_types, class_rank)
+        return predictor
+
+    def _init(self, booster, category_types, class_rank):
+        self.booster = booster
+        self.feature_names = self.booster.feature_name()
+        categorical = [name for name in self.feature_names if name in category_types]
+        self.codes = {name: {value: float(code) for code, value in enumerate(categories)}
+                      for name, categories in zip(categorical, self.booster.pandas_categorical)}
+        self.class_rank = class_rank
+        self._local = threading.local()
+
+    def features(self, record):
+        """Model inputs of a record in model order, the values pipe[:-1].transform would produce."""
+        timestamp = record['timeStamp']
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.fromisoformat(timestamp)
+        derived = {
+            'buyWeekDay': timestamp.weekday(),
+            'buyHour': timestamp.hour,
+            'classRank': self.class_rank.get(record['mainClass'], np.nan),
+        }
+        return {name: derived[name] if name in derived else record[name] for name in self.feature_names}
+
+    def encode(self, features):
+        """Write model inputs into this thread's (1, n_features) row; it is overwritten by the next call."""
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty((1, len(self.feature_names)))
+        for i, name in enumerate(self.feature_names):
+            value = features[name]
+            if name in self.codes:
+                row[0, i] = self.codes[name].get(value, np.nan)
+            else:
+                row[0, i] = np.nan if value is None else value
+        return row
+
+    def encode_frame(self, records):
+        """encode for every row of a frame of records (such as the sales), as a new (n_rows, n_features) array."""
+        timestamp = pd.to_datetime(records['timeStamp'])
+        derived = {
+            'buyWeekDay': timestamp.dt.weekday,
+            'buyHour': timestamp.dt.hour,
+            'classRank': pd.Series(records['mainClass'].to_numpy(dtype=object)).map(self.class_rank),
+        }
+        X = np.empty((len(records), len(self.feature_names)))
+        for i, name in enumerate(self.feature_names):
+            column = derived[name] if name in derived else records[name]
+            if name in self.codes:
+                column = pd.Series(column.to_numpy(dtype=object)).map(self.codes[name])
+            X[:, i] = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        return X
+
+    def predict(self, record):
+        """Predicted price of one record, with its model inputs and encoded row."""
+        features = self.features(record)
+        row = self.encode(features)
+        return features, row, self.booster.predict(row)[0]
+
+    def contributions(self, row):
+        """SHAP values of an encoded row and the expected value, straight from LightGBM's TreeSHAP."""
+        contrib = self.booster.predict(row, pred_contrib=True)
+        return contrib[:, :-1], contrib[0, -1]
@@ -1,10 +1,9 @@
-from sklearn.base import TransformerMixin, BaseEstimator
-from sklearn.pipeline import make_pipeline
+from sklearn.base import clone
+from sklearn.metrics import mean_absolute_error
+from sklearn.pipeline import Pipeline, make_pipeline
 from sklearn.model_selection import train_test_split
-from sklearn.manifold import TSNE
 
 from scipy import stats
-import shap
 from lightgbm import LGBMRegressor
 
 import pandas as pd
@@ -14,68 +13,51 @@ import numpy as np
 import joblib
 from pathlib import Path
 
+import argparse
+import json
 import os
+import time
 import warnings
+
+import bundle
+import comparables
+import dataset
+import embedding
+import explainers
+from inference import MODEL_PATH, DateFeaturesExtractor, ClassRankExtractor, RowPredictor, ToCategory
+from flat_forest import FlatForest
 warnings.filterwarnings("ignore")
 
-class DateFeaturesExtractor(TransformerMixin, BaseEstimator): 
-    def __init__(self):
-        pass
+BEST_PARAMS_PATH = os.path.join(Path(__file__).parent, 'data/best_params.json')
+# rounds without improvement on the validation set before boosting stops
+EARLY_STOPPING_ROUNDS = 100
 
-    def fit(self, X, y=None):
-        return self
-    
-    def transform(self, X, y=None):
-        tmp = pd.to_datetime(X['timeStamp'])
-        X['buyWeekDay'] = tmp.dt.weekday
-        X['buyHour'] = tmp.dt.hour
-        X = X.drop(columns=['timeStamp'])
-        return X
 
-    
-class ClassRankExtractor(TransformerMixin, BaseEstimator): 
-    def __init__(self):
-        pass
-
-    def fit(self, X, y=None):
-        basic = {k: 'Basic' for k in ['Priest', 'Warrior', 'Knight', 'Archer', 'Thief', 'Pirate', 'Monk', 'Wizard']}
-        advanced = {k: 'Advanced' for k in ['Paladin', 'DarkKnight', 'Ninja', 'Summoner']}
-        elite = {k: 'Elite' for k in ['Dragoon', 'Sage']}
-        exalted = {'DreadKnight' : 'Exalted'}
-        
-        self.mapping = basic | advanced | elite | exalted
-        
-        return self
-    
-    def transform(self, X, y=None):
-        X['classRank'] = X['mainClass'].map(self.mapping)
-        return X
-    
-    
-class ToCategory(TransformerMixin, BaseEstimator):
-    def __init__(self):
-        pass
+HYPER_PARAMETER = {
+    'objective': 'regression_l1',
+    'metric': ['l2','l1'],
+    'boosting': 'gbdt',
+    'min_data_in_leaf':20,
+    'verbose': 1,
+    'learning_rate': 0.03,   
+    'num_boost_round': 2_000,
+    'early_stopping_rounds': EARLY_STOPPING_ROUNDS,
+    'verbose_eval': 500
+}
 
-    def fit(self, X, y=None):
-        self.types = {k: 'category' for k in X.select_dtypes(include=['object', 'category']).columns}
-        return self
-    
-    def transform(self, X, y=None):  
-        return X.astype(self.types)
-    
 
-def train(X_train, X_test, y_train, y_test): 
-    hyper_parameter = {
-        'objective': 'regression_l1',
-        'metric': ['l2','l1'],
-        'boosting': 'gbdt',
-        'min_data_in_leaf':20,
-        'verbose': 1,
-        'learning_rate': 0.03,   
-        'num_boost_round': 2_000,
-        'early_stopping_rounds': 2000,
-        'verbose_eval': 500
-    }
+def load_best_params(path=BEST_PARAMS_PATH):
+    """Hyperparameters picked by tuning.py."""
+    with open(path) as f:
+        return json.load(f)['params']
+
+
+def train(X_train, X_valid, y_train, y_valid, params=None): 
+    """
+    Fits the pipeline, boosting until (X_valid, y_valid) stops improving. params, e.g. the ones
+    tuning.py wrote (see load_best_params), override HYPER_PARAMETER.
+    """
+    hyper_parameter = {**HYPER_PARAMETER, **(params or {})}
     
     pipe = make_pipeline(
         DateFeaturesExtractor(),
@@ -84,15 +66,98 @@ def train(X_train, X_test, y_train, y_test):
         LGBMRegressor(**hyper_parameter)
     )
     
-    X_train_transformed = pipe[:-1].fit_transform(X_train.copy(deep=True))
-    X_test_transformed = pipe[:-1].transform(X_test.copy(deep=True))
+    X_train_transformed = pipe[:-1].fit_transform(X_train)
+    X_valid_transformed = pipe[:-1].transform(X_valid)
     
     cat_features = list(X_train_transformed.columns[X_train_transformed.dtypes=="category"])
     print(X_train_transformed.columns)
-    pipe[-1].fit(X_train_transformed, y_train, eval_set=(X_test_transformed, y_test), categorical_feature=cat_features)
+    pipe[-1].fit(X_train_transformed, y_train, eval_set=(X_valid_transformed, y_valid), categorical_feature=cat_features)
     return pipe
 
 
+def train_incremental(pipe, X_train, X_valid, y_train, y_valid, num_boost_round=200,
+                      early_stopping_rounds=EARLY_STOPPING_ROUNDS):
+    """
+    Continues boosting a fitted pipeline on new sales (LightGBM init_model) and returns the new pipeline.
+
+    Boosting stops early on (X_valid, y_valid), which must not be the data the result is judged on.
+    The fitted transformers are reused as is and categorical columns are pinned to the categories the
+    booster was fitted with, so that codes keep their meaning; values it never saw are treated as missing
+    until the next full retrain. pipe is left untouched.
+    """
+    booster = pipe[-1].booster_
+    X_train_transformed = with_categories(pipe[:-1].transform(X_train), booster.pandas_categorical)
+    X_valid_transformed = with_categories(pipe[:-1].transform(X_valid), booster.pandas_categorical)
+
+    estimator = clone(pipe[-1]).set_params(num_boost_round=num_boost_round, early_stopping_rounds=early_stopping_rounds)
+    cat_features = list(X_train_transformed.columns[X_train_transformed.dtypes=="category"])
+    estimator.fit(X_train_transformed, y_train, eval_set=(X_valid_transformed, y_valid), categorical_feature=cat_features,
+                  init_model=booster)
+    return Pipeline(pipe.steps[:-1] + [(pipe.steps[-1][0], estimator)])
+
+
+def with_categories(feature, pandas_categorical):
+    """Sets the categories of the categorical columns of feature, in order, to a booster's pandas_categorical."""
+    categorical = feature.columns[feature.dtypes=="category"]
+    return feature.assign(**{c: pd.Categorical(feature[c], categories=categories)
+                             for c, categories in zip(categorical, pandas_categorical)})
+
+
+def sales_window(df, days):
+    """Sales of the last `days` days before the most recent one."""
+    timestamp = pd.to_datetime(df['timeStamp'])
+    return df[timestamp > timestamp.max() - pd.Timedelta(days=days)]
+
+
+def save_pipeline(pipe, path=MODEL_PATH):
+    """Writes the pipeline and its flattened forest next to it, replacing the previous ones atomically."""
+    tmp_path = f'{path}.tmp'
+    joblib.dump(pipe, tmp_path)
+    os.replace(tmp_path, path)
+    FlatForest.from_booster(pipe[-1].booster_).save()
+
+
+def update(path=MODEL_PATH, window_days=1, holdout=0.2, validation=0.2, num_boost_round=200,
+           models_dir=bundle.MODELS_DIR):
+    """
+    Incremental retrain: boosts the saved model further on the newest sales window and promotes the
+    result only if it does not regress on the most recent sales of the window, held out from training.
+    The sales just before the holdout (a validation fraction of the rest) pick the number of rounds, so
+    that the holdout judges both models on sales neither was tuned on.
+    A promoted model is also published as a new bundle version, which a running app swaps in, with the
+    sales made since the last one appended to the comparable-sales index.
+    """
+    sales = dataset.load_sales()
+    df = sales.pipe(remove_outlier).pipe(sales_window, window_days)
+    X, y = to_x_y(df.sort_values('timeStamp'))
+    X_rest, X_test, y_rest, y_test = train_test_split(X, y, test_size=holdout, shuffle=False)
+    X_train, X_valid, y_train, y_valid = train_test_split(X_rest, y_rest, test_size=validation, shuffle=False)
+
+    pipe = joblib.load(path)
+    start = time.perf_counter()
+    candidate = train_incremental(pipe, X_train, X_valid, y_train, y_valid, num_boost_round)
+    training_time = time.perf_counter() - start
+
+    current_mae = mean_absolute_error(y_test, pipe.predict(X_test))
+    candidate_mae = mean_absolute_error(y_test, candidate.predict(X_test))
+    promoted = candidate_mae <= current_mae
+    print(f'{len(X_train)} new sales, {len(X_valid)} for early stopping, {len(X_test)} held out, '
+          f'trained in {training_time:.2f}s: '
+          f'holdout MAE {current_mae:.3f} -> {candidate_mae:.3f}, '
+          f'{"promoted" if promoted else "kept the current model"}')
+    if promoted:
+        save_pipeline(candidate, path)
+        comparables_index = bundle.read_comparables()
+        if comparables_index is not None:
+            # the categories are pinned, so the rows indexed so far keep their encoding
+            comparables_index.add_sales(RowPredictor(candidate), sales[sales['timeStamp'] > comparables_index.latest])
+            comparables_index.save()
+        # the frames and the map projection stay those of the last full training
+        bundle.publish(candidate, bundle.read_frames(), models_dir, projection=bundle.read_projection(),
+                       comparables_index=comparables_index)
+    return promoted
+
+
 def remove_outlier(df):
     """
     Removes outliers that have a serious impact on the model
@@ -104,13 +169,17 @@ def to_x_y(df):
     return df.drop(columns=['soldPrice']), df['soldPrice']
 
 
-def save_tsne(df_cv, y_test,  shap_values, pipe):
+def save_tsne(df_cv, y_test,  shap_values, pipe, max_fit=embedding.DEFAULT_MAX_FIT):
+    """
+    Writes the cross-validation frame with its t-SNE map coordinates, and the projection placing new
+    heroes on that map, which it returns. t-SNE is fit on at most max_fit sales, the rest are projected.
+    """
     # Easy segmentation
     n_quant = 5
 
 
     df_cv['predictedSoldPrice'] = pipe[-1].predict(df_cv)
-    shap_embedded = TSNE(n_components=2, perplexity=25,random_state=34).fit_transform(shap_values)
+    shap_embedded, projection = embedding.fit_embedding(shap_values, max_fit=max_fit)
     df_cv['t-SNE-1'] = shap_embedded[:,0]
     df_cv['t-SNE-2'] = shap_embedded[:,1]
     df_cv = df_cv.merge(y_test, left_index=True, right_index=True)
@@ -118,6 +187,8 @@ def save_tsne(df_cv, y_test,  shap_values, pipe):
     df_cv['Predicted soldPrice (Quantile)'] = pd.qcut(df_cv.predictedSoldPrice, n_quant, labels=['Bottom 20%','Middle 20% to 40%','Middle 40% to 60%','Middle 60% to 80%', 'Top 20%'])
     
     df_cv.to_csv(os.path.join(Path(__file__).parent, 'data/cross_validation.csv'))
+    projection.save()
+    return projection
 
 
 def save_mean_shap_values(df_cv, shap_values):
@@ -132,21 +203,47 @@ def save_mean_shap_values(df_cv, shap_values):
     )
 
 if __name__ == "__main__":
-    
+    parser = argparse.ArgumentParser(description='Train the hero price model.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='boost the saved model further on the newest sales instead of retraining from scratch')
+    parser.add_argument('--window-days', type=float, default=1, help='days of newest sales used by --incremental')
+    parser.add_argument('--rounds', type=int, default=200, help='boosting rounds added by --incremental')
+    parser.add_argument('--explainer', choices=list(explainers.BACKENDS), default=explainers.DEFAULT_BACKEND,
+                        help='backend computing the SHAP values of the test split')
+    parser.add_argument('--tsne-max-fit', type=int, default=embedding.DEFAULT_MAX_FIT,
+                        help='sales t-SNE is fit on at most, the others are projected onto its map')
+    parser.add_argument('--params', metavar='PATH',
+                        help='hyperparameters written by tuning.py overriding the defaults, e.g. dfk_heroes/data/best_params.json')
+    args = parser.parse_args()
+
+    if args.incremental:
+        update(window_days=args.window_days, num_boost_round=args.rounds)
+        raise SystemExit
+
+    sales = dataset.load_sales()
     df = (
-        pd.read_csv(os.path.join(Path(__file__).parent, 'data/tavern_data.csv'), decimal=',')
+        sales
         .pipe(remove_outlier)
     )
     X, y = to_x_y(df)
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)    
-    pipe = train(X_train, X_test, y_train, y_test)
+    # early stopping looks at the same validation split as tuning.py, never at the test split
+    X_fit, X_valid, y_fit, y_valid = train_test_split(X_train, y_train, test_size=0.2, random_state=0)
+    start = time.perf_counter()
+    pipe = train(X_fit, X_valid, y_fit, y_valid, load_best_params(args.params) if args.params else None)
+    print(f'trained in {time.perf_counter() - start:.2f}s')
     
-    joblib.dump(pipe, os.path.join(Path(__file__).parent, 'data/model.joblib'))
+    save_pipeline(pipe)
     
-    df_cv = pipe[:-1].transform(X_test.copy(deep=True))
+    df_cv = pipe[:-1].transform(X_test)
     # compute SHAP values
-    explainer = shap.TreeExplainer(pipe[-1])
-    joblib.dump(explainer, os.path.join(Path(__file__).parent, 'data/explainer.joblib'))
-    shap_values = explainer.shap_values(df_cv)
-    save_tsne(df_cv.copy(deep=True), y_test,  shap_values, pipe)
+    start = time.perf_counter()
+    shap_values, _ = explainers.explain_batch(pipe[-1].booster_, df_cv, backend=args.explainer)
+    print(f'explained {len(df_cv)} sales in {time.perf_counter() - start:.2f}s')
+    projection = save_tsne(df_cv.copy(deep=True), y_test,  shap_values, pipe, args.tsne_max_fit)
     save_mean_shap_values(df_cv, shap_values)
+    # every sale is a comparable, outliers included
+    comparables_index = comparables.ComparablesIndex.from_sales(RowPredictor(pipe), sales)
+    comparables_index.save()
+    print(f'published model version '
+          f'{bundle.publish(pipe, bundle.read_frames(), projection=projection, comparables_index=comparables_index)}')
@@ -1,99 +1,60 @@
 import altair as alt
+import numpy as np
 import pandas as pd
 
+import chart_data
 
-def advanced_analytics(df_cv, width=500, height=250):
-
-    brush = alt.selection(type='interval',resolve='global')
-
-    points = alt.Chart(df_cv).mark_point().encode(
-        x='t-SNE-1',
-        y='t-SNE-2',
-        color=alt.Color('Predicted soldPrice (Quantile)',scale=alt.Scale(scheme='redyellowgreen'))
-    ).add_selection(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
 
+def advanced_analytics(df_cv, width=500, height=250, max_points=chart_data.MAX_POINTS):
+    """The t-SNE map of the sales and the bar charts it brushes (see mark_hero to place a hero on it).
 
-    bars_quantile = alt.Chart(df_cv).mark_bar().encode(
-        y='Predicted soldPrice (Quantile)',
-        color=alt.Color('Predicted soldPrice (Quantile)'),
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
-
-    bars_profession = alt.Chart(df_cv).mark_bar().encode(
-        y='profession',
-        color='Predicted soldPrice (Quantile)',
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
+    Beyond max_points sales, the map is a density plot of its grid cells (see chart_data.map_frames).
+    """
+    frames = chart_data.map_frames(df_cv, max_points)
+    binned = len(df_cv) > max_points
 
-    bars_rarity = alt.Chart(df_cv).mark_bar().encode(
-        y='rarity',
-        color='Predicted soldPrice (Quantile)',
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
-
-    bars_mainclass = alt.Chart(df_cv).mark_bar().encode(
-        y='mainClass',
-        color='Predicted soldPrice (Quantile)',
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
+    brush = alt.selection(type='interval',resolve='global')
 
-    bars_generation = alt.Chart(df_cv).mark_bar().encode(
-        y='generation',
-        color='Predicted soldPrice (Quantile)',
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
+    color = alt.Color('Predicted soldPrice (Quantile)',scale=alt.Scale(scheme='redyellowgreen'))
+    if binned:
+        points = alt.Chart(frames['map']).mark_square().encode(
+            x='t-SNE-1',
+            y='t-SNE-2',
+            color=color,
+            size=alt.Size('count', title='sales'),
+        )
+    else:
+        points = alt.Chart(frames['map']).mark_point().encode(
+            x='t-SNE-1',
+            y='t-SNE-2',
+            color=color
+        )
+    points = points.add_selection(
         brush
     ).properties(
             width=width,
             height=height
     )
 
-    bars_summons = alt.Chart(df_cv).mark_bar().encode(
-        y='summons',
-        color='Predicted soldPrice (Quantile)',
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
+    def bars(column, color='Predicted soldPrice (Quantile)'):
+        return alt.Chart(frames[column]).mark_bar().encode(
+            y=column,
+            color=color,
+            x=alt.X('sum(count)', title='count')
+        ).transform_filter(
+            brush
+        ).properties(
+                width=width,
+                height=height
+        )
 
-    bars_buyhour = alt.Chart(df_cv).mark_bar().encode(
-        y='buyHour',
-        color='Predicted soldPrice (Quantile)',
-        x='count(Predicted soldPrice (Quantile))'
-    ).transform_filter(
-        brush
-    ).properties(
-            width=width,
-            height=height
-    )
+    bars_quantile = bars('Predicted soldPrice (Quantile)', color=alt.Color('Predicted soldPrice (Quantile)'))
+    bars_profession = bars('profession')
+    bars_rarity = bars('rarity')
+    bars_mainclass = bars('mainClass')
+    bars_generation = bars('generation')
+    bars_summons = bars('summons')
+    bars_buyhour = bars('buyHour')
     
     return (
         (points & bars_quantile & bars_profession & bars_rarity & bars_mainclass & bars_generation & bars_summons & bars_buyhour)
@@ -113,17 +74,31 @@ def advanced_analytics(df_cv, width=500, height=250):
     )
     
     
+def mark_hero(spec, hero):
+    """The spec of advanced_analytics with a hero's (t-SNE-1, t-SNE-2) position marked on the map.
+
+    Only the map is layered with the marker, the spec (e.g. chart_data.cached_spec's) is not copied.
+    """
+    points = {k: v for k, v in spec['vconcat'][0].items() if k not in ('width', 'height')}
+    marker = {
+        'data': {'values': [{'t-SNE-1': float(hero[0]), 't-SNE-2': float(hero[1])}]},
+        'mark': {'type': 'point', 'shape': 'diamond', 'size': 300, 'filled': True, 'color': '#FBE375',
+                 'stroke': 'white'},
+        'encoding': {'x': {'field': 't-SNE-1', 'type': 'quantitative'},
+                     'y': {'field': 't-SNE-2', 'type': 'quantitative'}},
+    }
+    layer = {'layer': [points, marker], 'width': spec['vconcat'][0]['width'], 'height': spec['vconcat'][0]['height']}
+    return {**spec, 'vconcat': [layer] + spec['vconcat'][1:]}
+
+
 def price_distribution(df_cv, avg_price, width=500):
     line = pd.DataFrame({
         'X': [avg_price, avg_price],
         'Y':  [0, 0.02],
     })
 
-    price_plot = alt.Chart(df_cv).transform_density(
-        'soldPrice',
-        as_=['soldPrice', 'Density'],
-        steps=300
-    ).mark_area(opacity=0.93, color='#19c558').encode(
+    # the density is estimated here rather than by a transform_density over every price in the browser
+    price_plot = alt.Chart(chart_data.price_density(df_cv['soldPrice'])).mark_area(opacity=0.93, color='#19c558').encode(
         x="soldPrice:Q",
         y='Density:Q',
     )
@@ -162,4 +137,74 @@ def price_explanation(df_imp, width=500):
         padding=10,
         cornerRadius=10,
     )
-    return chart
\ No newline at end of file
+    return chart
+    
+def sale_timing(slots, width=500):
+    """Heatmap of a hero's predicted price by weekday and hour of sale (sale_timing.slot_prices)."""
+    return alt.Chart(slots).mark_rect().encode(
+        x=alt.X('buyHour:O', title='hour (EST)'),
+        y=alt.Y('weekday:O', sort=list(slots.drop_duplicates('buyWeekDay')['weekday']), title=None),
+        color=alt.Color('price:Q', scale=alt.Scale(scheme='redyellowgreen'), title='JEWEL'),
+        tooltip=['weekday', 'buyHour', alt.Tooltip('price:Q', format='.2f')]
+    ).properties(
+            width=width,
+            height=200
+    ).configure(
+        background='#100f21'
+    ).configure_axis(
+        labelColor='white',
+        titleColor='white'
+    ).configure_legend(
+        labelColor='white',
+        titleColor='white'
+    )
+
+
+def waterfall(expected_value, shap_row, features, max_display=10, width=500):
+    """custom_shap's waterfall as a Vega-Lite chart, drawn by the browser: no matplotlib render.
+
+    The max_display - 1 largest SHAP values are shown one by one, the others summed, each bar going
+    from the price before that feature to the price after it.
+    """
+    names = list(features)
+    order = np.argsort(-np.abs(shap_row))
+    shown = order[:max_display - 1] if len(order) > max_display else order
+    labels = [f'{features[names[i]]} = {names[i]}' for i in shown]
+    impacts = [float(shap_row[i]) for i in shown]
+    if len(shown) < len(order):
+        labels.append(f'{len(order) - len(shown)} other features')
+        impacts.append(float(np.sum(shap_row[order[len(shown):]])))
+
+    # from the bottom (the average price) up to the top bar (the predicted price)
+    end = float(expected_value) + np.cumsum(impacts[::-1])
+    # text columns have the string dtype: altair sanitizes object columns with an apply pandas 2.1
+    # warns about
+    bars = pd.DataFrame({
+        'feature': pd.array(labels[::-1], dtype='string'),
+        'start': end - impacts[::-1],
+        'end': end,
+        'impact': impacts[::-1],
+    })
+    bars['label'] = bars['impact'].map('{:+.2f}'.format).astype('string')
+    chart = alt.Chart(bars).encode(
+        y=alt.Y('feature:N', sort=labels, title=None),
+    )
+    return (
+        chart.mark_bar().encode(
+            x=alt.X('start:Q', title='JEWEL', scale=alt.Scale(zero=False)),
+            x2='end:Q',
+            color=alt.condition('datum.impact >= 0', alt.value('#19c558'), alt.value('#ff0051')),
+            tooltip=['feature', alt.Tooltip('impact:Q', format='+.2f')],
+        ) + chart.mark_text(color='white').encode(
+            x=alt.X('mid:Q'),
+            text='label',
+        ).transform_calculate(mid='(datum.start + datum.end) / 2')
+    ).properties(
+            width=width,
+            height=30 * len(bars)
+    ).configure(
+        background='#100f21'
+    ).configure_axis(
+        labelColor='white',
+        titleColor='white'
+    )
@@ -0,0 +1,55 @@
+"""A bounded LRU cache of predictions and their explanations, keyed by the encoded model input row.
+
+Two lookups that encode to the same row (RowPredictor.encode) get the same price, SHAP values and
+explanation text, so those are computed once per row and model version. The cache is thread safe,
+so a single instance can be shared by every Streamlit session. The version is part of the key: while
+a new model is swapped in, requests served with the old and the new one do not evict each other's
+entries, and those of a retired version age out like any other.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+DEFAULT_MAXSIZE = 10_000
+
+# map_position: where the hero lands on the t-SNE map (embedding.Projection), None without a projection
+Explanation = namedtuple('Explanation', ['price', 'shap_values', 'text', 'map_position'])
+
+
+class PredictionCache:
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, row, compute):
+        """The cached value for row under model version, or compute() stored as such.
+
+        compute runs outside the lock, so concurrent misses on one row may both compute it.
+        """
+        key = (version, row.tobytes())
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
@@ -0,0 +1,76 @@
+"""When to list a hero: its predicted price at every weekday and hour of sale, scored in one batch.
+
+The model sees the sale time only through buyWeekDay and buyHour, so the 7 x 24 variants of a hero
+differ in those two inputs alone. They are scored together from the hero's encoded row
+(RowPredictor.encode): with the flattened forest, every tree is walked once for the whole grid (see
+FlatForest.predict_grid); without it, the 168 rows go to the booster in a single predict call. The
+listing windows are explained from that grid alone, by the average price of their weekday and of
+their hour, so they cost no more than the grid.
+"""
+import numpy as np
+import pandas as pd
+
+import utils
+
+N_WEEKDAYS, N_HOURS = 7, 24
+
+
+def slot_rows(predictor, features, weekdays=None, hours=None):
+    """Encoded rows of a hero (RowPredictor.features) sold at the given weekdays and hours.
+
+    Default: all 168 slots, Monday 0:00 first.
+    """
+    if weekdays is None:
+        weekdays, hours = np.repeat(np.arange(N_WEEKDAYS), N_HOURS), np.tile(np.arange(N_HOURS), N_WEEKDAYS)
+    rows = np.repeat(predictor.encode(features), len(weekdays), axis=0)
+    rows[:, predictor.feature_names.index('buyWeekDay')] = weekdays
+    rows[:, predictor.feature_names.index('buyHour')] = hours
+    return rows
+
+
+def slot_prices(predictor, features, forest=None):
+    """Predicted price of a hero for each of the 168 sale slots (EST, like hero_to_record's timeStamp).
+
+    Columns: buyWeekDay, weekday (its name), buyHour and price. forest is the model's FlatForest
+    (e.g. bundle.Bundle.forest), which scores the slots much faster than the booster.
+    """
+    weekday = np.repeat(np.arange(N_WEEKDAYS), N_HOURS)
+    if forest is None:
+        price = predictor.booster.predict(slot_rows(predictor, features))
+    else:
+        price = forest.predict_grid(predictor.encode(features)[0],
+                                    predictor.feature_names.index('buyWeekDay'), N_WEEKDAYS,
+                                    predictor.feature_names.index('buyHour'), N_HOURS).ravel()
+    return pd.DataFrame({
+        'buyWeekDay': weekday,
+        'weekday': pd.Series(weekday).map(utils.WEEKDAYS),
+        'buyHour': np.tile(np.arange(N_HOURS), N_WEEKDAYS),
+        'price': price,
+    })
+
+
+def listing_windows(predictor, features, n=3, forest=None):
+    """The n best and n worst sale slots of a hero, and the prices of all of them (see slot_prices).
+
+    Windows have the weekday name, the hour and the predicted price, with:
+        vs_average          that price minus the hero's average price over all 168 slots
+        weekday_vs_average  the average of the grid's 24 prices on that weekday minus the average of all slots
+        hour_vs_average     the average of the grid's 7 prices at that hour minus the average of all slots
+    Those last two are grid averages, not SHAP values.
+    """
+    slots = slot_prices(predictor, features, forest)
+    grid = slots['price'].to_numpy().reshape(N_WEEKDAYS, N_HOURS)
+    average = grid.mean()
+    order = np.argsort(-slots['price'].to_numpy(), kind='stable')
+    picked = slots.iloc[np.concatenate([order[:n], order[::-1][:n]])]
+
+    weekdays, hours = picked['buyWeekDay'].to_numpy(), picked['buyHour'].to_numpy()
+    windows = pd.DataFrame({
+        'weekday': picked['weekday'].to_numpy(),
+        'hour': hours,
+        'price': picked['price'].to_numpy(),
+        'vs_average': picked['price'].to_numpy() - average,
+        'weekday_vs_average': grid.mean(axis=1)[weekdays] - average,
+        'hour_vs_average': grid.mean(axis=0)[hours] - average,
+    })
+    return windows.iloc[:n].reset_index(drop=True), windows.iloc[n:].reset_index(drop=True), slots
@@ -0,0 +1,190 @@
+"""Hyperparameter search for the price model, run across a pool of worker processes.
+
+Every trial boosts with early stopping on a validation split carved out of the training sales, so the
+test split model.py reports on is never looked at. The training split is binned once, straight from
+the memory-mapped sales store, into a cached LightGBM binary Dataset (see dataset.out_of_core_dataset)
+that every worker loads, instead of each fit binning it again; the sales are never loaded whole.
+Two strategies:
+
+    python dfk_heroes/tuning.py --search random --trials 30
+    python dfk_heroes/tuning.py --search halving --trials 81 --eta 3
+
+Successive halving starts every configuration on a small round budget and only gives the best 1/eta of
+them eta times more rounds, until one is left or the full budget is reached. All trials are written to
+data/tuning_results.csv and the best configuration to data/best_params.json, which training uses when asked:
+
+    python dfk_heroes/model.py --params dfk_heroes/data/best_params.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+
+import dataset
+import model
+from inference import DateFeaturesExtractor, ClassRankExtractor, ToCategory
+
+RESULTS_PATH = os.path.join(Path(__file__).parent, 'data/tuning_results.csv')
+
+EARLY_STOPPING_ROUNDS = model.EARLY_STOPPING_ROUNDS
+MAX_ROUNDS = 2_000
+MIN_ROUNDS = 100
+
+# name: (distribution, low, high)
+SEARCH_SPACE = {
+    'learning_rate': ('log', 0.01, 0.2),
+    'num_leaves': ('int', 7, 127),
+    'min_data_in_leaf': ('int', 5, 100),
+    'feature_fraction': ('float', 0.5, 1.0),
+    'bagging_fraction': ('float', 0.5, 1.0),
+    'lambda_l1': ('log', 1e-3, 10.0),
+    'lambda_l2': ('log', 1e-3, 10.0),
+    'cat_smooth': ('log', 1.0, 100.0),
+    'min_data_per_group': ('int', 10, 200),
+}
+
+_data = None
+
+
+def sample_params(rng, space=SEARCH_SPACE):
+    params = {}
+    for name, (distribution, low, high) in space.items():
+        if distribution == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        elif distribution == 'int':
+            params[name] = int(rng.integers(low, high + 1))
+        else:
+            params[name] = float(rng.uniform(low, high))
+    if params['bagging_fraction'] < 1.0:
+        params['bagging_freq'] = 1
+    return params
+
+
+def _init_worker(data):
+    global _data
+    transformers, train_rows, valid_rows = data
+    train_set = training_dataset(transformers, train_rows)
+    _data = train_set, dataset.out_of_core_dataset(transformers, rows=valid_rows, reference=train_set)
+
+
+def training_dataset(transformers, train_rows):
+    """The binned training split, built on the first call for given rows and reloaded after that."""
+    return dataset.out_of_core_dataset(transformers, rows=train_rows)
+
+
+def run_trial(trial, params, num_boost_round, threads):
+    """Fits one configuration for at most num_boost_round rounds and scores it on the validation split."""
+    train_set, valid_set = _data
+    # the round budget and early stopping are lgb.train arguments here, not parameters
+    train_params = {k: v for k, v in {**model.HYPER_PARAMETER, **params}.items()
+                    if k not in ('num_boost_round', 'early_stopping_rounds', 'verbose_eval')}
+    start = time.perf_counter()
+    booster = lgb.train({**train_params, 'metric': 'l1', 'num_threads': threads, 'verbose': -1}, train_set,
+                        num_boost_round, valid_sets=[valid_set],
+                        callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+    return {
+        'trial': trial,
+        'num_boost_round': num_boost_round,
+        'best_iteration': booster.best_iteration,
+        'valid_l1': booster.best_score['valid_0']['l1'],
+        'seconds': time.perf_counter() - start,
+        **params,
+    }
+
+
+def random_search(executor, configs, threads):
+    return list(executor.map(run_trial, range(len(configs)), configs, [MAX_ROUNDS] * len(configs),
+                             [threads] * len(configs)))
+
+
+def successive_halving(executor, configs, threads, eta=3):
+    results = []
+    trials = list(range(len(configs)))
+    budget = MIN_ROUNDS
+    while True:
+        rung = list(executor.map(run_trial, trials, [configs[t] for t in trials], [budget] * len(trials),
+                                 [threads] * len(trials)))
+        results += rung
+        if len(trials) == 1 or budget == MAX_ROUNDS:
+            return results
+        survivors = sorted(rung, key=lambda r: r['valid_l1'])[:max(1, len(trials) // eta)]
+        trials = [r['trial'] for r in survivors]
+        budget = min(budget * eta, MAX_ROUNDS)
+
+
+def load_data(valid_size=0.2):
+    """The transformers of the features, and the training split of model.py's __main__ split again into
+    train and validation, as sorted row positions in the store.
+
+    Only the prices are loaded: the splits are those of the same calls on the frame of every sale.
+    """
+    store_path = dataset.update_store()
+    # remove_outlier only looks at the price: the index of what it keeps are positions in the store
+    kept = model.remove_outlier(dataset.load(store_path, ['soldPrice'])).index.to_numpy()
+    train_rows, _ = train_test_split(kept, test_size=0.2, random_state=42)
+    train_rows, valid_rows = train_test_split(train_rows, test_size=valid_size, random_state=0)
+
+    # the transformers only learn the columns and their types
+    transformers = make_pipeline(DateFeaturesExtractor(), ClassRankExtractor(), ToCategory())
+    transformers.fit(dataset.head(store_path).drop(columns=['soldPrice']))
+    return transformers, np.sort(train_rows), np.sort(valid_rows)
+
+
+def tune(search='halving', n_trials=27, eta=3, workers=None, threads_per_worker=1, seed=0,
+         results_path=RESULTS_PATH, best_params_path=model.BEST_PARAMS_PATH):
+    """Runs the search, writes the results table and the best parameters, and returns the best trial."""
+    # one LightGBM thread per core overall: more would only make the trials fight for the CPU
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    rng = np.random.default_rng(seed)
+    configs = [sample_params(rng) for _ in range(n_trials)]
+
+    start = time.perf_counter()
+    data = load_data()
+    # bin once here, so the workers all find the binary Dataset in the cache
+    training_dataset(data[0], data[1])
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(data,)) as executor:
+        if search == 'random':
+            results = random_search(executor, configs, threads_per_worker)
+        else:
+            results = successive_halving(executor, configs, threads_per_worker, eta)
+
+    table = pd.DataFrame(results).sort_values(['num_boost_round', 'valid_l1'], ascending=[False, True])
+    table.to_csv(results_path, index=False)
+    best = table.iloc[0]
+    with open(best_params_path, 'w') as f:
+        json.dump({
+            'search': search,
+            'valid_l1': float(best['valid_l1']),
+            'best_iteration': int(best['best_iteration']),
+            'params': {
+                **configs[int(best['trial'])],
+                'metric': 'l1',
+                'num_boost_round': MAX_ROUNDS,
+                'early_stopping_rounds': EARLY_STOPPING_ROUNDS,
+            },
+        }, f, indent=2)
+    print(f'{len(results)} fits of {n_trials} configurations in {time.perf_counter() - start:.1f}s '
+          f'on {workers} workers x {threads_per_worker} threads; best validation MAE {best["valid_l1"]:.3f} '
+          f'after {int(best["best_iteration"])} rounds')
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Search hyperparameters for the hero price model.')
+    parser.add_argument('--search', choices=['halving', 'random'], default='halving')
+    parser.add_argument('--trials', type=int, default=27, help='configurations sampled')
+    parser.add_argument('--eta', type=int, default=3, help='successive halving keeps 1/eta of the configurations per rung')
+    parser.add_argument('--workers', type=int, default=None, help='default: CPUs // threads per worker')
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tune(args.search, args.trials, args.eta, args.workers, args.threads_per_worker, args.seed)
@@ -5,6 +5,7 @@ import datetime
 from pytz import timezone
 
 TZ = timezone('EST')
+RPC_ADDRESS = 'https://api.harmony.one/'
 
 def get_dataset_description():
     return """
@@ -61,9 +62,28 @@ def get_futures_evolutions():
     - Card display for hero
     """    
     
-def hero_to_feature(hero_id, rpc='https://api.harmony.one/'):
-    h = hero.get_hero(hero_id, rpc)
-    h = hero.human_readable_hero(h)
+def hero_to_feature(hero_id, rpc=RPC_ADDRESS, cache=None):
+    """Fetch a hero and build its feature row. Pass a hero.cache.HeroCache as cache to avoid repeated RPC calls."""
+    return pd.DataFrame.from_records([hero_to_record(hero_id, rpc, cache)])
+
+
+def hero_to_record(hero_id, rpc=RPC_ADDRESS, cache=None):
+    """hero_to_feature as a plain dict, for inference.RowPredictor."""
+    h = hero.get_hero(hero_id, rpc) if cache is None else cache.get_hero(hero_id)
+    return raw_hero_to_record(hero_id, h)
+
+
+async def async_hero_to_feature(hero_id, rpc=RPC_ADDRESS, client=None):
+    """Async hero_to_feature. Pass an open hero.AsyncHeroClient as client to share its connection pool and concurrency limit."""
+    return raw_hero_to_feature(hero_id, await hero.async_get_hero(hero_id, rpc, client=client))
+
+
+def raw_hero_to_feature(hero_id, raw_hero):
+    return pd.DataFrame.from_records([raw_hero_to_record(hero_id, raw_hero)])
+
+
+def raw_hero_to_record(hero_id, raw_hero):
+    h = hero.human_readable_hero(raw_hero)
     mapping = {
         'strength' : 'STR',
         'agility': 'AGI',
@@ -79,7 +99,7 @@ def hero_to_feature(hero_id, rpc='https://api.harmony.one/'):
     if remaining_summons < 0:
         remaining_summons = h['summoningInfo']['maxSummons']
         
-    return pd.DataFrame.from_records([{
+    return {
                 'id': hero_id,
                 'rarity': h['info']['rarity'],
                 'generation': h['info']['generation'] ,
@@ -91,19 +111,39 @@ def hero_to_feature(hero_id, rpc='https://api.harmony.one/'):
                 'summons': remaining_summons,
                 'maxSummons': h['summoningInfo']['maxSummons'],
                 'timeStamp': datetime.datetime.now(TZ).strftime("%Y-%m-%d %H:%M:%S")
-    }])
+    }
     
+# a hero built locally, to exercise the model without fetching one
+SYNTHETIC_RECORD = {
+    'id': 1,
+    'rarity': 'common',
+    'generation': 1,
+    'mainClass': 'Warrior',
+    'subClass': 'Knight',
+    'statBoost1': 'STR',
+    'statBoost2': 'END',
+    'profession': 'mining',
+    'summons': 5,
+    'maxSummons': 10,
+    'timeStamp': '2022-01-24 12:00:00',
+}
+
+WEEKDAYS = {
+    0 : 'Monday',
+    1 : 'Tuesday',
+    2 : 'Wednesday',
+    3 : 'Thursday',
+    4 : 'Friday',
+    5 : 'Saturday',
+    6 : 'Sunday'
+}
+
 def hero_to_display(feature):
-    mapping = {
-        0 : 'Monday',
-        1 : 'Tuesday',
-        2 : 'Wednesday',
-        3 : 'Thursday',
-        4 : 'Friday',
-        5 : 'Saturday',
-        6 : 'Sunday'
-    }
-    return feature.assign(buyWeekDay = lambda X: X['buyWeekDay'].map(mapping)).to_dict('records')[0]
+    return features_to_display(feature.to_dict('records')[0])
+
+def features_to_display(features):
+    """hero_to_display for the model inputs dict of inference.RowPredictor.features."""
+    return {k: WEEKDAYS.get(v) if k == 'buyWeekDay' else v for k, v in features.items()}
 
 def above_below(total, threshold):
     if total>threshold:
@@ -118,45 +158,68 @@ def plus_minus(val, extra_text=" JEWEL"):
         clz = "red"
     return f'<code class={clz}>{val:.2f}{extra_text}</code>'
 
-def explain(df, top_n):
+def rank_impacts(impacts, names):
+    """Feature order of the explanation: by decreasing absolute impact, ties broken by feature name."""
+    by_name = np.argsort(names, kind='stable')
+    return by_name[np.argsort(-np.abs(impacts[by_name]), kind='stable')]
+
+def explain(names, values, impacts, top_n):
     tx = []
-    for index, row in df.head(top_n).iterrows():
-        tx.append(f"<li>{index} = {row['feature']}  =>  {plus_minus(row['impact'])}</li>")
-    tx.append(f"<li>other features  => {plus_minus(df.iloc[top_n:]['impact'].sum())}</li>")
+    for name, value, impact in zip(names[:top_n], values[:top_n], impacts[:top_n]):
+        tx.append(f"<li>{name} = {value}  =>  {plus_minus(impact)}</li>")
+    tx.append(f"<li>other features  => {plus_minus(impacts[top_n:].sum())}</li>")
     return '\n'.join(tx)
 
-def equation(df, top_n, total, avg_price):
+def equation(impacts, top_n, total, avg_price):
     tx = [
         f"<code class=white>{avg_price:.2f} +</code>"
     ]
-    for index, row in df.head(top_n).iterrows():
-        tx.append(f"{plus_minus(row['impact'], extra_text='')} +")
-    tx.append(f"{plus_minus(df.iloc[top_n:]['impact'].sum(), extra_text='')} = {total:.2f} JEWEL")
+    for impact in impacts[:top_n]:
+        tx.append(f"{plus_minus(impact, extra_text='')} +")
+    tx.append(f"{plus_minus(impacts[top_n:].sum(), extra_text='')} = {total:.2f} JEWEL")
     return '\n'.join(tx)
 
+def listing_windows_to_text(best, worst):
+    """The best and worst sale slots of sale_timing.listing_windows, with the weekday's and the hour's grid averages."""
+    def items(windows):
+        return '\n'.join(f"<li>{w.weekday} {w.hour:02d}:00 EST  =>  {w.price:.2f} JEWEL, {plus_minus(w.vs_average)} vs. any time "
+                         f"(average on {w.weekday} {plus_minus(w.weekday_vs_average)}, at {w.hour:02d}:00 {plus_minus(w.hour_vs_average)})</li>"
+                         for w in windows.itertuples())
+    return f"""
+        <p>Best times to list this hero:</p>
+        <ul>
+            {items(best)}
+        </ul>
+        <p>Worst times to list it:</p>
+        <ul>
+            {items(worst)}
+        </ul>
+    """
+
 def shap_to_text(shap_values, feature, avg_price, jewel, top_n = 3):
-    shap_df = (pd.DataFrame(shap_values, columns = feature.columns)
-               .T
-               .rename(columns={0 : 'impact'})
-               .sort_index()
-               .merge(feature.T.rename(columns={0 : 'feature'}), right_index=True, left_index=True)
-               .assign(abs_val = lambda X: np.abs(X['impact']))
-               .sort_values('abs_val', ascending=False)[['feature', 'impact']]
-               )
-    total = shap_values.sum()+avg_price
+    return shap_row_to_text(shap_values[0], feature.columns.tolist(), feature.iloc[0].tolist(), avg_price, jewel, top_n)
+
+def shap_row_to_text(impacts, names, values, avg_price, jewel, top_n = 3):
+    """shap_to_text from plain sequences: one SHAP value, feature name and feature value per model input."""
+    impacts = np.asarray(impacts, dtype=float)
+    order = rank_impacts(impacts, np.asarray(names))
+    names = [names[i] for i in order]
+    values = [values[i] for i in order]
+    impacts = impacts[order]
+    total = impacts.sum()+avg_price
     return f"""
         <div style="clear: right;>
         <p style="float: right;font-size : 1.3rem !important">The predicted price is {total:.2f}<img src="data:image/png;base64,{jewel}" width=32 height=32></p
         <p>It is {above_below(total, avg_price)} the average hero price ({avg_price:.2f} JEWEL)</p>
         <p>This can be explained by:</p>
         <ul>
-            {explain(shap_df, top_n)}
+            {explain(names, values, impacts, top_n)}
         <ul>
         <p>Thus, the total predicted value can be computed as follow:</p>
         <p>
-            {equation(shap_df, top_n, total, avg_price)}
+            {equation(impacts, top_n, total, avg_price)}
         <p>
         </br>
         <p>The plot below explain this prediction in details:</p>
         </div>
-    """
\ No newline at end of file
+    """